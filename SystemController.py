@@ -4,16 +4,36 @@
 # -- Purpose    : Creates the GUI of the application. With this GUI the user can control the mBit Robot by sending
 # --              movement commands (with various ways) and also turn on and off the platform lights (traffic and led).
 # --              The commands are sent through the serial port utilizing a second mBit as a transmitter.
-# --              The platform lights are switch on/off by invoking/killing processes using the python files
-# --              "traffic_lights.py"/"traffic_lights_off.py" and "lights.py"/"lights_off.py".
+# --              The serial port is written by a background thread ("serial_transport.py"), so the GUI never
+# --              blocks on it; the queue depth and the write latency are shown at the bottom of the window.
+# --              In './settings/link_protocol.dat' the acknowledged protocol of "link_protocol.py" can be selected
+# --              instead of the plain frames.
+# --              Every command and light action is traced by "telemetry.py", shown in the tab 'Διαγνωστικά',
+# --              and recorded in the journal of "session_journal.py" ('./logs/journal/'), which can replay it.
+# --              The platform lights are switch on/off by sending commands to the lights daemon
+# --              "lights_daemon.py", which is started once and owns the GPIO pins (see "lights_client.py").
 # -- Notes      : The serial cable with the transmitter mBit must be connected to the system prior of the
 # --              execution, or errors will be generated.
+# --              The port and the OS can also be given with the environment variables SC_PORT and SC_OS
+# --              ('raspberry' or 'windows'), e.g. for an autostart, and then the first window is skipped.
 # --              The lights of the platform (traffic and led) can be controlled only if the execution is
 # --              on the Raspberry Pi used for the control of the lights.
 # --              This script can be used also in Windows just for transmitting the command to the mBit Robot.
 # --              The step size of the Robot can be set in the tab 'Συντελεστές κίνησης'.
+# --              Only the first tab is built at the start, the others the first time that they are selected, and
+# --              the scaled images of the buttons are kept in './images/cache/' (see "image_cache.py").
 # --              In the first window that opens prior the execution of the application, the user must enter
-# --              the correct serial communication port and select the appropriate OS.
+# --              the correct serial communication port and select the appropriate OS. The port of a connected
+# --              transmitter is found and filled in by "port_discovery.py". When the cable is unplugged, the
+# --              serial transport opens the port again as soon as it is back, without losing the queued commands.
+# --              When the traffic lights cycle, the moves of the tab 'Πρόγραμμα' are held back so that the
+# --              robot reaches every crossing on green (see "green_wave.py").
+# --              The tab 'Φανάρια και Φώτα' shows the phase of the traffic lights, read from the shared
+# --              memory where the lights daemon publishes it (see "light_state.py").
+# --              With several transmitters listed in './settings/transmitters.dat', each robot is driven through
+# --              its own port and the robot of the tabs is selected below the tabs (see "transmitter_pool.py").
+# --              Then the tab 'Πρόγραμμα' also plans the routes of all the robots so that they never collide and
+# --              sends them to all the robots at the same time (see "cooperative_planner.py").
 # --------------------------------------------------------------------------------------------------------------
 # -- Author     : Ioannis Stamoulias  <istamoulias@gmail.com>
 # -- Created    : 2021-05-11
@@ -26,15 +46,35 @@
 # -- Copyright (c) 2021
 # --------------------------------------------------------------------------------------------------------------
 
-# import sys  # Used during debug for starting processes in Windows OS
+import math
 import os
 import signal
+import sys
+import threading
 from tkinter import *
 import tkinter.messagebox
 import tkinter as tk
 from tkinter import ttk
 import serial
-from subprocess import Popen
+from lights_client import LightsClient
+from robot_commands import encode_command
+from serial_transport import SerialTransport
+from link_protocol import AckedLink, read_protocol_setting
+from key_coalescer import KeyCoalescer
+from program_runner import ProgramRunner
+from cooperative_planner import CooperativePlanner
+from platform_map import RoutePlanner, load_map, parse_heading, route_to_moves
+from program_optimizer import optimize
+from rule_validator import RuleIndex, stop_ends, validate
+from pose_tracker import PoseTracker
+from image_cache import scaled_image
+from port_discovery import discover, make_reconnect
+from transmitter_pool import TransmitterPool, open_pool, read_transmitters
+from telemetry import Telemetry, format_event
+from session_journal import SessionJournal
+from traffic_scheduler import load_intersections
+from green_wave import GreenWave, read_elapsed
+from light_state import LightStateReader
 
 # Variables used as temp for the processes and the sizes of the steps
 tr_poc_run = 0
@@ -69,16 +109,29 @@ def windows_os():  # When Windows OS is selected
     var.set(1)
 
 
+def fill_found_port():  # Fills in the port found by "port_discovery.py", when the search in the background ends
+    if discovery.is_alive():
+        win.after(100, fill_found_port)
+        return
+    if found_ports and os.name in ('posix', 'nt'):
+        txt_found, default_port = (txt_rasp, '/dev/ttyACM0') if os.name == 'posix' else (txt_win, 'COM8')
+        if txt_found.get() == default_port:  # Not changed by the user in the meantime
+            txt_found.delete(0, END)
+            txt_found.insert(0, found_ports[0])
+
+
 # Creates the first window for selecting the OS
 SelectOSserial = False
+if os.environ.get('SC_PORT'):  # Given by the environment, no need for the first window
+    os_used = os.environ['SC_PORT']
+    os_select = 1 if os.environ.get('SC_OS') == 'windows' else 0
+    SelectOSserial = True
 if not SelectOSserial:
     SelectOSserial = True
     win = tk.Tk()
     win.title("Επιλογή Λειτουργικού")
-    rasp_img = PhotoImage(file='./images/Raspberry.png')
-    rasp_img2 = rasp_img.subsample(2, 2)
-    win_img = PhotoImage(file='./images/Windows.png')
-    win_img2 = win_img.subsample(2, 2)
+    rasp_img2 = scaled_image('./images/Raspberry.png', 2)
+    win_img2 = scaled_image('./images/Windows.png', 2)
     var = tk.IntVar()
     empty_start = Label(win, text="   ", font=("Arial Bold", 12))
     empty_start.grid(column=0, row=0)
@@ -98,23 +151,70 @@ if not SelectOSserial:
     txt_win.grid(column=3, row=3)
     empty_row2 = Label(win, text="   ", font=("Arial Bold", 12))
     empty_row2.grid(column=4, row=4)
+    # The ports are searched in a thread, so that the window does not wait for the handshakes
+    found_ports = []
+    discovery = threading.Thread(target=lambda: found_ports.extend(discover(timeout=0.5)), daemon=True)
+    discovery.start()
+    win.after(100, fill_found_port)
     win.wait_variable(var)
     win.destroy()
 
-# Creates and opens the serial link for sending commands through the mBit transmitter
-try:
-    global serialPort
-    serialPort = serial.Serial(port=os_used, baudrate=115200, bytesize=8,
-                               parity=serial.PARITY_NONE, timeout=2,
-                               stopbits=serial.STOPBITS_ONE)
-except serial.serialutil.SerialException:
-    tkinter.messagebox.showinfo("Πρόβλημα στην συνδεσμολογία", "Δεν είναι συνδεδεμένο το mBit για την αποστολή εντολών")
-    # print("Δεν είναι συνδεδεμένο το mBit για την αποστολή εντολών")
-    sys.exit(0)
+# Trace of the commands and the light actions, always on (see "telemetry.py")
+telemetry = Telemetry()
+# With several transmitters in './settings/transmitters.dat' every robot has its own port (see "transmitter_pool.py")
+transmitters = read_transmitters()
+if len(transmitters) > 1:
+    try:
+        transport = open_pool(transmitters, read_protocol_setting() == 'acked', telemetry)
+    except serial.serialutil.SerialException as error:
+        tkinter.messagebox.showinfo("Πρόβλημα στην συνδεσμολογία", "Δεν είναι συνδεδεμένα όλα τα mBit για την "
+                                    "αποστολή εντολών (" + str(error) + ")")
+        sys.exit(0)
+else:  # Creates and opens the serial link for sending commands through the mBit transmitter
+    try:
+        global serialPort
+        serialPort = serial.Serial(port=os_used, baudrate=115200, bytesize=8,
+                                   parity=serial.PARITY_NONE, timeout=2,
+                                   stopbits=serial.STOPBITS_ONE)
+    except serial.serialutil.SerialException:
+        found_ports = discover(timeout=0.5)  # The transmitter may be on another port
+        serialPort = None
+        if found_ports:
+            os_used = found_ports[0]
+            try:
+                serialPort = serial.Serial(port=os_used, baudrate=115200, bytesize=8,
+                                           parity=serial.PARITY_NONE, timeout=2,
+                                           stopbits=serial.STOPBITS_ONE)
+            except serial.serialutil.SerialException:  # E.g. the port is busy or the transmitter left again
+                serialPort = None
+        if serialPort is None:
+            tkinter.messagebox.showinfo("Πρόβλημα στην συνδεσμολογία", "Δεν είναι συνδεδεμένο το mBit για την αποστολή εντολών")
+            # print("Δεν είναι συνδεδεμένο το mBit για την αποστολή εντολών")
+            sys.exit(0)
+
+    if serialPort.isOpen():
+        serialPort.close()
+    serialPort.open()
+    # The acknowledged protocol needs a transmitter firmware that supports it (see "link_protocol.py"),
+    # the plain frames work with every firmware
+    # After an unplugged cable the port is opened again (or the port where the transmitter appeared)
+    if read_protocol_setting() == 'acked':
+        transport = AckedLink(serialPort, telemetry=telemetry, reconnect=make_reconnect(os_used))
+    else:
+        transport = SerialTransport(serialPort, telemetry=telemetry, reconnect=make_reconnect(os_used))
+
+# Connects to the lights daemon, starting it once if the selected OS is Raspberry
+lights = LightsClient(telemetry=telemetry)
 
-if serialPort.isOpen():
-    serialPort.close()
-serialPort.open()
+# Records the frames that go out and the light commands (see "session_journal.py")
+journal = SessionJournal()
+if isinstance(transport, TransmitterPool):  # The frames of every robot, not only of the selected one
+    transport.frame_listeners.append(journal.record_robot_frame)
+else:
+    transport.listeners.append(journal.record_frame)
+lights.listeners.append(journal.record_lights)
+if os_select == 0:
+    lights.ensure_daemon()
 
 # Creates the main window of the application
 window = tk.Tk()
@@ -122,6 +222,19 @@ window.title("Άκη Ρομποτάκι σε αγαπάμε…")
 # window.geometry('720x480')  # We avoid to have a fixed size, so it set it based on the content
 tabControl = ttk.Notebook(window, takefocus=NO)
 window.configure(background='black')
+# Merges the repeated presses of the arrows into fewer commands (see "key_coalescer.py")
+coalescer = KeyCoalescer(transport, window, telemetry=telemetry)
+# Only the first tab is built before the window appears, every other tab the first time that it is selected
+tab_builders = {}  # Name of the frame of the tab: function that creates its widgets
+
+
+def build_selected_tab(event):
+    build = tab_builders.pop(str(tabControl.select()), None)
+    if build is not None:
+        build()
+
+
+tabControl.bind('<<NotebookTabChanged>>', build_selected_tab)
 # --------------------------------------------------------------------------------------------------------------
 # Code for the first tab (type of movement and number of steps)
 
@@ -151,9 +264,8 @@ def clicked():  # Stores and transmits the user's values through the serial port
         tkinter.messagebox.showinfo('Μη έγκυρη τιμή', 'Στο πεδίο \"Βήματα\" πρέπει να δώσετε αριθμό')
     else:
         # Prepares and sends the command through the serial port
-        serial_string = slct_vl + str(factored_box_value) + "\r\n"
         if tabControl.tab(tabControl.select(), "text") == 'Εφαρμογή':
-            serialPort.write(serial_string.encode())
+            transport.send(encode_command(slct_vl, factored_box_value))
 
 
 tab1 = ttk.Frame(tabControl, takefocus=NO)
@@ -221,36 +333,29 @@ def key(event):  # Reads key presses and prepares and sends the movement command
         if event.keysym == 'Up':
             slct_vl = 'F'
             box_value = fb_txt_value
-            serial_string = slct_vl + box_value + "\r\n"
-            serialPort.write(serial_string.encode())
+            coalescer.press(slct_vl, box_value)
         elif event.keysym == 'Down':
             slct_vl = 'B'
             box_value = fb_txt_value
-            serial_string = slct_vl + box_value + "\r\n"
-            serialPort.write(serial_string.encode())
+            coalescer.press(slct_vl, box_value)
         elif event.keysym == 'Left':
             slct_vl = 'L'
             box_value = lr_txt_value
-            serial_string = slct_vl + box_value + "\r\n"
-            serialPort.write(serial_string.encode())
+            coalescer.press(slct_vl, box_value)
         elif event.keysym == 'Right':
             slct_vl = 'R'
             box_value = lr_txt_value
-            serial_string = slct_vl + box_value + "\r\n"
-            serialPort.write(serial_string.encode())
+            coalescer.press(slct_vl, box_value)
         elif event.keysym == 'Escape':
             tab1.destroy()
             tab2.destroy()
             if os_select == 0:
                 tab3.destroy()
             tab4.destroy()
-            serialPort.close()
-            if tr_poc_run == 1:
-                os.kill(traffic_pid, 9)
-            if lg_poc_run == 1:
-                os.kill(light_pid, 9)
-            Popen(['python3', './scripts/traffic_lights_off.py'])
-            Popen(['python3', './scripts/lights_off.py'])
+            program_abort()
+            transport.close()
+            journal.close()
+            lights.shutdown()  # Turn off all lights
             window.destroy()
             # print('ΤΕΛΟΣ')
         else:
@@ -262,80 +367,425 @@ def key(event):  # Reads key presses and prepares and sends the movement command
             if os_select == 0:
                 tab3.destroy()
             tab4.destroy()
-            serialPort.close()
-            if tr_poc_run == 1:
-                os.kill(traffic_pid, 9)
-            if lg_poc_run == 1:
-                os.kill(light_pid, 9)
-            Popen(['python3', './scripts/traffic_lights_off.py'])
-            Popen(['python3', './scripts/lights_off.py'])
+            program_abort()
+            transport.close()
+            journal.close()
+            lights.shutdown()  # Turn off all lights
             window.destroy()
             # print('ΤΕΛΟΣ')
 
 
+def key_release(event):  # Cancels the movement that was not sent yet when an arrow key is released
+    directions = {'Up': 'F', 'Down': 'B', 'Left': 'L', 'Right': 'R'}
+    # Only on the tab of key(), the arrows of the other tabs move the cursor of their fields
+    if tabControl.tab(tabControl.select(), "text") == 'Πληκτρολόγιο' and event.keysym in directions:
+        coalescer.release(directions[event.keysym])
+
+
 def press_up():  # Reads the press of the up GUI button and sends the movement commands
     slct_vl = 'F'
     box_value = fb_txt_value
-    serial_string = slct_vl + box_value + "\r\n"
-    serialPort.write(serial_string.encode())
+    coalescer.press(slct_vl, box_value, held=False)
 
 
 def press_left():  # Reads the press of the left GUI button and sends the movement commands
     slct_vl = 'L'
     box_value = lr_txt_value
-    serial_string = slct_vl + box_value + "\r\n"
-    serialPort.write(serial_string.encode())
+    coalescer.press(slct_vl, box_value, held=False)
 
 
 def press_right():  # Reads the press of the right GUI button and sends the movement commands
     slct_vl = 'R'
     box_value = lr_txt_value
-    serial_string = slct_vl + box_value + "\r\n"
-    serialPort.write(serial_string.encode())
+    coalescer.press(slct_vl, box_value, held=False)
 
 
 def press_down():  # Reads the press of the down GUI button and sends the movement commands
     slct_vl = 'B'
     box_value = fb_txt_value
-    serial_string = slct_vl + box_value + "\r\n"
-    serialPort.write(serial_string.encode())
+    coalescer.press(slct_vl, box_value, held=False)
+
+
+def build_tab2():  # The arrow buttons, the images come from the cache of "image_cache.py"
+    global arrow_up, arrow_left, arrow_right, arrow_down
+    lb7_empty = Label(tab2, text="   ", fg="cyan4", font=("Arial Bold", 24))
+    lb7_empty.grid(column=0, row=0)
+    lb7 = Label(tab2, text="Χρησιμοποίησε τα χρωματιστά βελάκια", fg="SeaGreen3", font=("Arial Bold", 12))
+    lb7.focus_force()
+    lb7.grid(column=4, row=1)
+    lb7_0 = Label(tab2, text="ή τα βελάκια στο πληκτρολόγιο", fg="cadet blue", font=("Arial Bold", 12))
+    lb7_0.grid(column=4, row=2)
+    arrow_empty = Label(tab2, text="   ", fg="cyan4", font=("Arial Bold", 12))
+    arrow_empty.grid(column=0, row=3)
+    arrow_up = scaled_image('./images/Arrow_up.png', 3)
+    btn_arup = Button(tab2, image=arrow_up, command=press_up)
+    btn_arup.grid(column=2, row=4)
+    arrow_left = scaled_image('./images/Arrow_left.png', 3)
+    btn_arleft = Button(tab2, image=arrow_left, command=press_left)
+    btn_arleft.grid(column=1, row=5)
+    arrow_right = scaled_image('./images/Arrow_right.png', 3)
+    btn_arright = Button(tab2, image=arrow_right, command=press_right)
+    btn_arright.grid(column=3, row=5)
+    arrow_down = scaled_image('./images/Arrow_down.png', 3)
+    btn_ardown = Button(tab2, image=arrow_down, command=press_down)
+    btn_ardown.grid(column=2, row=6)
+    arrow2_empty = Label(tab2, text="   ", fg="cyan4", font=("Arial Bold", 12))
+    arrow2_empty.grid(column=0, row=7)
+    lb7_1 = Label(tab2, text="και όταν θελήσεις να φύγεις,", fg="pale violet red", font=("Arial Bold", 12))
+    lb7_1.grid(column=4, row=8)
+    lb7_1 = Label(tab2, text="μπορείς να πατήσεις \'esc\' στο πληκτρολόγιο", fg="SteelBlue2", font=("Arial Bold", 12))
+    lb7_1.grid(column=4, row=9)
+    lb7_1 = Label(tab2, text="ή το 'Χ' στο παράθυρο", fg="hot pink", font=("Arial Bold", 12))
+    lb7_1.grid(column=4, row=10)
 
 
 tab2 = ttk.Frame(tabControl, takefocus=NO)
 tabControl.add(tab2, text='Πληκτρολόγιο')
-lb7_empty = Label(tab2, text="   ", fg="cyan4", font=("Arial Bold", 24))
-lb7_empty.grid(column=0, row=0)
-lb7 = Label(tab2, text="Χρησιμοποίησε τα χρωματιστά βελάκια", fg="SeaGreen3", font=("Arial Bold", 12))
-lb7.focus_force()
-lb7.grid(column=4, row=1)
-lb7_0 = Label(tab2, text="ή τα βελάκια στο πληκτρολόγιο", fg="cadet blue", font=("Arial Bold", 12))
-lb7_0.grid(column=4, row=2)
-arrow_empty = Label(tab2, text="   ", fg="cyan4", font=("Arial Bold", 12))
-arrow_empty.grid(column=0, row=3)
-arrow_up_img = PhotoImage(file='./images/Arrow_up.png')
-arrow_up = arrow_up_img.subsample(3, 3)
-btn_arup = Button(tab2, image=arrow_up, command=press_up)
-btn_arup.grid(column=2, row=4)
-arrow_left_img = PhotoImage(file='./images/Arrow_left.png')
-arrow_left = arrow_left_img.subsample(3, 3)
-btn_arleft = Button(tab2, image=arrow_left, command=press_left)
-btn_arleft.grid(column=1, row=5)
-arrow_right_img = PhotoImage(file='./images/Arrow_right.png')
-arrow_right = arrow_right_img.subsample(3, 3)
-btn_arright = Button(tab2, image=arrow_right, command=press_right)
-btn_arright.grid(column=3, row=5)
-arrow_down_img = PhotoImage(file='./images/Arrow_down.png')
-arrow_down = arrow_down_img.subsample(3, 3)
-btn_ardown = Button(tab2, image=arrow_down, command=press_down)
-btn_ardown.grid(column=2, row=6)
-arrow2_empty = Label(tab2, text="   ", fg="cyan4", font=("Arial Bold", 12))
-arrow2_empty.grid(column=0, row=7)
-lb7_1 = Label(tab2, text="και όταν θελήσεις να φύγεις,", fg="pale violet red", font=("Arial Bold", 12))
-lb7_1.grid(column=4, row=8)
-lb7_1 = Label(tab2, text="μπορείς να πατήσεις \'esc\' στο πληκτρολόγιο", fg="SteelBlue2", font=("Arial Bold", 12))
-lb7_1.grid(column=4, row=9)
-lb7_1 = Label(tab2, text="ή το 'Χ' στο παράθυρο", fg="hot pink", font=("Arial Bold", 12))
-lb7_1.grid(column=4, row=10)
+tab_builders[str(tab2)] = build_tab2
+# --------------------------------------------------------------------------------------------------------------
+# Code for the program tab (a whole route is built as a list of moves and sent with one upload)
+# The moves are paced to the execution rate of the robot by "program_runner.py"
+move_names = {'F': 'Μπροστά', 'B': 'Πίσω', 'L': 'Αριστερά', 'R': 'Δεξιά'}
+program_moves = []  # (direction, number of steps) as entered by the user, the factors are applied when sending
+
+
+def program_add():  # Adds the selected move at the end of the program
+    box_value = txt_program.get()
+    if not box_value.isnumeric():
+        tkinter.messagebox.showinfo('Μη έγκυρη τιμή', 'Στο πεδίο \"Βήματα\" πρέπει να δώσετε αριθμό')
+        return
+    direction = selected_program.get()
+    program_moves.append((direction, int(box_value)))
+    lst_program.insert(END, move_names[direction] + ' ' + box_value)
+
+
+def program_remove():  # Removes the selected move from the program
+    for index in reversed(lst_program.curselection()):
+        lst_program.delete(index)
+        del program_moves[index]
+
+
+def program_clear():
+    program_abort()
+    lst_program.delete(0, END)
+    program_moves.clear()
+
+
+platform = None  # The platform map, loaded when it is first needed
+route_planner = None  # Created when the first route is requested
+rule_index = None  # Created when the first program is checked
+green_wave = None  # Created when the first program is sent
+program_rows = []  # Row of the list of every command given to the program runner, for the progress
+route_from = StringVar(value='1,1,E')  # The 'Από' and 'Προς' fields, also used by the map tab
+route_to = StringVar(value='7,9')
+
+
+def get_platform():
+    global platform
+    if platform is None:
+        platform = load_map()
+    return platform
+
+
+def read_route_start():  # Returns (row, column, heading) of the 'Από' field, or None if it is not valid
+    try:
+        start = [value.strip() for value in route_from.get().split(',')]
+        return int(start[0]), int(start[1]), parse_heading(start[2])
+    except (ValueError, IndexError):
+        tkinter.messagebox.showinfo('Μη έγκυρη τιμή', 'Δώστε \"γραμμή,στήλη,κατεύθυνση\" στο πεδίο \"Από\"')
+        return None
+
+
+def program_route():  # Replaces the program with the shortest legal route on the platform map
+    global route_planner
+    start = read_route_start()
+    if start is None:
+        return
+    try:
+        goal = [int(value) for value in route_to.get().split(',')]
+    except ValueError:
+        tkinter.messagebox.showinfo('Μη έγκυρη τιμή', 'Δώστε \"γραμμή,στήλη\" στο πεδίο \"Προς\"')
+        return
+    if route_planner is None or route_planner.fb_factor != int(fb_txt_value) or \
+            route_planner.lr_factor != int(lr_txt_value):
+        route_planner = RoutePlanner(get_platform(), fb_txt_value, lr_txt_value)
+    actions = route_planner.astar(start, goal)
+    if actions is None:
+        tkinter.messagebox.showinfo('Διαδρομή', 'Δεν υπάρχει επιτρεπτή διαδρομή')
+        return
+    program_clear()
+    signal_cells = [intersection.cell for intersection in load_intersections() if intersection.cell is not None]
+    for direction, steps in route_to_moves(actions, start, get_platform(), signal_cells):
+        program_moves.append((direction, steps))
+        lst_program.insert(END, move_names[direction] + ' ' + str(steps))
+
+
+def program_check():  # Returns the violations of the traffic rules of the program, starting from the 'Από' field
+    global rule_index
+    start = read_route_start()
+    if start is None:
+        return None
+    if rule_index is None:
+        rule_index = RuleIndex(get_platform())
+    return validate(rule_index, program_moves, start)
+
+
+def program_show_check():
+    violations = program_check()
+    if violations is None:
+        return
+    if violations:
+        tkinter.messagebox.showinfo('Κανόνες κυκλοφορίας', '\n'.join(v.message() for v in violations))
+    else:
+        tkinter.messagebox.showinfo('Κανόνες κυκλοφορίας', 'Μπράβο! Η διαδρομή τηρεί τους κανόνες.')
+
+
+def program_send():  # Sends the whole program, applying the factors of the 'Συντελεστές κίνησης' tab
+    global green_wave
+    violations = program_check()
+    if violations is None:
+        return
+    if violations and not tkinter.messagebox.askyesno('Κανόνες κυκλοφορίας', '\n'.join(
+            v.message() for v in violations) + '\n\nΝα σταλεί το πρόγραμμα;'):
+        return
+    commands = []
+    for direction, steps in program_moves:
+        if direction == 'F' or direction == 'B':
+            commands.append((direction, steps * int(fb_txt_value)))
+        else:
+            commands.append((direction, steps * int(lr_txt_value)))
+    # Merges and cancels the neighbouring moves before anything is sent, but never through a stop sign
+    commands, report = optimize(commands, lr_txt_value, keep=stop_ends(rule_index, program_moves, read_route_start()))
+    rows = report['sources']  # The optimized commands are no longer one per row
+    saved_text = "Εξοικονόμηση: " + str(report['frames_saved']) + " εντολές, " + \
+                 str(round(report['time_saved'], 1)) + " δευτ."
+    # When the traffic lights cycle, the moves are held back so that the robot finds them green
+    elapsed = read_elapsed(lights)
+    if elapsed is not None:
+        if green_wave is None or green_wave.fb_factor != int(fb_txt_value) or \
+                green_wave.lr_factor != int(lr_txt_value):
+            green_wave = GreenWave(load_intersections(), fb_txt_value, lr_txt_value)
+        commands, crossings, rows = green_wave.time_release(commands, read_route_start(), elapsed, rows)
+        if crossings:
+            saved_text += "   Αναμονή για πράσινο: " + str(round(sum(wait for name, arrival, wait in crossings), 1)) + \
+                          " δευτ."
+    lbl_program_saved.configure(text=saved_text)
+    program_rows[:] = rows
+    program_runner.start(commands)
+
+
+def program_pause():
+    if program_runner.state == 'paused':
+        program_runner.resume()
+    else:
+        program_runner.pause()
+
+
+def program_progress(sent, total, state):  # Called by the program runner after every change
+    progress_program['maximum'] = max(total, 1)
+    progress_program['value'] = sent
+    states = {'idle': 'Έτοιμο', 'running': 'Εκτέλεση', 'paused': 'Παύση'}
+    lbl_program_state.configure(text=states[state] + ' ' + str(sent) + '/' + str(total))
+    btn_program_pause.configure(text='Συνέχεια' if state == 'paused' else 'Παύση')
+    if state == 'running' and 0 < sent <= len(program_rows):  # The row of the last command sent (or waited for)
+        lst_program.selection_clear(0, END)
+        lst_program.selection_set(program_rows[sent - 1])
+
+
+robot_planner = None  # Routes of all the robots of the pool without collisions, created with the first robot route
+robot_runners = {}  # Robot: ProgramRunner of its timed route
+
+
+def program_plan_robot():  # Plans the route of the selected robot from 'Από' to 'Προς', around the other robots
+    global robot_planner
+    start = read_route_start()
+    if start is None:
+        return
+    try:
+        goal = [int(value) for value in route_to.get().split(',')]
+    except ValueError:
+        tkinter.messagebox.showinfo('Μη έγκυρη τιμή', 'Δώστε \"γραμμή,στήλη\" στο πεδίο \"Προς\"')
+        return
+    if robot_planner is None or robot_planner.fb_factor != int(fb_txt_value) or \
+            robot_planner.lr_factor != int(lr_txt_value):
+        robot_planner = CooperativePlanner(get_platform(), fb_txt_value, lr_txt_value)
+    try:
+        robot_planner.set_robot(transport.selected, start, goal)
+    except ValueError:
+        tkinter.messagebox.showinfo('Διαδρομή', 'Δεν υπάρχει διαδρομή χωρίς σύγκρουση με τα άλλα ρομπότ')
+        robot_planner.remove_robot(transport.selected)
+        try:
+            robot_planner.plan_all()  # The routes of the other robots, without this one
+        except ValueError:
+            robot_planner = None
+    robot_names = robot_planner.paths if robot_planner is not None else {}
+    lbl_program_robots.configure(text="Διαδρομές: " + ", ".join(
+        robot + " (" + str(len(path) - 1) + ")" for robot, path in robot_names.items()))
+
+
+def program_send_robots():  # Starts the timed routes of all the planned robots at the same time
+    if robot_planner is None or not robot_planner.paths:
+        tkinter.messagebox.showinfo('Διαδρομή', 'Δεν έχει σχεδιαστεί διαδρομή για κανένα ρομπότ')
+        return
+    program_abort()
+    for robot in robot_planner.paths:
+        if robot not in robot_runners:
+            robot_runners[robot] = ProgramRunner(transport.transport(robot), window)
+        robot_runners[robot].start(robot_planner.compile_timed_route(robot))
+
+
+def program_abort():  # Stops the program of the selected robot and the timed routes of all the robots
+    program_runner.abort()
+    for runner in robot_runners.values():
+        runner.abort()
+
+
+program_runner = ProgramRunner(transport, window, on_progress=program_progress)
+
+
+def build_tab_program():  # The list of moves, the route fields and the controls of the program runner
+    global selected_program, txt_program, lst_program, progress_program, lbl_program_state, lbl_program_saved
+    global btn_program_pause, lbl_program_robots
+    lb_program_empty = Label(tab_program, text="   ", fg="cyan4", font=("Arial Bold", 24))
+    lb_program_empty.grid(column=0, row=0)
+    lb_program = Label(tab_program, text="Φτιάξε τη διαδρομή του Άκη Ρομποτάκη", fg="cyan4", font=("Arial Bold", 12))
+    lb_program.grid(column=1, row=1, columnspan=4)
+    selected_program = StringVar(value='F')
+    rad_program_column = 1
+    for program_direction, program_color in (('F', "forest green"), ('B', "indian red"), ('L', "tomato"),
+                                             ('R', "slate blue")):
+        rad_program = Radiobutton(tab_program, text=move_names[program_direction], fg=program_color,
+                                  font=("Arial Bold", 12), value=program_direction, variable=selected_program)
+        rad_program.grid(column=rad_program_column, row=2)
+        rad_program_column += 1
+    lb_program_steps = Label(tab_program, text="Βήματα", fg="purple3", font=("Arial Bold", 12))
+    lb_program_steps.grid(column=1, row=3)
+    txt_program = Entry(tab_program, width=10, fg="purple3")
+    txt_program.insert(0, '1')
+    txt_program.grid(column=2, row=3)
+    btn_program_add = Button(tab_program, text="Προσθήκη", fg="forest green", command=program_add)
+    btn_program_add.grid(column=3, row=3)
+    btn_program_remove = Button(tab_program, text="Διαγραφή", fg="red", command=program_remove)
+    btn_program_remove.grid(column=4, row=3)
+    lst_program = Listbox(tab_program, height=8, fg="RoyalBlue3", font=("Arial Bold", 11), selectmode=EXTENDED)
+    lst_program.grid(column=1, row=4, columnspan=4, sticky=W+E)
+    btn_program_send = Button(tab_program, text="Αποστολή", fg="RoyalBlue3", command=program_send)
+    btn_program_send.grid(column=1, row=5)
+    btn_program_pause = Button(tab_program, text="Παύση", fg="dark orange", command=program_pause)
+    btn_program_pause.grid(column=2, row=5)
+    btn_program_abort = Button(tab_program, text="Διακοπή", fg="red", command=program_abort)
+    btn_program_abort.grid(column=3, row=5)
+    btn_program_clear = Button(tab_program, text="Καθαρισμός", fg="bisque4", command=program_clear)
+    btn_program_clear.grid(column=4, row=5)
+    progress_program = ttk.Progressbar(tab_program, orient=HORIZONTAL, mode='determinate')
+    progress_program.grid(column=1, row=6, columnspan=3, sticky=W+E)
+    lbl_program_state = Label(tab_program, text="Έτοιμο 0/0", fg="bisque4", font=("Arial Bold", 11))
+    lbl_program_state.grid(column=4, row=6)
+    lbl_program_saved = Label(tab_program, text="", fg="bisque4", font=("Arial Bold", 10))
+    lbl_program_saved.grid(column=1, row=9, columnspan=4)
+    lb_route_from = Label(tab_program, text="Από (γρ.,στ.,N/E/S/W)", fg="cyan4", font=("Arial Bold", 11))
+    lb_route_from.grid(column=1, row=7)
+    txt_route_from = Entry(tab_program, width=10, fg="cyan4", textvariable=route_from)
+    txt_route_from.grid(column=2, row=7)
+    lb_route_to = Label(tab_program, text="Προς (γρ.,στ.)", fg="maroon4", font=("Arial Bold", 11))
+    lb_route_to.grid(column=3, row=7)
+    txt_route_to = Entry(tab_program, width=10, fg="maroon4", textvariable=route_to)
+    txt_route_to.grid(column=4, row=7)
+    btn_route = Button(tab_program, text="Διαδρομή", fg="RoyalBlue3", command=program_route)
+    btn_route.grid(column=2, row=8)
+    btn_check = Button(tab_program, text="Έλεγχος", fg="forest green", command=program_show_check)
+    btn_check.grid(column=3, row=8)
+    if isinstance(transport, TransmitterPool):  # Routes of all the robots together (see "cooperative_planner.py")
+        btn_plan_robot = Button(tab_program, text="Διαδρομή ρομπότ", fg="RoyalBlue3", command=program_plan_robot)
+        btn_plan_robot.grid(column=1, row=10, columnspan=2)
+        btn_send_robots = Button(tab_program, text="Αποστολή σε όλα", fg="RoyalBlue3", command=program_send_robots)
+        btn_send_robots.grid(column=3, row=10, columnspan=2)
+        lbl_program_robots = Label(tab_program, text="", fg="bisque4", font=("Arial Bold", 10))
+        lbl_program_robots.grid(column=1, row=11, columnspan=4)
+
+
+tab_program = ttk.Frame(tabControl, takefocus=NO)
+tabControl.add(tab_program, text='Πρόγραμμα')
+tab_builders[str(tab_program)] = build_tab_program
+# --------------------------------------------------------------------------------------------------------------
+# Code for the map tab (estimated position of the robot, from the commands that were sent)
+# Only the new parts of the trail and the robot marker are redrawn, the map itself is drawn once
+cell_size = 40
+cell_colors = {'#': "gray30", '.': "gray85", '+': "gray75", '=': "white", 'S': "gray85", 'X': "gray85",
+               '^': "gray85", '>': "gray85", 'v': "gray85", '<': "gray85"}
+cell_signs = {'=': ("≡", "black"), 'S': ("STOP", "red"), 'X': ("⛔", "red"),
+              '^': ("↑", "blue"), '>': ("→", "blue"), 'v': ("↓", "blue"), '<': ("←", "blue")}
+pose_tracker = PoseTracker(fb_txt_value, lr_txt_value)
+transport.listeners.append(pose_tracker.update)
+drawn_moves = -1  # Number of moves of the tracker when the marker was last drawn
+
+
+def draw_robot():  # Moves the marker of the robot to its current pose
+    x, y, heading = pose_tracker.pose()
+    center_x = (x + 0.5) * cell_size
+    center_y = (y + 0.5) * cell_size
+    points = []
+    for angle, radius in ((0, 0.4), (140, 0.3), (220, 0.3)):
+        angle = math.radians(heading + angle)
+        points += [center_x + radius * cell_size * math.sin(angle), center_y - radius * cell_size * math.cos(angle)]
+    canvas_map.coords(robot_marker, *points)
+    canvas_map.tag_raise(robot_marker)
+
+
+def poll_pose():  # Draws the trail segments of the commands sent since the last call
+    global drawn_moves
+    segments = pose_tracker.take_segments()
+    for x0, y0, x1, y1 in segments:
+        canvas_map.create_line((x0 + 0.5) * cell_size, (y0 + 0.5) * cell_size, (x1 + 0.5) * cell_size,
+                               (y1 + 0.5) * cell_size, fill="DeepPink2", width=3, tags='trail')
+    if segments or pose_tracker.moves != drawn_moves:
+        drawn_moves = pose_tracker.moves
+        x, y, heading = pose_tracker.pose()
+        lbl_pose.configure(text="Θέση: " + str(round(y, 1)) + ", " + str(round(x, 1)) + "   Κατεύθυνση: " +
+                                str(round(heading)) + "°   Κινήσεις: " + str(pose_tracker.moves))
+        draw_robot()
+    window.after(100, poll_pose)
+
+
+def reset_pose():  # Puts the robot at the 'Από' field of the program tab and clears the trail
+    global drawn_moves
+    start = read_route_start()
+    if start is None:
+        return
+    pose_tracker.reset((start[1], start[0], start[2] * 90))
+    canvas_map.delete('trail')
+    drawn_moves = -1
+
+
+def build_tab_map():  # Draws the map once and starts redrawing the trail of the robot
+    global canvas_map, robot_marker, lbl_pose
+    try:
+        map_rows = get_platform().rows
+    except OSError:  # No map file, only the trail is drawn
+        map_rows = ['.' * 12] * 9
+    canvas_map = Canvas(tab_map, width=max(len(row) for row in map_rows) * cell_size, height=len(map_rows) * cell_size,
+                        background="gray85", highlightthickness=0)
+    canvas_map.grid(column=0, row=0, columnspan=2)
+    for map_row, row_cells in enumerate(map_rows):
+        for map_column, map_cell in enumerate(row_cells):
+            canvas_map.create_rectangle(map_column * cell_size, map_row * cell_size, (map_column + 1) * cell_size,
+                                        (map_row + 1) * cell_size, fill=cell_colors.get(map_cell, "gray85"),
+                                        outline="gray60")
+            if map_cell in cell_signs:
+                canvas_map.create_text((map_column + 0.5) * cell_size, (map_row + 0.5) * cell_size,
+                                       text=cell_signs[map_cell][0], fill=cell_signs[map_cell][1],
+                                       font=("Arial Bold", 9))
+    robot_marker = canvas_map.create_polygon(0, 0, 0, 0, 0, 0, fill="cyan4", outline="black")
+    lbl_pose = Label(tab_map, text="", fg="cyan4", font=("Arial Bold", 11))
+    lbl_pose.grid(column=0, row=1)
+    btn_pose_reset = Button(tab_map, text="Επαναφορά", fg="RoyalBlue3", command=reset_pose)
+    btn_pose_reset.grid(column=1, row=1)
+    window.after(100, poll_pose)
+
+
+tab_map = ttk.Frame(tabControl, takefocus=NO)
+tabControl.add(tab_map, text='Χάρτης')
+tab_builders[str(tab_map)] = build_tab_map
 # --------------------------------------------------------------------------------------------------------------
 # Code for the third tab (lights switches)
 
@@ -343,40 +793,59 @@ lb7_1.grid(column=4, row=10)
 def tr_clicked():  # When the traffic light check box is changed
     select_value = selected_traffic.get()
     global tr_poc_run
-    if select_value == 1:  # Creates a new process using "traffic_lights.py"
-        traffic_process = Popen(['python3', './scripts/traffic_lights.py'])
-        #traffic_process = Popen([sys.executable, "./scripts/traffic_lights.py"])
-        # Stores the PID for later use
-        global traffic_pid
-        traffic_pid = traffic_process.pid
+    if select_value == 1:  # Asks the lights daemon to start the traffic lights
+        lights.send('traffic on')
         tr_poc_run = 1
-    else:  # Kills the process with the specific PID
-        os.kill(traffic_pid, 9)
+    else:  # Asks the lights daemon to turn off the traffic lights
+        lights.send('traffic off')
         tr_poc_run = 0
-        # Turn off all lights
-        Popen(['python3', './scripts/traffic_lights_off.py'])
 
 
 def lg_clicked():  # When the led light check box is changed
     select_value = selected_led.get()
     global lg_poc_run
-    if select_value == 1:  # Creates a new process using "lights.py"
-        light_process = Popen(['python3', './scripts/lights.py'])
-        #light_process = Popen([sys.executable, "./scripts/traffic_lights.py"])
-        # Stores the PID for later use
-        global light_pid
-        light_pid = light_process.pid
+    if select_value == 1:  # Asks the lights daemon to turn on the led lights
+        lights.send('lights on')
         lg_poc_run = 1
-    else:  # Kills the process with the specific PID
-        os.kill(light_pid, 9)
+    else:  # Asks the lights daemon to turn off the led lights
+        lights.send('lights off')
         lg_poc_run = 0
-        # Turn off all lights
-        Popen(['python3', './scripts/lights_off.py'])
 
 
-if os_select == 0:  # We only create this tab, if the selected OS is Raspberry
-    tab3 = ttk.Frame(tabControl, takefocus=NO)
-    tabControl.add(tab3, text='Φανάρια και Φώτα')
+light_state = LightStateReader()  # The state that the lights daemon publishes (see "light_state.py")
+light_colors = ("red", "gold", "green3")  # The pins of every intersection are red, yellow, green, red, ...
+
+
+def poll_light_state():  # Shows the lights as the daemon sees them, read from shared memory without asking it
+    global tr_poc_run, lg_poc_run
+    if tabControl.tab(tabControl.select(), "text") != 'Φανάρια και Φώτα':
+        window.after(250, poll_light_state)
+        return
+    state = light_state.read()
+    if state is None or not state['alive']:
+        lbl_light_state.configure(text="Τα φώτα δεν λειτουργούν", fg="red")
+        pins_on = []
+        selected_traffic.set(0)
+        selected_led.set(0)
+        tr_poc_run = lg_poc_run = 0
+    else:
+        phases = ["{}: {} ({:.1f} δευτ.)".format(item['name'], item['phase'], item['time_left'])
+                  for item in state['intersections']]
+        if state['traffic_flash'] and state['traffic_on']:
+            phases = ["Κίτρινα που αναβοσβήνουν"]
+        lbl_light_state.configure(text="\n".join(phases) if state['traffic_on'] else "Σβηστοί σηματοδότες",
+                                  fg="forest green")
+        pins_on = state['pins_on']
+        selected_traffic.set(int(state['traffic_on']))
+        selected_led.set(int(state['lights_on']))
+        tr_poc_run, lg_poc_run = int(state['traffic_on']), int(state['lights_on'])
+    for pin, lamp in light_lamps.items():
+        canvas_lights.itemconfigure(lamp[0], fill=lamp[1] if pin in pins_on else "gray25")
+    window.after(50, poll_light_state)  # About 20 times per second, only while the tab is shown
+
+
+def build_tab3():  # The switches of the traffic lights and the led lights
+    global selected_traffic, selected_led, lbl_light_state, canvas_lights, light_lamps
     lb8_empty = Label(tab3, text="   ", fg="cyan4", font=("Arial Bold", 24))
     lb8_empty.grid(column=0, row=0)
     lb8 = Label(tab3, text="Ενεργοποίηση", fg="forest green", font=("Arial Bold", 12))
@@ -399,6 +868,26 @@ if os_select == 0:  # We only create this tab, if the selected OS is Raspberry
     chk_empty2.grid(column=0, row=4)
     chk2 = Checkbutton(tab3, text="Φωτισμός", fg="yellow", font=("Arial Bold", 12), variable=selected_led, command=lg_clicked)
     chk2.grid(column=1, row=5, sticky=W)
+    # One row of lamps per intersection and the phase with the time until it changes
+    intersections = load_intersections()
+    canvas_lights = Canvas(tab3, width=30 * max(len(item.pins) for item in intersections) + 10,
+                           height=30 * len(intersections) + 10, background="black", highlightthickness=0)
+    canvas_lights.grid(column=1, row=6, columnspan=5, pady=10)
+    light_lamps = {}  # Pin: (canvas item, color when on)
+    for line, intersection in enumerate(intersections):
+        for place, pin in enumerate(intersection.pins):
+            lamp = canvas_lights.create_oval(10 + place * 30, 10 + line * 30, 30 + place * 30, 30 + line * 30,
+                                             fill="gray25", outline="gray50")
+            light_lamps[pin] = (lamp, light_colors[place % len(light_colors)])
+    lbl_light_state = Label(tab3, text="", fg="forest green", font=("Arial Bold", 11), justify=LEFT)
+    lbl_light_state.grid(column=1, row=7, columnspan=5, sticky=W)
+    window.after(50, poll_light_state)
+
+
+if os_select == 0:  # We only create this tab, if the selected OS is Raspberry
+    tab3 = ttk.Frame(tabControl, takefocus=NO)
+    tabControl.add(tab3, text='Φανάρια και Φώτα')
+    tab_builders[str(tab3)] = build_tab3
 # --------------------------------------------------------------------------------------------------------------
 # Code for the fourth tab (step and turn factor)
 # In this tab the user can adjust the movement factor of each step for forward/backward and left/right move.
@@ -416,100 +905,199 @@ def update_factors():
     global lr_txt_value
     lr_txt_value = value_lr.get()
     file_w.close()
+    pose_tracker.set_factors(fb_txt_value, lr_txt_value)
+
+
+def build_tab4():  # The fields of the two factors
+    global value_fb, value_lr
+    factor_empty = Label(tab4, text="   ", fg="cyan4", font=("Arial Bold", 24))
+    factor_empty.grid(column=0, row=0)
+    lb_factor_fb = Label(tab4, text="Καθορίζει το μήκος ενός βήματος", fg="forest green", font=("Arial Bold", 12))
+    lb_factor_fb.grid(column=1, row=1)
+    value_fb = Entry(tab4, width=12, fg="forest green")
+    value_fb.insert(0, fb_txt_value)
+    value_fb.grid(column=1, row=2)
+    factor_empty2 = Label(tab4, text="   ", fg="cyan4", font=("Arial Bold", 12))
+    factor_empty2.grid(column=0, row=3)
+    lb_factor_lr = Label(tab4, text="Καθορίζει την γωνία της στροφής", fg="tomato", font=("Arial Bold", 12))
+    lb_factor_lr.grid(column=1, row=4)
+    value_lr = Entry(tab4, width=12, fg="tomato")
+    value_lr.insert(0, lr_txt_value)
+    value_lr.grid(column=1, row=5)
+    factor_empty3 = Label(tab4, text="   ", fg="cyan4", font=("Arial Bold", 12))
+    factor_empty3.grid(column=0, row=6)
+    btn2 = Button(tab4, text="Ενημέρωση", fg="purple3", command=update_factors)
+    btn2.grid(column=1, row=7)
 
 
 tab4 = ttk.Frame(tabControl, takefocus=NO)
 tabControl.add(tab4, text='Συντελεστές κίνησης')
-factor_empty = Label(tab4, text="   ", fg="cyan4", font=("Arial Bold", 24))
-factor_empty.grid(column=0, row=0)
-lb_factor_fb = Label(tab4, text="Καθορίζει το μήκος ενός βήματος", fg="forest green", font=("Arial Bold", 12))
-lb_factor_fb.grid(column=1, row=1)
-value_fb = Entry(tab4, width=12, fg="forest green")
-value_fb.insert(0, fb_txt_value)
-value_fb.grid(column=1, row=2)
-factor_empty2 = Label(tab4, text="   ", fg="cyan4", font=("Arial Bold", 12))
-factor_empty2.grid(column=0, row=3)
-lb_factor_lr = Label(tab4, text="Καθορίζει την γωνία της στροφής", fg="tomato", font=("Arial Bold", 12))
-lb_factor_lr.grid(column=1, row=4)
-value_lr = Entry(tab4, width=12, fg="tomato")
-value_lr.insert(0, lr_txt_value)
-value_lr.grid(column=1, row=5)
-factor_empty3 = Label(tab4, text="   ", fg="cyan4", font=("Arial Bold", 12))
-factor_empty3.grid(column=0, row=6)
-btn2 = Button(tab4, text="Ενημέρωση", fg="purple3", command=update_factors)
-btn2.grid(column=1, row=7)
+tab_builders[str(tab4)] = build_tab4
+# --------------------------------------------------------------------------------------------------------------
+# Code for the diagnostics tab (latency of every stage and the last events, see "telemetry.py")
+# The tab is refreshed only while it is selected
+stage_names = {'press_to_enqueue': "Πλήκτρο → ουρά", 'enqueue_to_write': "Ουρά → σειριακή",
+               'ack_rtt': "Επιβεβαίωση (RTT)", 'lights': "Φώτα", 'lights_query': "Φώτα (ερώτηση)"}
+
+
+def poll_diagnostics():  # Shows the histograms and the last events of the telemetry
+    if tabControl.tab(tabControl.select(), "text") == 'Διαγνωστικά':
+        lines = []
+        for stage, values in telemetry.summary().items():
+            lines.append("{:<20} {:>6}   p50 {:>8} ms   p90 {:>8} ms   p99 {:>8} ms   max {:>8} ms".format(
+                stage_names.get(stage, stage), values['count'], values['p50_ms'], values['p90_ms'],
+                values['p99_ms'], values['max_ms']))
+        lines.append("")
+        events = telemetry.events(30)
+        start = events[0][1] if events else 0.0
+        lines += [format_event(event, start) for event in reversed(events)]
+        txt_diagnostics.configure(state=NORMAL)
+        txt_diagnostics.delete('1.0', END)
+        txt_diagnostics.insert(END, "\n".join(lines))
+        txt_diagnostics.configure(state=DISABLED)
+    window.after(500, poll_diagnostics)
+
+
+def save_diagnostics():  # Writes everything the telemetry has to a file, to look at it later
+    try:
+        path = telemetry.dump()
+    except OSError as error:
+        lbl_diagnostics.configure(text="Σφάλμα: " + str(error))
+        return
+    lbl_diagnostics.configure(text="Αποθηκεύτηκε στο " + path)
+
+
+def build_tab_diagnostics():  # The text of the telemetry and the button for the dump
+    global txt_diagnostics, lbl_diagnostics
+    txt_diagnostics = Text(tab_diagnostics, width=100, height=36, font=("Courier", 9), state=DISABLED)
+    txt_diagnostics.grid(column=0, row=0, columnspan=2)
+    btn_diagnostics = Button(tab_diagnostics, text="Αποθήκευση", fg="purple3", command=save_diagnostics)
+    btn_diagnostics.grid(column=0, row=1, sticky=W)
+    lbl_diagnostics = Label(tab_diagnostics, text="", fg="gray40", font=("Arial", 9))
+    lbl_diagnostics.grid(column=1, row=1, sticky=W)
+    window.after(500, poll_diagnostics)
+
+
+tab_diagnostics = ttk.Frame(tabControl, takefocus=NO)
+tabControl.add(tab_diagnostics, text='Διαγνωστικά')
+tab_builders[str(tab_diagnostics)] = build_tab_diagnostics
 # --------------------------------------------------------------------------------------------------------------
 # Code for the fifth tab (About)
+
+
+def build_tab5():  # The team, the children and the people that helped
+    lb9 = Label(tab5, text="3ος Πανελλήνιος ", fg="orange", font=("Arial Bold", 12))
+    lb9.grid(column=0, row=0, sticky=E)
+    lb9_0 = Label(tab5, text="Διαγωνισμός Ανοιχτών Τεχνολογιών στην Εκπαίδευση 2021", fg="DarkOrange1", font=("Arial Bold", 12))
+    lb9_0.grid(column=1, row=0)
+    lb_empty = Label(tab5, text="    ", font=("Arial Bold", 12))
+    lb_empty.grid(column=1, row=1)
+    lb10 = Label(tab5, text="Όνομα Ομάδας:", fg="RoyalBlue2", font=("Arial Bold", 11))
+    lb10.grid(column=0, row=2)
+    lb10_0 = Label(tab5, text="Νηπιαγωγείο Κάτω Τιθορέας", fg="RoyalBlue2", font=("Arial Bold", 11))
+    lb10_0.grid(column=1, row=2)
+    lb11 = Label(tab5, text="Τίτλος έργου:", fg="cyan4", font=("Arial Bold", 11))
+    lb11.grid(column=0, row=3)
+    lb11_0 = Label(tab5, text="Άκη Ρομποτάκι σε αγαπάμε....με ασφάλεια το δρόμο περνάμε.", fg="cyan4", font=("Arial Bold", 11))
+    lb11_0.grid(column=1, row=3)
+    lb12 = Label(tab5, text="Github έργου:", fg="blue2", font=("Arial Bold", 11))
+    lb12.grid(column=0, row=4)
+    lb12_0 = Label(tab5, text="https://github.com/tosxoleio-mou/-", fg="blue2", font=("Arial Bold", 10))
+    lb12_0.grid(column=1, row=4)
+    lb12_empty = Label(tab5, text="   ", fg="cyan4", font=("Arial Bold", 12))
+    lb12_empty.grid(column=0, row=5)
+    lb13 = Label(tab5, text="Εκπαιδευτικοί:", fg="SpringGreen3", font=("Arial Bold", 11))
+    lb13.grid(column=0, row=6)
+    lb13_0 = Label(tab5, text="Κατόπη Γεωργία, Κατσακιώρη Μαρίνα, Κωστή Κυριακή", fg="SpringGreen3", font=("Arial Bold", 9))
+    lb13_0.grid(column=1, row=6)
+    lb14 = Label(tab5, text="Παιδάκια: ", fg="cyan3", font=("Arial Bold", 11))
+    lb14.grid(column=0, row=7)
+    lb14_0 = Label(tab5, text="Ασλλάνι Αμέλια, Βασιλακάκος Παύλος, Γερογιάννης Θοδωρής, Γεροχρήστος Θανάσης,", fg="turquoise3", font=("Arial Bold", 9))
+    lb14_0.grid(column=1, row=7)
+    lb14_1 = Label(tab5, text="Γεωργίου Αλέξανδρος, Γιαλούρη Μαρία, Γκορρέγια Στέφανο, Δογάνης Παναγιώτης,", fg="DodgerBlue3", font=("Arial Bold", 9))
+    lb14_1.grid(column=1, row=8)
+    lb14_2 = Label(tab5, text="Θεοδώρου Γεωργία, Κακός Νέστορας, Καντάκος Σωτήρης, Καπερώνη Μάρθα, Κινιόβ Μάξιμος,", fg="deep pink", font=("Arial Bold", 9))
+    lb14_2.grid(column=1, row=9)
+    lb14_3 = Label(tab5, text="Κοζάκης Άγγελος, Κοπανάκης Κώστας, Κότσι Ανδρέας, Κουκουτσίδης Μάρκος, Κουρής Νικόλας,", fg="cornflower blue", font=("Arial Bold", 9))
+    lb14_3.grid(column=1, row=10)
+    lb14_4 = Label(tab5, text="Λάμπρου Γιάννης, Μπινιώρης Γιάννης, Ντσίμας Κωνσταντίνος, Πάλλας Γιώργος, Πόρρος Αντώνης,", fg="DeepSkyBlue3", font=("Arial Bold", 9))
+    lb14_4.grid(column=1, row=11)
+    lb14_5 = Label(tab5, text="Πρένγκα Μαρία, Σαράντης Μανώλης, Σκεντέρι Νόρα, Σταμούλια Κωνσταντινιά Αγάπη,", fg="magenta2", font=("Arial Bold", 9))
+    lb14_5.grid(column=1, row=12)
+    lb14_6 = Label(tab5, text="Τασόπουλος Πέτρος, Τζαναβέλης Κωσταντής, Φάσκο Έλιον, Χλωμίσιος Αναστάσης,", fg="steel blue", font=("Arial Bold", 9))
+    lb14_6.grid(column=1, row=13)
+    lb14_7 = Label(tab5, text="Φίνος Γιάννης, Φίνου Αθανασία, Φράγκου Σίλια, Χυσένι Φλάβιο", fg="medium sea green", font=("Arial Bold", 9))
+    lb14_7.grid(column=1, row=14)
+    lb15 = Label(tab5, text="Εξωτερικοί Συνεργάτες:", fg="SpringGreen3", font=("Arial Bold", 11))
+    lb15.grid(column=0, row=15)
+    lb15_0 = Label(tab5, text="Λεονάρδος Θοδωρής, Σταμούλιας Ιωάννης, ", fg="SpringGreen3", font=("Arial Bold", 9))
+    lb15_0.grid(column=1, row=15)
+    lb16 = Label(tab5, text=" ", font=("Arial Bold", 10))
+    lb16.grid(column=0, row=16)
+    lb17 = Label(tab5, text="Created by:", fg="dark slate gray", font=("Arial Bold", 10))
+    lb17.grid(column=0, row=17)
+    lb17_0 = Label(tab5, text="Σταμούλιας Ιωάννης <istamoulias@gmail.com>", fg="dark slate gray", font=("Arial Bold", 9))
+    lb17_0.grid(column=1, row=17)
+
+
 tab5 = ttk.Frame(tabControl, takefocus=NO)
 tabControl.add(tab5, text='Σχετικά με...')
-lb9 = Label(tab5, text="3ος Πανελλήνιος ", fg="orange", font=("Arial Bold", 12))
-lb9.grid(column=0, row=0, sticky=E)
-lb9_0 = Label(tab5, text="Διαγωνισμός Ανοιχτών Τεχνολογιών στην Εκπαίδευση 2021", fg="DarkOrange1", font=("Arial Bold", 12))
-lb9_0.grid(column=1, row=0)
-lb_empty = Label(tab5, text="    ", font=("Arial Bold", 12))
-lb_empty.grid(column=1, row=1)
-lb10 = Label(tab5, text="Όνομα Ομάδας:", fg="RoyalBlue2", font=("Arial Bold", 11))
-lb10.grid(column=0, row=2)
-lb10_0 = Label(tab5, text="Νηπιαγωγείο Κάτω Τιθορέας", fg="RoyalBlue2", font=("Arial Bold", 11))
-lb10_0.grid(column=1, row=2)
-lb11 = Label(tab5, text="Τίτλος έργου:", fg="cyan4", font=("Arial Bold", 11))
-lb11.grid(column=0, row=3)
-lb11_0 = Label(tab5, text="Άκη Ρομποτάκι σε αγαπάμε....με ασφάλεια το δρόμο περνάμε.", fg="cyan4", font=("Arial Bold", 11))
-lb11_0.grid(column=1, row=3)
-lb12 = Label(tab5, text="Github έργου:", fg="blue2", font=("Arial Bold", 11))
-lb12.grid(column=0, row=4)
-lb12_0 = Label(tab5, text="https://github.com/tosxoleio-mou/-", fg="blue2", font=("Arial Bold", 10))
-lb12_0.grid(column=1, row=4)
-lb12_empty = Label(tab5, text="   ", fg="cyan4", font=("Arial Bold", 12))
-lb12_empty.grid(column=0, row=5)
-lb13 = Label(tab5, text="Εκπαιδευτικοί:", fg="SpringGreen3", font=("Arial Bold", 11))
-lb13.grid(column=0, row=6)
-lb13_0 = Label(tab5, text="Κατόπη Γεωργία, Κατσακιώρη Μαρίνα, Κωστή Κυριακή", fg="SpringGreen3", font=("Arial Bold", 9))
-lb13_0.grid(column=1, row=6)
-lb14 = Label(tab5, text="Παιδάκια: ", fg="cyan3", font=("Arial Bold", 11))
-lb14.grid(column=0, row=7)
-lb14_0 = Label(tab5, text="Ασλλάνι Αμέλια, Βασιλακάκος Παύλος, Γερογιάννης Θοδωρής, Γεροχρήστος Θανάσης,", fg="turquoise3", font=("Arial Bold", 9))
-lb14_0.grid(column=1, row=7)
-lb14_1 = Label(tab5, text="Γεωργίου Αλέξανδρος, Γιαλούρη Μαρία, Γκορρέγια Στέφανο, Δογάνης Παναγιώτης,", fg="DodgerBlue3", font=("Arial Bold", 9))
-lb14_1.grid(column=1, row=8)
-lb14_2 = Label(tab5, text="Θεοδώρου Γεωργία, Κακός Νέστορας, Καντάκος Σωτήρης, Καπερώνη Μάρθα, Κινιόβ Μάξιμος,", fg="deep pink", font=("Arial Bold", 9))
-lb14_2.grid(column=1, row=9)
-lb14_3 = Label(tab5, text="Κοζάκης Άγγελος, Κοπανάκης Κώστας, Κότσι Ανδρέας, Κουκουτσίδης Μάρκος, Κουρής Νικόλας,", fg="cornflower blue", font=("Arial Bold", 9))
-lb14_3.grid(column=1, row=10)
-lb14_4 = Label(tab5, text="Λάμπρου Γιάννης, Μπινιώρης Γιάννης, Ντσίμας Κωνσταντίνος, Πάλλας Γιώργος, Πόρρος Αντώνης,", fg="DeepSkyBlue3", font=("Arial Bold", 9))
-lb14_4.grid(column=1, row=11)
-lb14_5 = Label(tab5, text="Πρένγκα Μαρία, Σαράντης Μανώλης, Σκεντέρι Νόρα, Σταμούλια Κωνσταντινιά Αγάπη,", fg="magenta2", font=("Arial Bold", 9))
-lb14_5.grid(column=1, row=12)
-lb14_6 = Label(tab5, text="Τασόπουλος Πέτρος, Τζαναβέλης Κωσταντής, Φάσκο Έλιον, Χλωμίσιος Αναστάσης,", fg="steel blue", font=("Arial Bold", 9))
-lb14_6.grid(column=1, row=13)
-lb14_7 = Label(tab5, text="Φίνος Γιάννης, Φίνου Αθανασία, Φράγκου Σίλια, Χυσένι Φλάβιο", fg="medium sea green", font=("Arial Bold", 9))
-lb14_7.grid(column=1, row=14)
-lb15 = Label(tab5, text="Εξωτερικοί Συνεργάτες:", fg="SpringGreen3", font=("Arial Bold", 11))
-lb15.grid(column=0, row=15)
-lb15_0 = Label(tab5, text="Λεονάρδος Θοδωρής, Σταμούλιας Ιωάννης, ", fg="SpringGreen3", font=("Arial Bold", 9))
-lb15_0.grid(column=1, row=15)
-lb16 = Label(tab5, text=" ", font=("Arial Bold", 10))
-lb16.grid(column=0, row=16)
-lb17 = Label(tab5, text="Created by:", fg="dark slate gray", font=("Arial Bold", 10))
-lb17.grid(column=0, row=17)
-lb17_0 = Label(tab5, text="Σταμούλιας Ιωάννης <istamoulias@gmail.com>", fg="dark slate gray", font=("Arial Bold", 9))
-lb17_0.grid(column=1, row=17)
+tab_builders[str(tab5)] = build_tab5
 # --------------------------------------------------------------------------------------------------------------
 
 
 def close_program():
-    serialPort.close()
-    if tr_poc_run == 1:
-        os.kill(traffic_pid, 9)
-    if lg_poc_run == 1:
-        os.kill(light_pid, 9)
-    Popen(['python3', './scripts/traffic_lights_off.py'])
-    Popen(['python3', './scripts/lights_off.py'])
+    program_abort()
+    transport.close()
+    journal.close()
+    lights.shutdown()  # Turn off all lights
     sys.exit(0)
 
 
 signal.signal(signal.SIGINT, close_program)
 
+
+def poll_transport():  # Shows the state of the serial transport, without ever waiting for the serial port
+    stats = transport.stats()
+    status_text = "Ουρά: " + str(stats['queue_depth']) + "   Καθυστέρηση: " + \
+                  str(round(stats['last_latency'] * 1000, 1)) + " ms"
+    if 'mean_rtt' in stats:  # Acknowledged protocol
+        status_text += "   RTT: " + str(round(stats['mean_rtt'] * 1000, 1)) + " ms   Επαναλήψεις: " + \
+                       str(stats['retransmissions'])
+    if stats['error'] is not None:
+        status_text += "   Σφάλμα: " + stats['error']
+    for robot, robot_stats in stats.get('robots', {}).items():  # Several transmitters
+        if robot != stats['robot']:
+            status_text += "   " + robot + ": " + str(robot_stats['queue_depth']) + \
+                           (" (σφάλμα)" if robot_stats['error'] is not None else "")
+    lbl_transport.configure(text=status_text)
+    journal.flush()
+    window.after(250, poll_transport)
+
+
+robot_poses = {}  # Robot: last pose, while another robot is selected
+
+
+def select_robot(event):  # The tabs drive the robot selected here, each robot keeps its own position on the map
+    robot = cmb_robot.get()
+    if robot == transport.selected:
+        return
+    program_runner.abort()
+    coalescer.flush(force=True)
+    robot_poses[transport.selected] = pose_tracker.pose()
+    transport.select(robot)
+    pose_tracker.reset(robot_poses.get(robot, (1.0, 1.0, 90.0)))
+
+
+lbl_transport = Label(window, text="", fg="gray70", bg="black", font=("Arial", 9))
 tabControl.pack(expand=1, fill="both")
+if isinstance(transport, TransmitterPool):
+    cmb_robot = ttk.Combobox(window, values=transport.robots(), state="readonly", width=14)
+    cmb_robot.set(transport.selected)
+    cmb_robot.bind('<<ComboboxSelected>>', select_robot)
+    cmb_robot.pack(side="left")
+lbl_transport.pack(fill="x")
+window.after(250, poll_transport)
 window.bind_all('<Key>', key)
+window.bind_all('<KeyRelease>', key_release)
 window.mainloop()
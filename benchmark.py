@@ -0,0 +1,389 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Benchmarks of the controller
+# -- File       : benchmark.py
+# -- Purpose    : Measures the paths of the application that the children notice, without the Raspberry Pi, the
+# --              platform or the mBits, and writes the results as JSON so that the runs of different versions
+# --              can be compared:
+# --                key_latency   : press of an arrow (key() and press_* call KeyCoalescer.press) until the first
+# --                                byte of the frame comes out of the serial port, and the same for a frame
+# --                                given directly to the transport (clicked() and the program runner)
+# --                throughput    : sustained frames per second over the serial link at 115200 baud, with the
+# --                                plain frames and with the acknowledged protocol (robot_simulator.py receives
+# --                                them at the baud rate of the link and acknowledges the acknowledged ones)
+# --                lights        : on/off latency of tr_clicked() and lg_clicked() (LightsClient to the daemon),
+# --                                and of starting a light script as a new process (the old way)
+# --                cpu           : CPU use of the running light scripts and of the lights daemon
+# --                cold_start    : start of SystemController.py until the first iteration of its mainloop (the
+# --                                script is run by STARTUP_PROBE, which hooks Tk's mainloop from outside)
+# -- Notes      : Usage: python3 benchmark.py [--output results.json] [--only key_latency,lights] [--samples 200]
+# --              Run it from the folder of SystemController.py. The GPIO pins are the in-memory "mock" backend
+# --              of gpio_pins.py (GPIO_BACKEND=mock) and the serial port is a pseudo-terminal, so Linux is needed.
+# --              A measurement that cannot run here (no pyserial, no DISPLAY for Tk, a lights daemon that is
+# --              already running) is written as {"skipped": reason}. The times are in milliseconds.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Linux / Raspberry Pi OS (pseudo-terminals, /proc)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import json
+import os
+import platform
+import select
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from headless_controller import TimerLoop
+from lights_client import LightsClient
+from robot_commands import encode_command
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CONTROLLER_SCRIPT = './SystemController.py'
+# Runs the controller with an after_idle() hook on its mainloop that reports the first iteration and ends the
+# process at once, so SystemController.py itself has no code for the benchmark
+STARTUP_PROBE = (
+    'import os, runpy, sys, tkinter\n'
+    'def mainloop(self, n=0):\n'
+    '    self.after_idle(lambda: (print("mainloop", flush=True), os._exit(0)))\n'
+    '    original_mainloop(self, n)\n'
+    'original_mainloop = tkinter.Misc.mainloop\n'
+    'tkinter.Misc.mainloop = mainloop\n'
+    'sys.argv = [sys.argv[1]]\n'
+    'runpy.run_path(sys.argv[0], run_name="__main__")\n'
+)
+SECTIONS = ['key_latency', 'throughput', 'lights', 'cpu', 'cold_start']
+
+
+class Skipped(Exception):  # The measurement cannot run in this environment, the message is the reason
+    pass
+
+
+def summary(values):  # Statistics of a list of durations in seconds, in milliseconds
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 3)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': percentile(0.5),
+        'p90_ms': percentile(0.9),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def script(name):
+    return os.path.join(SCRIPTS_DIR, name)
+
+
+def mock_environment():
+    return dict(os.environ, GPIO_BACKEND='mock')
+
+
+def open_serial_pty():  # Returns (master fd, slave fd, serial.Serial on the slave)
+    try:
+        import serial
+    except ImportError:
+        raise Skipped('pyserial is not installed')
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    port = serial.Serial(port=os.ttyname(slave), baudrate=115200, timeout=2)
+    return master, slave, port
+
+
+def wait_frame(master, scheduler, timeout=2.0):  # Returns the time of the first byte of the next frame
+    deadline = time.perf_counter() + timeout
+    first = None
+    received = b''
+    while b'\n' not in received:
+        now = time.perf_counter()
+        if now > deadline:
+            raise RuntimeError('no frame came out of the serial port')
+        wait = scheduler.run_due() if scheduler is not None else None
+        wait = deadline - now if wait is None else min(wait, deadline - now)
+        readable, _, _ = select.select([master], [], [], max(0.0, wait))
+        if readable:
+            data = os.read(master, 4096)
+            if first is None and data:
+                first = time.perf_counter()
+            received += data
+    return first
+
+
+def bench_key_latency(samples):
+    from key_coalescer import KeyCoalescer
+    from serial_transport import SerialTransport
+    master, slave, port = open_serial_pty()
+    transport = SerialTransport(port)
+    scheduler = TimerLoop()
+    coalescer = KeyCoalescer(transport, scheduler)
+    presses = [('F', 300), ('L', 300), ('R', 300), ('B', 300)]  # As key() and press_up/left/right/down
+    coalesced = []
+    direct = []
+    try:
+        for number in range(samples):
+            direction, steps = presses[number % len(presses)]
+            coalescer.busy_until = 0.0  # The robot finished the previous command
+            start = time.perf_counter()
+            coalescer.press(direction, steps)
+            coalesced.append(wait_frame(master, scheduler) - start)
+            start = time.perf_counter()
+            transport.send(encode_command(direction, steps))
+            direct.append(wait_frame(master, None) - start)
+    finally:
+        transport.close()
+        os.close(master)
+        os.close(slave)
+    return {'coalesced_press': summary(coalesced), 'coalescing_window_ms': coalescer.window * 1000,
+            'transport_send': summary(direct)}
+
+
+def bench_throughput(frames):  # The plain frames, through the simulated transmitter at the baud rate of the link
+    try:
+        import serial
+    except ImportError:
+        raise Skipped('pyserial is not installed')
+    from robot_simulator import RobotSimulator
+    from serial_transport import SerialTransport
+    results = {}
+    simulator = RobotSimulator(latency=0.0, jitter=0.0, speed=1000.0, seed=1)
+    path = simulator.open_pty()
+    thread = threading.Thread(target=simulator.run, daemon=True)
+    thread.start()
+    transport = SerialTransport(serial.Serial(port=path, baudrate=115200, timeout=2), max_queue=256)
+    frame = encode_command('F', 300)
+    start = time.monotonic()  # The clock of the simulator
+    for number in range(frames):
+        while not transport.send(frame):
+            time.sleep(0.0005)  # The queue is full, as when the children hold an arrow
+    deadline = time.monotonic() + 60
+    while simulator.stats()['received_frames'] < frames and time.monotonic() < deadline:
+        time.sleep(0.001)
+    # The pseudo-terminal itself has no baud rate: the last frame is through when the simulated link sent it
+    elapsed = max(simulator.link_free, time.monotonic()) - start
+    received = simulator.stats()['received_frames']
+    stats = transport.stats()
+    transport.close()
+    simulator.stop()
+    thread.join(1)
+    results['plain'] = {'frames': received, 'seconds': round(elapsed, 3),
+                        'frames_per_second': round(received / elapsed, 1), 'write_calls': stats['write_calls'],
+                        'mean_latency_ms': round(stats['mean_latency'] * 1000, 3)}
+    results['acked'] = bench_acked_throughput(max(1, frames // 10))
+    return results
+
+
+def bench_acked_throughput(frames):  # The acknowledged protocol against the simulated transmitter and robot
+    import serial
+    from link_protocol import AckedLink
+    from robot_simulator import RobotSimulator
+    simulator = RobotSimulator(latency=0.0, jitter=0.0, speed=1000.0, seed=1)
+    path = simulator.open_pty()
+    thread = threading.Thread(target=simulator.run, daemon=True)
+    thread.start()
+    link = AckedLink(serial.Serial(port=path, baudrate=115200, timeout=2))
+    frame = encode_command('F', 300)
+    start = time.perf_counter()
+    for number in range(frames):
+        while not link.send(frame):
+            time.sleep(0.0005)
+    deadline = time.monotonic() + 30
+    while link.stats()['acked_frames'] + link.stats()['lost_frames'] < frames and time.monotonic() < deadline:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    stats = link.stats()
+    link.close()
+    simulator.stop()
+    thread.join(1)
+    return {'frames': stats['acked_frames'], 'seconds': round(elapsed, 3),
+            'frames_per_second': round(stats['acked_frames'] / elapsed, 1), 'window': link.window,
+            'mean_rtt_ms': round(stats['mean_rtt'] * 1000, 3), 'retransmissions': stats['retransmissions']}
+
+
+def start_daemon():  # Starts the lights daemon on the mock GPIO backend, returns (process, client)
+    client = LightsClient()
+    if client.is_running():
+        raise Skipped('a lights daemon is already running on port ' + str(client.port))
+    process = subprocess.Popen([sys.executable, script('lights_daemon.py')], env=mock_environment(),
+                               stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not client.is_running():
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError('the lights daemon did not start')
+        time.sleep(0.05)
+    return process, client
+
+
+def stop_daemon(process, client):
+    client.send('shutdown')
+    client.close()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def bench_lights(samples):
+    process, client = start_daemon()
+    results = {}
+    try:
+        for name, device in (('tr_clicked', 'traffic'), ('lg_clicked', 'lights')):
+            on = []
+            off = []
+            for number in range(samples):
+                start = time.perf_counter()
+                client.send(device + ' on')
+                on.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                client.send(device + ' off')
+                off.append(time.perf_counter() - start)
+            results[name] = {'on': summary(on), 'off': summary(off)}
+    finally:
+        stop_daemon(process, client)
+    process_start = []
+    for number in range(min(samples, 10)):  # The old GUI started a python3 process for every change
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script('lights_off.py')], env=mock_environment(), check=True)
+        process_start.append(time.perf_counter() - start)
+    results['script_process'] = summary(process_start)
+    return results
+
+
+def process_cpu(pid):  # User and system CPU seconds of a running process, from /proc
+    stat_file = open('/proc/' + str(pid) + '/stat', 'r')
+    fields = stat_file.read().rsplit(')', 1)[1].split()
+    stat_file.close()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def measure_cpu(pid, seconds):  # Percent of one CPU used by the process during "seconds"
+    before = process_cpu(pid)
+    start = time.monotonic()
+    time.sleep(seconds)
+    used = process_cpu(pid) - before
+    return round(used / (time.monotonic() - start) * 100, 2)
+
+
+def bench_cpu(seconds):
+    if not os.path.exists('/proc/self/stat'):
+        raise Skipped('/proc is not available')
+    results = {}
+    for name, arguments in (('lights.py', ['lights.py']), ('lights.py breathe', ['lights.py', 'breathe']),
+                            ('traffic_lights.py', ['traffic_lights.py'])):
+        process = subprocess.Popen([sys.executable, script(arguments[0])] + arguments[1:], env=mock_environment())
+        try:
+            time.sleep(0.5)  # Leave out the start of the interpreter
+            if process.poll() is not None:
+                raise RuntimeError(name + ' ended with code ' + str(process.returncode))
+            results[name] = {'cpu_percent': measure_cpu(process.pid, seconds)}
+        finally:
+            process.send_signal(signal.SIGINT)
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    process, client = start_daemon()
+    try:
+        results['lights_daemon idle'] = {'cpu_percent': measure_cpu(process.pid, seconds)}
+        client.send('traffic on')
+        client.send('lights mode breathe')
+        client.send('lights on')
+        results['lights_daemon traffic and breathe'] = {'cpu_percent': measure_cpu(process.pid, seconds)}
+    finally:
+        stop_daemon(process, client)
+    return results
+
+
+def bench_cold_start(runs):
+    if os.name == 'posix' and sys.platform != 'darwin' and not os.environ.get('DISPLAY'):
+        raise Skipped('no DISPLAY for the Tk window')
+    if not os.path.exists(CONTROLLER_SCRIPT):
+        raise Skipped('run the benchmarks from the folder of SystemController.py')
+    master, slave, port = open_serial_pty()
+    port.close()
+    environment = dict(mock_environment(), SC_PORT=os.ttyname(slave), SC_OS='windows')
+    times = []
+    try:
+        for number in range(runs):
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, '-c', STARTUP_PROBE, CONTROLLER_SCRIPT], env=environment,
+                                       stdout=subprocess.PIPE, universal_newlines=True)
+            line = process.stdout.readline()
+            elapsed = time.perf_counter() - start
+            process.wait(timeout=10)
+            if line.strip() != 'mainloop':
+                raise RuntimeError('SystemController.py ended before its mainloop')
+            times.append(elapsed)
+    finally:
+        os.close(master)
+        os.close(slave)
+    return {'to_mainloop': summary(times)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True, cwd=SCRIPTS_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(sections, samples=200, frames=5000, cpu_seconds=3.0, runs=3):
+    benchmarks = {
+        'key_latency': lambda: bench_key_latency(samples),
+        'throughput': lambda: bench_throughput(frames),
+        'lights': lambda: bench_lights(samples),
+        'cpu': lambda: bench_cpu(cpu_seconds),
+        'cold_start': lambda: bench_cold_start(runs),
+    }
+    results = {}
+    for section in sections:
+        try:
+            results[section] = benchmarks[section]()
+        except Skipped as reason:
+            results[section] = {'skipped': str(reason)}
+        except Exception as error:  # One broken measurement must not lose the others
+            results[section] = {'error': type(error).__name__ + ': ' + str(error)}
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'settings': {'samples': samples, 'frames': frames, 'cpu_seconds': cpu_seconds, 'runs': runs},
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmarks of the Robot and Platform controller')
+    parser.add_argument('--output', help='JSON file to write, default is the standard output')
+    parser.add_argument('--only', default=','.join(SECTIONS), help='comma separated: ' + ','.join(SECTIONS))
+    parser.add_argument('--samples', type=int, default=200, help='samples of every latency')
+    parser.add_argument('--frames', type=int, default=5000, help='frames of the throughput test')
+    parser.add_argument('--cpu-seconds', type=float, default=3.0, help='measuring time of every light script')
+    parser.add_argument('--runs', type=int, default=3, help='cold starts of SystemController.py')
+    args = parser.parse_args()
+    sections = [section.strip() for section in args.only.split(',') if section.strip()]
+    for section in sections:
+        if section not in SECTIONS:
+            parser.error('unknown section "' + section + '"')
+    report = run(sections, args.samples, args.frames, args.cpu_seconds, args.runs)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        output = open(args.output, 'w')
+        output.write(text + '\n')
+        output.close()
+    else:
+        print(text)
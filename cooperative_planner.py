@@ -0,0 +1,197 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Cooperative multi-robot planner
+# -- File       : cooperative_planner.py
+# -- Purpose    : Plans the routes of several robots on the platform map so that they never meet in the same
+# --              cell or swap cells, using a space-time reservation table (cell x time step).
+# -- Notes      : Time is counted in ticks; one tick is the longest of one step forward and one 90 degree turn,
+# --              so every action (F, L, R or W for wait) takes one tick. compile_timed_route() turns the actions
+# --              into commands where every action is padded with a wait ('W', milliseconds) to one tick, so the
+# --              robots keep to the reserved schedule (program_runner.ProgramRunner executes the waits).
+# --              The robots are planned one after the other with space-time A*, each one around the
+# --              reservations of the robots before it. A robot that reaches its destination keeps its cell
+# --              reserved from then on. If a robot cannot be planned, it is moved to the front of the order and
+# --              all the routes are planned again (so a robot cannot be locked out by the others).
+# --              When one robot's start or destination changes, only its own reservations are removed and only
+# --              its route is planned again. The A* heuristic is the static distance to the destination, which
+# --              is computed once per destination cell and kept.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import collections
+import heapq
+
+from platform_map import MOVES
+from robot_commands import estimate_duration
+
+
+class CooperativePlanner:
+    def __init__(self, platform_map, fb_factor, lr_factor, horizon=None):
+        self.map = platform_map
+        self.fb_factor = int(fb_factor)
+        self.lr_factor = int(lr_factor)
+        self.tick = max(estimate_duration('F', self.fb_factor), estimate_duration('L', self.lr_factor))
+        self.horizon = horizon or 4 * len(platform_map.road_cells())  # Longest route searched, in ticks
+        self.robots = collections.OrderedDict()  # robot: (start state, goal cell), in planning order
+        self.paths = {}  # robot: list of states (row, column, heading), one per tick
+        self.cells = {}  # (row, column, tick): robot
+        self.moves = {}  # (from cell, to cell, tick): robot, for the swap check
+        self.parked = {}  # goal cell: (robot, first tick it stays there)
+        self.distances = {}  # goal cell: {(row, column): static distance in ticks}
+
+    # ---------------------------------------------------------------- reservations
+    def _reserve(self, robot, path):
+        for tick, state in enumerate(path):
+            self.cells[(state[0], state[1], tick)] = robot
+            if tick > 0 and path[tick - 1][:2] != state[:2]:
+                self.moves[(path[tick - 1][:2], state[:2], tick)] = robot
+        self.parked[path[-1][:2]] = (robot, len(path) - 1)
+        self.paths[robot] = path
+
+    def _release(self, robot):
+        path = self.paths.pop(robot, None)
+        if path is None:
+            return
+        for tick, state in enumerate(path):
+            if self.cells.get((state[0], state[1], tick)) == robot:
+                del self.cells[(state[0], state[1], tick)]
+            if tick > 0 and self.moves.get((path[tick - 1][:2], state[:2], tick)) == robot:
+                del self.moves[(path[tick - 1][:2], state[:2], tick)]
+        if self.parked.get(path[-1][:2], (None,))[0] == robot:
+            del self.parked[path[-1][:2]]
+
+    def _free(self, robot, cell, tick):  # True if no other robot is (or stays parked) in the cell at the tick
+        other = self.cells.get((cell[0], cell[1], tick))
+        if other is not None and other != robot:
+            return False
+        parked = self.parked.get(cell)
+        return parked is None or parked[0] == robot or tick < parked[1]
+
+    def _can_park(self, robot, cell, tick):  # True if no other robot passes through the cell after the tick
+        for (row, column, other_tick), other in self.cells.items():
+            if (row, column) == cell and other_tick > tick and other != robot:
+                return False
+        return True
+
+    # ---------------------------------------------------------------- search
+    def _distances(self, goal):  # Static distance in ticks from every cell to the goal (breadth first, backwards)
+        if goal in self.distances:
+            return self.distances[goal]
+        distance = {goal: 0}
+        queue = collections.deque([goal])
+        while queue:
+            cell = queue.popleft()
+            for heading in range(4):  # A cell that reaches "cell" moving with this heading
+                previous = (cell[0] - MOVES[heading][0], cell[1] - MOVES[heading][1])
+                if previous not in distance and self.map.forward(previous[0], previous[1], heading) == cell:
+                    distance[previous] = distance[cell] + 1
+                    queue.append(previous)
+        self.distances[goal] = distance
+        return distance
+
+    def _successors(self, state):
+        row, column, heading = state
+        result = [('W', state), ('L', (row, column, (heading - 1) % 4)), ('R', (row, column, (heading + 1) % 4))]
+        cell = self.map.forward(row, column, heading)
+        if cell is not None:
+            result.append(('F', (cell[0], cell[1], heading)))
+        return result
+
+    def _plan(self, robot, start, goal):  # Space-time A*, returns the list of states or None
+        distance = self._distances(goal)
+        if start[:2] not in distance or not self._free(robot, start[:2], 0):
+            return None
+        start = tuple(start)
+        open_heap = [(distance[start[:2]], 0, start)]
+        came_from = {(start, 0): None}
+        while open_heap:
+            estimate, tick, state = heapq.heappop(open_heap)
+            if state[:2] == goal and self._can_park(robot, goal, tick):
+                path = []
+                node = (state, tick)
+                while node is not None:
+                    path.append(node[0])
+                    node = came_from[node]
+                return list(reversed(path))
+            if tick >= self.horizon:
+                continue
+            for action, next_state in self._successors(state):
+                node = (next_state, tick + 1)
+                if node in came_from or next_state[:2] not in distance:
+                    continue
+                if not self._free(robot, next_state[:2], tick + 1):
+                    continue
+                other = self.moves.get((next_state[:2], state[:2], tick + 1))
+                if other is not None and other != robot:  # The other robot comes the opposite way (swap)
+                    continue
+                came_from[node] = (state, tick)
+                heapq.heappush(open_heap, (tick + 1 + distance[next_state[:2]], tick + 1, next_state))
+        return None
+
+    # ---------------------------------------------------------------- public
+    def plan_all(self):  # Plans every robot from scratch, returns {robot: path}; raises ValueError if impossible
+        order = list(self.robots)
+        for attempt in range(len(order)):
+            for robot in list(self.paths):
+                self._release(robot)
+            failed = None
+            for robot in order:
+                start, goal = self.robots[robot]
+                path = self._plan(robot, start, goal)
+                if path is None:
+                    failed = robot
+                    break
+                self._reserve(robot, path)
+            if failed is None:
+                self.robots = collections.OrderedDict((robot, self.robots[robot]) for robot in order)
+                return dict(self.paths)
+            order.remove(failed)  # The robot that could not be planned gets the highest priority
+            order.insert(0, failed)
+        raise ValueError('No conflict-free routes for the robots')
+
+    def set_robot(self, robot, start, goal):  # Adds a robot or changes its route, planning again only that robot
+        start = tuple(start)
+        goal = tuple(goal)
+        self.robots[robot] = (start, goal)
+        self._release(robot)
+        path = self._plan(robot, start, goal)
+        if path is None:
+            return self.plan_all()
+        self._reserve(robot, path)
+        return dict(self.paths)
+
+    def remove_robot(self, robot):
+        self._release(robot)
+        self.robots.pop(robot, None)
+
+    def actions(self, robot):  # The actions of the robot, one per tick
+        path = self.paths[robot]
+        result = []
+        for state, next_state in zip(path, path[1:]):
+            if next_state[:2] != state[:2]:
+                result.append('F')
+            elif next_state[2] == (state[2] - 1) % 4:
+                result.append('L')
+            elif next_state[2] == (state[2] + 1) % 4:
+                result.append('R')
+            else:
+                result.append('W')
+        return ''.join(result)
+
+    def compile_timed_route(self, robot):  # Commands of the robot, every action padded with a wait to one tick
+        commands = []
+        for action in self.actions(robot):
+            if action == 'W':
+                duration = 0.0
+            else:
+                factor = self.fb_factor if action == 'F' else self.lr_factor
+                commands.append((action, factor))
+                duration = estimate_duration(action, factor)
+            wait = int(round((self.tick - duration) * 1000))
+            if wait > 0:
+                if commands and commands[-1][0] == 'W':
+                    commands[-1] = ('W', commands[-1][1] + wait)
+                else:
+                    commands.append(('W', wait))
+        return commands
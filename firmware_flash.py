@@ -0,0 +1,227 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Firmware flashing of the mBits
+# -- File       : firmware_flash.py
+# -- Purpose    : Checks the Intel HEX firmware of the mBit Robot and of the transmitter and copies it to the
+# --              micro:bits connected by USB, all of them at the same time, but only to the boards that do not
+# --              have this firmware already.
+# -- Notes      : Usage: python3 firmware_flash.py info microbit-Robot_v12.4.hex
+# --                     python3 firmware_flash.py flash microbit-Robot_v12.4.hex [mount ...] [--force]
+# --              The HEX file is read line by line (never whole in memory) and every record is checked: the
+# --              format, the length and the checksum. The data records (also the records of the micro:bit
+# --              "universal" HEX, 0x0D data and 0x0E custom data, with their block of the board version) are hashed
+# --              with their absolute address, so the hash (SHA-256) is the same for the same firmware whatever the
+# --              line breaks or the order of the extended address records. The version is taken from the name of
+# --              the file (e.g. "_v12.4.hex"); the MakeCode metadata (name and editor version) is read when present.
+# --              A micro:bit appears as a USB drive "MICROBIT" (without mounts the drives are searched in /media,
+# --              /run/media, /Volumes and the drive letters); its file DETAILS.TXT gives the unique ID of the board.
+# --              The hash of the firmware copied to every board is kept in "./settings/flashed.json", by unique ID
+# --              (by folder for a plain folder without DETAILS.TXT, e.g. for testing without a board), so a board
+# --              that already has the firmware is not written again (--force writes it anyway).
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import binascii
+import concurrent.futures
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import string
+
+FLASHED_FILE = './settings/flashed.json'
+DETAILS_FILE = 'DETAILS.TXT'
+RECORD_DATA = 0x00
+RECORD_END = 0x01
+RECORD_SEGMENT = 0x02
+RECORD_LINEAR = 0x04
+RECORD_BLOCK_START = 0x0A  # Universal HEX: the records of one board version follow
+RECORD_BLOCK_END = 0x0B
+RECORD_PADDING = 0x0C
+RECORD_OTHER_DATA = 0x0D  # Universal HEX: data of a board version other than the first
+RECORD_CUSTOM_DATA = 0x0E  # Universal HEX: metadata (e.g. the MakeCode project)
+DATA_RECORDS = (RECORD_DATA, RECORD_OTHER_DATA, RECORD_CUSTOM_DATA)
+VERSION_PATTERN = re.compile(r'[_-]v(\d+(?:\.\d+)*)\.hex$', re.IGNORECASE)
+METADATA_PATTERN = re.compile(rb'\{"compression"[^{}]*\}')
+
+
+class HexError(ValueError):  # A record of the HEX file is not valid
+    def __init__(self, path, line_number, reason):
+        ValueError.__init__(self, path + ':' + str(line_number) + ': ' + reason)
+
+
+def read_records(path):  # Yields (line number, record type, address, data) of every record, checked
+    file_r = open(path, 'rb')
+    try:
+        for line_number, line in enumerate(file_r, 1):
+            line = line.rstrip(b'\r\n')
+            if not line:
+                continue
+            if line[:1] != b':' or len(line) < 11 or len(line) % 2 == 0:
+                raise HexError(path, line_number, 'not an Intel HEX record')
+            try:
+                record = binascii.unhexlify(memoryview(line)[1:])
+            except binascii.Error:
+                raise HexError(path, line_number, 'not hexadecimal')
+            if len(record) != record[0] + 5:
+                raise HexError(path, line_number, 'wrong length')
+            if sum(record) & 0xFF:
+                raise HexError(path, line_number, 'wrong checksum')
+            yield line_number, record[3], (record[1] << 8) | record[2], memoryview(record)[4:-1]
+    finally:
+        file_r.close()
+
+
+def read_firmware(path):  # Returns {'hash', 'version', 'size', 'records', 'blocks', 'metadata'} of a HEX file
+    digest = hashlib.sha256()
+    base = 0  # Upper part of the address, from the extended address records
+    block = b''  # Board version of the universal HEX block, empty in a plain HEX file
+    blocks = []
+    size = 0
+    records = 0
+    metadata = b''
+    ended = False
+    for line_number, record_type, address, data in read_records(path):
+        records += 1
+        if ended:
+            raise HexError(path, line_number, 'record after the end of file')
+        if record_type in DATA_RECORDS:
+            # The kind of data, the board version and the address are hashed with the data
+            digest.update(bytes((record_type == RECORD_CUSTOM_DATA, len(data))) + block +
+                          (base + address).to_bytes(4, 'little'))
+            digest.update(data)
+            if record_type == RECORD_CUSTOM_DATA:
+                metadata += data
+            else:
+                size += len(data)
+        elif record_type == RECORD_LINEAR:
+            base = int.from_bytes(data, 'big') << 16
+        elif record_type == RECORD_SEGMENT:
+            base = int.from_bytes(data, 'big') << 4
+        elif record_type == RECORD_BLOCK_START:
+            block = bytes(data[:2])
+            blocks.append(block.hex().upper())
+            base = 0
+        elif record_type == RECORD_BLOCK_END:
+            block = b''
+        elif record_type == RECORD_END:
+            ended = True
+        elif record_type != RECORD_PADDING and record_type > 0x05:
+            raise HexError(path, line_number, 'unknown record type ' + str(record_type))
+    if not ended:
+        raise HexError(path, records, 'no end of file record')
+    version = VERSION_PATTERN.search(os.path.basename(path))
+    project = METADATA_PATTERN.search(metadata)
+    try:
+        project = json.loads(project.group().decode('utf-8')) if project else {}
+    except ValueError:
+        project = {}
+    return {'hash': digest.hexdigest(), 'version': version.group(1) if version else None, 'size': size,
+            'records': records, 'blocks': blocks,
+            'metadata': {key: project[key] for key in ('name', 'eVER', 'pxtTarget') if key in project}}
+
+
+def find_mounts():  # The folders of the micro:bit USB drives that are mounted
+    candidates = glob.glob('/media/*/MICROBIT*') + glob.glob('/run/media/*/MICROBIT*') + glob.glob('/media/MICROBIT*')
+    candidates += glob.glob('/Volumes/MICROBIT*')
+    if os.name == 'nt':
+        candidates += [letter + ':\\' for letter in string.ascii_uppercase[3:]]
+    return sorted(path for path in candidates if os.path.isfile(os.path.join(path, DETAILS_FILE)))
+
+
+def board_id(mount):  # The unique ID of the board in DETAILS.TXT, or the folder itself for a plain folder
+    try:
+        file_r = open(os.path.join(mount, DETAILS_FILE), 'r', errors='replace')
+        details = file_r.read()
+        file_r.close()
+    except OSError:
+        return 'folder:' + os.path.realpath(mount)
+    for line in details.splitlines():
+        name, _, value = line.partition(':')
+        if name.strip().lower() == 'unique id' and value.strip():
+            return value.strip()
+    return 'folder:' + os.path.realpath(mount)
+
+
+def read_flashed(path=FLASHED_FILE):  # {board id: {'hash', 'version', 'file'}} of the firmware copied to every board
+    if not os.path.exists(path):
+        return {}
+    file_r = open(path, 'r')
+    try:
+        return json.load(file_r)
+    except ValueError:  # A damaged file only means that the boards are written again
+        return {}
+    finally:
+        file_r.close()
+
+
+def write_flashed(flashed, path=FLASHED_FILE):
+    file_w = open(path + '.tmp', 'w')
+    json.dump(flashed, file_w, indent=1, sort_keys=True)
+    file_w.close()
+    os.replace(path + '.tmp', path)
+
+
+def copy_firmware(path, mount):  # Copies the HEX file to the drive and waits until it is really written
+    target = os.path.join(mount, os.path.basename(path))
+    file_r = open(path, 'rb')
+    file_w = open(target, 'wb')
+    try:
+        shutil.copyfileobj(file_r, file_w, 64 * 1024)
+        file_w.flush()
+        os.fsync(file_w.fileno())
+    finally:
+        file_w.close()
+        file_r.close()
+
+
+def flash(path, mounts=None, force=False, flashed_path=FLASHED_FILE, workers=8):
+    # Copies the firmware to every mount whose board does not have it. Returns {mount: 'flashed', 'up to date' or
+    # the text of the error}
+    firmware = read_firmware(path)  # Checked before anything is written to a board
+    mounts = find_mounts() if mounts is None else list(mounts)
+    flashed = read_flashed(flashed_path)
+    boards = {mount: board_id(mount) for mount in mounts}
+    to_flash = [mount for mount in mounts if force or flashed.get(boards[mount], {}).get('hash') != firmware['hash']]
+    results = {mount: 'up to date' for mount in mounts if mount not in to_flash}
+    if to_flash:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(to_flash))) as executor:
+            copies = {mount: executor.submit(copy_firmware, path, mount) for mount in to_flash}
+            for mount, copy in copies.items():
+                try:
+                    copy.result()
+                except OSError as error:
+                    results[mount] = str(error)
+                    continue
+                results[mount] = 'flashed'
+                flashed[boards[mount]] = {'hash': firmware['hash'], 'version': firmware['version'],
+                                          'file': os.path.basename(path)}
+        write_flashed(flashed, flashed_path)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description='Checks and flashes the Intel HEX firmware of the micro:bits')
+    parser.add_argument('action', choices=('info', 'flash'))
+    parser.add_argument('hex_file')
+    parser.add_argument('mounts', nargs='*', help='folders of the micro:bit drives, found automatically if not given')
+    parser.add_argument('--force', action='store_true', help='write the boards that already have the firmware')
+    args = parser.parse_args()
+    try:
+        if args.action == 'info':
+            print(json.dumps(read_firmware(args.hex_file), indent=1, ensure_ascii=False))
+        else:
+            results = flash(args.hex_file, args.mounts or None, args.force)
+            if not results:
+                sys.exit('Δεν βρέθηκε συνδεδεμένο micro:bit')
+            for mount, result in sorted(results.items()):
+                print(mount + ': ' + result)
+            if any(result not in ('flashed', 'up to date') for result in results.values()):
+                sys.exit(1)
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
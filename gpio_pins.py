@@ -0,0 +1,252 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : GPIO pin state layer
+# -- File       : gpio_pins.py
+# -- Purpose    : Shared layer between the light scripts and the GPIO hardware. It keeps the last value written
+# --              to every pin, writes only the pins that changed and groups the writes per bank, so every phase
+# --              of the lights costs as few GPIO calls as possible.
+# -- Notes      : The backend is selected with the environment variable GPIO_BACKEND:
+# --                rpi   : RPi.GPIO library (default)
+# --                gpiod : libgpiod character device (/dev/gpiochipN, chip selected with GPIO_CHIP)
+# --                mock  : in-memory backend that records every write with a timestamp, for counting and
+# --                        benchmarking the GPIO traffic on a normal Linux box
+# --              PinState.output() has the same arguments as GPIO.output() (one pin or a list of pins, one value
+# --              or a list of values), so it can be given directly to the traffic scheduler.
+# --              PinState.set_duty() dims a pin (0.0 - 1.0). The rpi backend uses the hardware PWM of the pins
+# --              12, 13, 18 and 19 when it is enabled in /sys/class/pwm, otherwise the software PWM of RPi.GPIO.
+# --              The gpiod backend has no PWM, so it only turns the pin on (duty >= 0.5) or off.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Raspberry Pi OS (rpi, gpiod), any OS (mock)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import os
+import threading
+import time
+
+
+HARDWARE_PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}  # BCM pin: channel of /sys/class/pwm/pwmchip0
+HARDWARE_PWM_CHIP = '/sys/class/pwm/pwmchip0'
+PWM_FREQUENCY = 200  # Hz, high enough for the leds not to flicker
+
+
+class HardwarePWM:  # One channel of the hardware PWM, through the sysfs interface
+    def __init__(self, channel, frequency=PWM_FREQUENCY):
+        self.path = HARDWARE_PWM_CHIP + '/pwm' + str(channel)
+        if not os.path.exists(self.path):
+            with open(HARDWARE_PWM_CHIP + '/export', 'w') as file_w:
+                file_w.write(str(channel))
+        self.period = int(1e9 / frequency)
+        self._write('period', self.period)
+        self._write('duty_cycle', 0)
+        self._write('enable', 1)
+
+    def _write(self, name, value):
+        with open(self.path + '/' + name, 'w') as file_w:
+            file_w.write(str(value))
+
+    def set_duty(self, duty):
+        self._write('duty_cycle', int(self.period * duty))
+
+    def stop(self):
+        self._write('enable', 0)
+
+
+class SoftwarePWM:  # PWM of RPi.GPIO, timed by a thread of the C library
+    def __init__(self, GPIO, pin, frequency=PWM_FREQUENCY):
+        self.pwm = GPIO.PWM(pin, frequency)
+        self.pwm.start(0)
+
+    def set_duty(self, duty):
+        self.pwm.ChangeDutyCycle(duty * 100)
+
+    def stop(self):
+        self.pwm.stop()
+
+
+class RPiGPIOBackend:
+    name = 'rpi'
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+        self.pwm = {}  # pin: HardwarePWM or SoftwarePWM
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+
+    def bank_of(self, pin):  # The BCM283x SET/CLR registers hold 32 pins each
+        return pin // 32
+
+    def setup(self, pins):
+        self.GPIO.setup(pins, self.GPIO.OUT)
+
+    def write(self, bank, pins, values):
+        self.GPIO.output(pins, values)
+
+    def set_duty(self, pin, duty):
+        pwm = self.pwm.get(pin)
+        if pwm is None:
+            if pin in HARDWARE_PWM_CHANNELS and os.path.exists(HARDWARE_PWM_CHIP):
+                pwm = HardwarePWM(HARDWARE_PWM_CHANNELS[pin])
+            else:
+                pwm = SoftwarePWM(self.GPIO, pin)
+            self.pwm[pin] = pwm
+        pwm.set_duty(duty)
+
+    def stop_pwm(self, pin):
+        pwm = self.pwm.pop(pin, None)
+        if pwm is not None:
+            pwm.stop()
+            self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def cleanup(self):
+        for pin in list(self.pwm):
+            self.stop_pwm(pin)
+        self.GPIO.cleanup()
+
+
+class GpiodBackend:
+    name = 'gpiod'
+
+    def __init__(self, chip=None):
+        import gpiod
+        self.gpiod = gpiod
+        self.chip = chip or os.environ.get('GPIO_CHIP', '/dev/gpiochip0')
+        self.request = None
+        self.offsets = []
+
+    def bank_of(self, pin):  # All the pins of one character device are set with one ioctl
+        return self.chip
+
+    def setup(self, pins):
+        if self.request is not None:
+            self.request.release()
+        self.offsets = sorted(set(self.offsets) | set(pins))
+        gpiod = self.gpiod
+        if hasattr(gpiod, 'request_lines'):  # libgpiod v2 bindings
+            settings = gpiod.LineSettings(direction=gpiod.line.Direction.OUTPUT)
+            self.request = gpiod.request_lines(self.chip, consumer='platform-lights',
+                                               config={tuple(self.offsets): settings})
+        else:  # libgpiod v1 bindings
+            self.request = gpiod.Chip(self.chip).get_lines(self.offsets)
+            self.request.request(consumer='platform-lights', type=gpiod.LINE_REQ_DIR_OUT)
+
+    def write(self, bank, pins, values):
+        gpiod = self.gpiod
+        if hasattr(gpiod, 'request_lines'):
+            active = gpiod.line.Value.ACTIVE
+            inactive = gpiod.line.Value.INACTIVE
+            self.request.set_values({pin: active if value else inactive for pin, value in zip(pins, values)})
+        else:  # v1 can only set all the requested lines at once, unchanged lines get their current value
+            current = dict(zip(self.offsets, self.request.get_values()))
+            current.update(zip(pins, values))
+            self.request.set_values([int(current[offset]) for offset in self.offsets])
+
+    def set_duty(self, pin, duty):
+        self.write(self.chip, [pin], [duty >= 0.5])
+
+    def stop_pwm(self, pin):
+        pass
+
+    def cleanup(self):
+        if self.request is not None:
+            self.request.release()
+            self.request = None
+
+
+class MockBackend:
+    name = 'mock'
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.pins = set()
+        self.writes = []  # (timestamp, bank, pins, values) for every write call
+
+    def bank_of(self, pin):
+        return pin // 32
+
+    def setup(self, pins):
+        self.pins.update(pins)
+
+    def write(self, bank, pins, values):
+        self.writes.append((self.clock(), bank, tuple(pins), tuple(values)))
+
+    def set_duty(self, pin, duty):
+        self.writes.append((self.clock(), self.bank_of(pin), (pin,), (duty,)))
+
+    def stop_pwm(self, pin):
+        pass
+
+    def cleanup(self):
+        pass
+
+
+BACKENDS = {'rpi': RPiGPIOBackend, 'gpiod': GpiodBackend, 'mock': MockBackend}
+
+
+def open_backend(name=None):
+    name = name or os.environ.get('GPIO_BACKEND', 'rpi')
+    if name not in BACKENDS:
+        raise ValueError('Unknown GPIO backend "' + name + '", use one of: ' + ', '.join(BACKENDS))
+    return BACKENDS[name]()
+
+
+class PinState:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else open_backend()
+        self.values = {}  # Last value written to every pin, missing until the first write
+        self.duties = {}  # Last duty of the pins that are dimmed with PWM
+        self.lock = threading.Lock()
+        self.write_calls = 0  # Number of calls to the backend
+        self.pin_writes = 0  # Number of pins actually written
+
+    def setup(self, pins):
+        self.backend.setup(list(pins))
+
+    def output(self, pins, values):
+        if isinstance(pins, int):
+            pins = [pins]
+        if not isinstance(values, (list, tuple)):
+            values = [values] * len(pins)
+        with self.lock:
+            banks = {}
+            for pin, value in zip(pins, values):
+                value = bool(value)
+                if pin in self.duties:  # The pin stops being dimmed
+                    del self.duties[pin]
+                    self.backend.stop_pwm(pin)
+                    self.values.pop(pin, None)
+                if self.values.get(pin) is value:
+                    continue
+                self.values[pin] = value
+                bank = banks.setdefault(self.backend.bank_of(pin), ([], []))
+                bank[0].append(pin)
+                bank[1].append(value)
+            for bank, (bank_pins, bank_values) in banks.items():
+                self.backend.write(bank, bank_pins, bank_values)
+                self.write_calls += 1
+                self.pin_writes += len(bank_pins)
+
+    def set_duty(self, pin, duty):  # 0.0 is off, 1.0 is fully on, anything in between uses PWM
+        duty = min(1.0, max(0.0, float(duty)))
+        if pin not in self.duties and duty in (0.0, 1.0):
+            self.output(pin, duty == 1.0)
+            return
+        with self.lock:
+            if self.duties.get(pin) == duty:
+                return
+            self.duties[pin] = duty
+            self.values[pin] = duty > 0.0
+            self.backend.set_duty(pin, duty)
+            self.write_calls += 1
+            self.pin_writes += 1
+
+    def get(self, pin):
+        return self.values.get(pin, False)
+
+    def cleanup(self):
+        with self.lock:
+            for pin in list(self.duties):
+                self.backend.stop_pwm(pin)
+            self.duties.clear()
+            self.values.clear()
+            self.backend.cleanup()
@@ -0,0 +1,107 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Green wave
+# -- File       : green_wave.py
+# -- Purpose    : Times the release of the moves of a program, so that the robot reaches every crossing with
+# --              traffic lights on green, instead of running the red light or stopping for a whole cycle.
+# -- Notes      : The live phase schedule is asked from the lights daemon ("traffic schedule", the seconds since
+# --              the phases started), the phases themselves come from the same "./settings/intersections.json"
+# --              as the daemon, with the "cell" and the "green" lights of every intersection (traffic_scheduler.py).
+# --              The program is followed cell by cell from the 'Από' field with the estimated durations of the
+# --              moves (robot_commands.estimate_duration()), which gives the arrival time at every crossing. When
+# --              the light of the robot's axis will not be green then (for at least the time to cross one cell),
+# --              a wait ('W', milliseconds) is put before the move, so the robot leaves exactly when it will find
+# --              the green. A forward move through two crossings is split before the second one if only the
+# --              second needs a wait, so the first crossing keeps its green.
+# --              The signal offsets themselves are never moved: a shift of the cycle could cut a yellow light
+# --              short while children are crossing the platform.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import time
+
+from platform_map import MOVES
+from robot_commands import estimate_duration
+
+SCHEDULE_ANSWER = 'OK elapsed='
+
+
+def read_elapsed(lights, clock=time.monotonic):  # Seconds since the phases started, None if they do not cycle
+    sent = clock()
+    answer = lights.send('traffic schedule')
+    received = clock()
+    if answer is None or not answer.startswith(SCHEDULE_ANSWER) or answer.endswith('none'):
+        return None
+    return float(answer[len(SCHEDULE_ANSWER):]) + (received - sent) / 2  # The answer was made half way
+
+
+class GreenWave:
+    def __init__(self, intersections, fb_factor, lr_factor, margin=0.2):
+        self.signals = {intersection.cell: intersection for intersection in intersections
+                        if intersection.cell is not None and intersection.green}
+        self.fb_factor = int(fb_factor)
+        self.lr_factor = int(lr_factor)
+        self.margin = margin  # Seconds of safety for the radio and the timing of the motors
+        self.cell_time = self.fb_factor / 1000.0  # Seconds to move by one cell
+
+    def _wait(self, intersection, elapsed, axis):  # Whole milliseconds to wait before entering, with the margin
+        wait = intersection.green_wait(elapsed, axis, self.cell_time + self.margin)
+        return int(round((wait + self.margin) * 1000)) if wait > 0 else 0
+
+    def time_release(self, commands, start, elapsed, sources=None):
+        # commands: (direction, factored steps) as for program_runner.ProgramRunner, start: (row, column, heading),
+        # elapsed: read_elapsed() when the program starts. Returns (commands with the waits, [(intersection name,
+        # arrival in seconds after the start, wait in seconds)]), and with "sources" (e.g. the row of the program
+        # of every command) also the source of every timed command (a wait has the source of its move)
+        row, column, heading = start
+        now = 0.0  # Seconds after the start of the program
+        timed = []
+        crossings = []
+        timed_sources = []
+        for number, (direction, steps) in enumerate(commands):
+            if sources is not None:  # The source of the entries added for the previous command
+                timed_sources.extend([sources[number - 1]] * (len(timed) - len(timed_sources)))
+            if direction == 'W':
+                timed.append((direction, steps))
+                now += steps / 1000.0
+                continue
+            cells = int(round(steps / float(self.fb_factor))) if direction in ('F', 'B') and self.fb_factor else 0
+            if cells == 0:
+                if direction in ('L', 'R') and self.lr_factor:
+                    turns = int(round(steps / float(self.lr_factor)))
+                    heading = (heading + (turns if direction == 'R' else -turns)) % 4
+                timed.append((direction, steps))
+                now += estimate_duration(direction, steps)
+                continue
+            move = MOVES[heading if direction == 'F' else (heading + 2) % 4]
+            axis = 'NS' if heading % 2 == 0 else 'EW'
+            segment_cells = 0  # Cells of the part of the move that is not sent yet
+            segment_crossed = False  # The part already goes through a crossing with traffic lights
+            for cell in range(cells):
+                row, column = row + move[0], column + move[1]
+                segment_cells += 1
+                intersection = self.signals.get((row, column))
+                if intersection is None:
+                    continue
+                arrival = now + (segment_cells - 0.5) * self.cell_time
+                wait = self._wait(intersection, elapsed + arrival, axis)
+                if wait and segment_crossed:  # The crossing before keeps its green, the move stops before this one
+                    before = (segment_cells - 1) * self.fb_factor
+                    timed.append((direction, before))
+                    now += estimate_duration(direction, before)
+                    segment_cells = 1
+                    arrival = now + 0.5 * self.cell_time
+                    wait = self._wait(intersection, elapsed + arrival, axis)
+                if wait:
+                    timed.append(('W', wait))
+                    now += wait / 1000.0
+                crossings.append((intersection.name, arrival + wait / 1000.0, wait / 1000.0))
+                segment_crossed = True
+            last = segment_cells * self.fb_factor + steps - cells * self.fb_factor  # With the steps of a part cell
+            timed.append((direction, last))
+            now += estimate_duration(direction, last)
+        if sources is not None:
+            timed_sources.extend([sources[-1]] * (len(timed) - len(timed_sources)))
+            return timed, crossings, timed_sources
+        return timed, crossings
@@ -0,0 +1,209 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Robot and Platform controller without a GUI
+# -- File       : headless_controller.py
+# -- Purpose    : Controls the mBit Robot and the platform lights from a terminal (e.g. over SSH), without
+# --              loading Tk. It uses the same frames, step factors, serial transport and lights daemon as
+# --              SystemController.py.
+# -- Notes      : Usage: python3 headless_controller.py [--port /dev/ttyACM0] [--script moves.txt | --keys]
+# --              Without --port the transmitter is found by "port_discovery.py".
+# --              The commands are read one per line from the script file or the standard input:
+# --                F 3 | B 1 | L 1 | R 2   move, in steps of the tab 'Συντελεστές κίνησης' (1 if no number)
+# --                W 500                   wait 500 ms
+# --                traffic on | lights off | lights mode breathe | ...   (commands of "lights_daemon.py")
+# --                status                  queue and latency of the serial transport
+# --                quit
+# --              Empty lines and lines starting with '#' are ignored. The moves are paced to the estimated
+# --              execution of the robot, as in the tab 'Πρόγραμμα'.
+# --              With --keys the terminal is put in raw mode and the arrow keys move the robot one step, as in
+# --              the tab 'Πληκτρολόγιο' (with the same merging of the repeated keys); 't' and 'l' switch the
+# --              traffic lights and the led lights, 'q' exits.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Raspberry Pi OS / Linux (any OS without --keys)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import os
+import select
+import sys
+import time
+
+from lights_client import LightsClient
+from link_protocol import AckedLink, read_protocol_setting
+from robot_commands import encode_command, estimate_duration
+
+ARROWS = {b'\x1b[A': 'F', b'\x1b[B': 'B', b'\x1b[D': 'L', b'\x1b[C': 'R'}
+
+
+class TimerLoop:  # The after()/after_cancel() of a Tk window, for the objects that need them without Tk
+    def __init__(self):
+        self.timers = {}
+        self.next_id = 0
+
+    def after(self, ms, function):
+        self.next_id += 1
+        self.timers[self.next_id] = (time.perf_counter() + ms / 1000.0, function)
+        return self.next_id
+
+    def after_cancel(self, timer_id):
+        self.timers.pop(timer_id, None)
+
+    def run_due(self):  # Calls the timers that are due, returns the seconds until the next one (or None)
+        while self.timers:
+            timer_id, (when, function) = min(self.timers.items(), key=lambda item: item[1][0])
+            wait = when - time.perf_counter()
+            if wait > 0:
+                return wait
+            del self.timers[timer_id]
+            function()
+        return None
+
+
+def read_factor(name):
+    file_r = open('./settings/' + name + '_factor.dat', 'r')
+    value = int(file_r.read())
+    file_r.close()
+    return value
+
+
+def open_transport(port):  # port None: the first transmitter found by "port_discovery.py"
+    from port_discovery import discover, make_reconnect, open_serial
+    from serial_transport import SerialTransport
+    if port is None:
+        found = discover()
+        port = found[0] if found else '/dev/ttyACM0'
+    serial_port = open_serial(port)
+    if read_protocol_setting() == 'acked':
+        return AckedLink(serial_port, reconnect=make_reconnect(port))
+    return SerialTransport(serial_port, reconnect=make_reconnect(port))
+
+
+class HeadlessController:
+    def __init__(self, transport, lights, fb_factor, lr_factor, output=print, lead=0.1, clock=time.monotonic):
+        self.transport = transport
+        self.lights = lights
+        self.fb_factor = fb_factor
+        self.lr_factor = lr_factor
+        self.output = output
+        self.lead = lead  # The next move is sent this much before the robot is estimated to finish
+        self.clock = clock
+        self.busy_until = 0.0
+
+    def move(self, direction, steps):  # steps: user steps, the factor is applied here
+        factor = self.fb_factor if direction in ('F', 'B') else self.lr_factor
+        wait = self.busy_until - self.lead - self.clock()
+        if wait > 0:
+            time.sleep(wait)
+        frame = encode_command(direction, steps * factor)
+        while not self.transport.send(frame):  # The serial queue is full
+            time.sleep(0.01)
+        self.busy_until = max(self.clock(), self.busy_until) + estimate_duration(direction, steps * factor)
+        self.output('OK ' + frame.decode('ascii').strip())
+
+    def execute(self, line):  # Returns False when the line asks to stop
+        line = line.strip()
+        if not line or line.startswith('#'):
+            return True
+        words = line.split()
+        first = words[0].upper()
+        if first == 'QUIT':
+            return False
+        if first == 'STATUS':
+            stats = self.transport.stats()
+            self.output('queue=' + str(stats['queue_depth']) + ' sent=' + str(stats['sent_frames']) +
+                        ' dropped=' + str(stats['dropped_frames']) + ' latency=' +
+                        str(round(stats['last_latency'] * 1000, 1)) + 'ms')
+        elif first in ('TRAFFIC', 'LIGHTS', 'ALL'):
+            answer = self.lights.send(line.lower())
+            self.output(answer if answer is not None else 'ERR no lights daemon')
+        elif first in ('F', 'B', 'L', 'R', 'W'):
+            if len(words) > 2 or (len(words) == 2 and not words[1].isdigit()):
+                self.output('ERR ' + line)
+            elif first == 'W':
+                time.sleep(int(words[1]) / 1000.0 if len(words) == 2 else 0.0)
+            else:
+                self.move(first, int(words[1]) if len(words) == 2 else 1)
+        else:
+            self.output('ERR unknown command: ' + line)
+        return True
+
+    def run_lines(self, lines):
+        for line in lines:
+            if not self.execute(line):
+                return
+
+    def run_keys(self, fd=None):  # Arrow keys of a terminal in raw mode
+        import termios
+        import tty
+        from key_coalescer import KeyCoalescer
+        fd = sys.stdin.fileno() if fd is None else fd
+        timers = TimerLoop()
+        coalescer = KeyCoalescer(self.transport, timers)
+        switches = {b't': ['traffic', False], b'l': ['lights', False]}
+        saved = termios.tcgetattr(fd)
+        tty.setraw(fd)
+        try:
+            self.output('Βελάκια: κίνηση, t: φανάρια, l: φώτα, q: έξοδος\r')
+            received = b''
+            while True:
+                wait = timers.run_due()
+                readable, _, _ = select.select([fd], [], [], 0.5 if wait is None else wait)
+                if not readable:
+                    continue
+                received += os.read(fd, 64)
+                while received:
+                    if received[:3] in ARROWS:
+                        direction = ARROWS[received[:3]]
+                        coalescer.press(direction, self.fb_factor if direction in ('F', 'B') else self.lr_factor)
+                        received = received[3:]
+                    elif received[:1] in (b'q', b'\x03'):  # q or Ctrl-C
+                        return
+                    elif received[:1] in switches:
+                        switch = switches[received[:1]]
+                        switch[1] = not switch[1]
+                        answer = self.lights.send(switch[0] + (' on' if switch[1] else ' off'))
+                        self.output((answer if answer is not None else 'ERR no lights daemon') + '\r')
+                        received = received[1:]
+                    elif received.startswith(b'\x1b') and len(received) < 3:  # The rest of the sequence follows
+                        break
+                    else:
+                        received = received[1:]
+        finally:
+            coalescer.flush(force=True)
+            termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Controls the mBit Robot and the platform lights without a GUI')
+    parser.add_argument('--port', default=os.environ.get('SC_PORT'),
+                        help='serial port of the transmitter mBit, found automatically if not given')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--script', help='file with one command per line')
+    group.add_argument('--keys', action='store_true', help='arrow keys of the terminal')
+    parser.add_argument('--no-daemon', action='store_true', help='do not start the lights daemon')
+    args = parser.parse_args()
+    try:
+        transport = open_transport(args.port)
+    except (OSError, ImportError) as error:  # serial.SerialException is an OSError
+        sys.exit('Δεν είναι συνδεδεμένο το mBit για την αποστολή εντολών (' + str(error) + ')')
+    lights = LightsClient()
+    if not args.no_daemon:
+        lights.ensure_daemon()
+    controller = HeadlessController(transport, lights, read_factor('fb'), read_factor('lr'))
+    try:
+        if args.keys:
+            controller.run_keys()
+        elif args.script:
+            script_file = open(args.script, 'r', encoding='utf-8')
+            controller.run_lines(script_file)
+            script_file.close()
+        else:
+            controller.run_lines(sys.stdin)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transport.close(timeout=5)
+        if lights.daemon_process is not None:  # Only turn off the lights of the daemon we started, not a shared one
+            lights.shutdown()
+        else:
+            lights.close()
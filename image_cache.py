@@ -0,0 +1,45 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Cache of the scaled images
+# -- File       : image_cache.py
+# -- Purpose    : The images of the buttons are drawn at a half or a third of the size of their PNG files. Decoding
+# --              the full PNG and calling subsample() at every start is slow on a Raspberry Pi, so the scaled
+# --              image is written once to "./images/cache/" and the small file is loaded from then on.
+# -- Notes      : The name of a cached file is the SHA-1 of the source PNG and the scale, so a changed image gets
+# --              a new cached file on its own. Any problem with the cache (read-only folder, damaged file) only
+# --              means that the image is scaled again, as before.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any (Tk 8.6 for writing PNG files)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import hashlib
+import os
+from tkinter import PhotoImage, TclError
+
+CACHE_FOLDER = './images/cache'
+
+
+def cached_path(path, scale, folder=CACHE_FOLDER):
+    file_r = open(path, 'rb')
+    digest = hashlib.sha1(file_r.read()).hexdigest()
+    file_r.close()
+    return os.path.join(folder, digest + '-' + str(scale) + '.png')
+
+
+def scaled_image(path, scale, folder=CACHE_FOLDER):  # Same as PhotoImage(file=path).subsample(scale, scale)
+    cached = cached_path(path, scale, folder)
+    if os.path.exists(cached):
+        try:
+            return PhotoImage(file=cached)
+        except TclError:  # Damaged file, it is written again below
+            pass
+    image = PhotoImage(file=path).subsample(scale, scale)
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        temporary = cached + '.tmp'
+        image.write(temporary, format='png')
+        os.replace(temporary, cached)  # Another instance never sees a half-written file
+    except (OSError, TclError):
+        pass
+    return image
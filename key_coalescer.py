@@ -0,0 +1,149 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Key-repeat coalescing
+# -- File       : key_coalescer.py
+# -- Purpose    : Merges the presses of the same arrow key (e.g. the auto-repeat of a held key) that arrive within
+# --              a short window into one movement command, so the serial link and the radio are not flooded and
+# --              the robot stops soon after the key is released.
+# -- Notes      : The robot is not given more than "max_ahead" seconds of movement that it has not executed yet
+# --              (see robot_commands.estimate_duration()), counting the commands already sent and the pending
+# --              one. While the robot is busy, or the serial queue is full, the presses keep being merged into
+# --              the pending command; presses beyond that limit are dropped.
+# --              When a held key is released, the pending command and the frames sent for that key that are
+# --              still queued are cancelled (a short tap is always sent), but never the frames of others (e.g.
+# --              the program runner), and if the robot is still moving, a stop ('S') is sent. The GUI buttons
+# --              have no release event, so their presses (held=False) never count as a held key.
+# --              The robot still counts as busy until the commands that were already written end. A release that
+# --              is followed at once by a press of the same key is auto-repeat (X11 sends both) and is ignored.
+# --              The timers use the after()/after_cancel() of the Tk window given as "scheduler".
+# --              With a telemetry.Telemetry, every press is traced and the time from the first press of a command
+# --              until it is queued goes to the histogram "press_to_enqueue".
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import time
+
+from robot_commands import encode_command, estimate_duration
+
+
+class KeyCoalescer:
+    def __init__(self, transport, scheduler, window=0.15, release_delay=0.05, max_ahead=1.0, clock=time.monotonic,
+                 telemetry=None):
+        self.transport = transport  # serial_transport.SerialTransport
+        self.scheduler = scheduler  # Tk window (after and after_cancel)
+        self.window = window
+        self.release_delay = release_delay
+        self.max_ahead = max_ahead
+        self.clock = clock
+        self.pending_direction = None
+        self.pending_steps = 0
+        self.pending_since = 0.0  # Time of the first press merged into the pending command
+        self.flush_id = None
+        self.release_id = None
+        self.hold_direction = None  # The key that is held down
+        self.hold_sent = 0  # Commands sent since that key was pressed
+        self.hold_frames = []  # (frame, estimated duration) of those commands, oldest first
+        self.busy_until = 0.0  # Estimated time that the robot finishes the commands already sent
+        self.merged_presses = 0
+        self.dropped_presses = 0
+        self.telemetry = telemetry
+
+    def _after(self, seconds, function):
+        return self.scheduler.after(max(1, int(seconds * 1000)), function)
+
+    def press(self, direction, steps, held=True):  # held: False for a GUI button, which has no release event
+        steps = int(steps)
+        if self.telemetry is not None:
+            self.telemetry.event('key', 'press', direction + str(steps))
+        if self.release_id is not None:  # Auto-repeat, or a new key before the release was handled
+            self.scheduler.after_cancel(self.release_id)
+            self.release_id = None
+        if held and self.hold_direction != direction:
+            self.hold_direction = direction
+            self.hold_sent = 0
+            self.hold_frames = []
+        if self.pending_direction is not None and self.pending_direction != direction:
+            self.flush(force=True)
+        ahead = max(0.0, self.busy_until - self.clock())  # Movement sent that the robot has not executed yet
+        if ahead + estimate_duration(direction, self.pending_steps + steps) > self.max_ahead:
+            self.dropped_presses += 1  # The robot could not keep up with this press
+            if self.telemetry is not None:
+                self.telemetry.event('key', 'drop', direction + str(steps))
+            return
+        if self.pending_direction == direction:
+            self.merged_presses += 1
+        else:
+            self.pending_since = self.clock()
+        self.pending_direction = direction
+        self.pending_steps += steps
+        if self.flush_id is None:
+            self.flush_id = self._after(self.window, self.flush)
+
+    def flush(self, force=False):  # Sends the pending command, unless the robot or the serial queue is busy
+        if self.flush_id is not None:
+            self.scheduler.after_cancel(self.flush_id)
+            self.flush_id = None
+        if self.pending_direction is None:
+            return
+        now = self.clock()
+        ahead = self.busy_until - now
+        if not self.transport.is_full() and (force or ahead <= self.max_ahead - self.window):
+            frame = encode_command(self.pending_direction, self.pending_steps)
+            if self.transport.send(frame):
+                duration = estimate_duration(self.pending_direction, self.pending_steps)
+                self.busy_until = max(now, self.busy_until) + duration
+                if self.pending_direction == self.hold_direction:
+                    self.hold_sent += 1
+                    self.hold_frames.append((frame, duration))
+                if self.telemetry is not None:
+                    self.telemetry.observe('press_to_enqueue', now - self.pending_since)
+                self.pending_direction = None
+                self.pending_steps = 0
+                return
+        if force:  # A different key was pressed and there is no room for this command, so it is dropped
+            self.dropped_presses += 1
+            if self.telemetry is not None:
+                self.telemetry.event('key', 'drop', self.pending_direction + str(self.pending_steps))
+            self.pending_direction = None
+            self.pending_steps = 0
+            return
+        self.flush_id = self._after(max(self.window, ahead - self.max_ahead + self.window), self.flush)
+
+    def release(self, direction):
+        if self.release_id is not None:
+            self.scheduler.after_cancel(self.release_id)
+        self.release_id = self._after(self.release_delay, lambda: self._released(direction))
+
+    def _released(self, direction):  # The key was really released, cancel the motion that was not sent yet
+        self.release_id = None
+        if self.hold_direction != direction:
+            return
+        if self.telemetry is not None:
+            self.telemetry.event('key', 'release', direction)
+        self.hold_direction = None
+        if self.hold_sent == 0:  # A short tap, it must move the robot
+            self.flush(force=True)
+            return
+        if self.pending_direction == direction:
+            if self.flush_id is not None:
+                self.scheduler.after_cancel(self.flush_id)
+                self.flush_id = None
+            self.pending_direction = None
+            self.pending_steps = 0
+        own = {id(frame): duration for frame, duration in self.hold_frames}  # Not the frames of a program
+        discarded = []
+
+        def match(frame):
+            if id(frame) in own:
+                discarded.append(own[id(frame)])
+                return True
+            return False
+        self.transport.discard(match)
+        self.busy_until -= sum(discarded)  # These commands will not run, the ones already written still do
+        self.hold_frames = []
+        if self.busy_until > self.clock() and self.transport.send(encode_command('S', 0)):
+            self.busy_until += estimate_duration('S', 0)
+
+    def stats(self):
+        return {'merged_presses': self.merged_presses, 'dropped_presses': self.dropped_presses}
@@ -0,0 +1,111 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Light pattern engine
+# -- File       : light_patterns.py
+# -- Purpose    : Plays lighting patterns (steady, dimmed, blink, fade, breathe) on the pins of the platform.
+# --              A pattern is a generator that yields (duty, hold) pairs: the duty of the pin (0.0 - 1.0) and
+# --              for how many seconds to keep it, or None to keep it forever.
+# -- Notes      : One thread plays all the pins. It sleeps until the earliest deadline of all the patterns, and
+# --              when no pattern has a deadline (only steady lights) it blocks without using any CPU.
+# --              The deadlines are computed by adding the hold time to the previous deadline, so the patterns
+# --              do not drift.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any (the pins are written through gpio_pins.PinState)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import threading
+import time
+
+
+def steady(duty=1.0):  # The pin is set once and kept
+    yield duty, None
+
+
+def blink(on_time=0.5, off_time=0.5, duty=1.0):
+    while True:
+        yield duty, on_time
+        yield 0.0, off_time
+
+
+def ramp(start, end, duration, steps=25):  # The steps of a fade, without the final value
+    for step in range(steps):
+        yield start + (end - start) * step / steps, duration / steps
+
+
+def fade(start=0.0, end=1.0, duration=2.0, steps=25):  # Fades once and keeps the final value
+    yield from ramp(start, end, duration, steps)
+    yield end, None
+
+
+def breathe(period=4.0, low=0.05, high=1.0, steps=25):  # Fades up and down for ever
+    while True:
+        yield from ramp(low, high, period / 2, steps)
+        yield from ramp(high, low, period / 2, steps)
+
+
+# The patterns that can be selected by name, e.g. by the "lights mode" command of the lights daemon
+PATTERNS = {
+    'steady': steady,
+    'dim': lambda: steady(0.3),
+    'blink': blink,
+    'fade': fade,
+    'breathe': breathe,
+}
+
+
+class PatternEngine:
+    def __init__(self, pins, clock=time.monotonic):
+        self.pins = pins  # gpio_pins.PinState
+        self.clock = clock
+        self.channels = {}  # pin: [deadline, pattern generator]
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def play(self, pin, pattern):  # Starts a pattern on the pin, replacing the one that was playing
+        with self.lock:
+            self.channels[pin] = [self.clock(), pattern]
+            if self.thread is None:
+                self.running = True
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+
+    def stop(self, pin, duty=0.0):  # Stops the pattern of the pin and leaves the pin at the given duty
+        with self.lock:
+            self.channels.pop(pin, None)
+            self.pins.set_duty(pin, duty)
+
+    def close(self):
+        with self.lock:
+            self.running = False
+            self.channels.clear()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _step(self, now):  # Plays every step that is due, returns the time until the next deadline or None
+        with self.lock:
+            for pin in list(self.channels):
+                channel = self.channels[pin]
+                while channel[0] <= now:
+                    duty, hold = next(channel[1], (None, None))
+                    if duty is not None:
+                        self.pins.set_duty(pin, duty)
+                    if hold is None:  # The pattern ended, the pin keeps its last duty
+                        del self.channels[pin]
+                        break
+                    channel[0] += hold
+                    if channel[0] <= now - 1.0:  # Too late (e.g. suspended), restart the timing from now
+                        channel[0] = now
+            if not self.channels:
+                return None
+            return max(0.0, min(channel[0] for channel in self.channels.values()) - now)
+
+    def _run(self):
+        while self.running:
+            timeout = self._step(self.clock())
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
@@ -0,0 +1,158 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Shared light state
+# -- File       : light_state.py
+# -- Purpose    : A small memory-mapped block where the lights daemon publishes the state of the lights (pins,
+# --              phase of every intersection and time to its next change), so that the GUI can show it many
+# --              times per second without asking the daemon over the socket.
+# -- Notes      : The block is a file in /dev/shm (in memory, the temporary folder on other systems) that both
+# --              processes map. It is protected with a sequence lock: the writer makes the sequence number odd,
+# --              writes the state and makes it even again; the reader copies the state and keeps it only if the
+# --              sequence was even and the same before and after the copy (and the CRC of the state matches),
+# --              otherwise it copies again. The reader never waits for the writer and never blocks it.
+# --              The daemon writes a heartbeat (its monotonic clock) at least every HEARTBEAT seconds, so a reader
+# --              that finds an old heartbeat knows that the daemon died, even if it was killed with SIGKILL.
+# --              The times are of the monotonic clock, which is the same for all the processes of the system.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Raspberry Pi OS / Linux (any OS with a temporary folder)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+STATE_FOLDER = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+STATE_FILE = os.path.join(STATE_FOLDER, 'akis_lights.state')
+MAGIC = b'LGHT'
+VERSION = 1
+HEARTBEAT = 0.5  # Seconds between two writes of the daemon, at most
+HEARTBEAT_TIMEOUT = 2.0  # A heartbeat older than this means that the daemon is not running
+MAX_INTERSECTIONS = 8
+SEQUENCE = struct.Struct('<I')
+# magic, version, traffic on, traffic flash, lights on, lights mode, pid, heartbeat, pins that are on (bit = BCM
+# pin), number of intersections
+HEADER = struct.Struct('<4sBBBB12sIdQB')
+INTERSECTION = struct.Struct('<16s24sBd')  # name, phase name, phase index, time of the next change
+CHECKSUM = struct.Struct('<I')
+STATE_SIZE = HEADER.size + MAX_INTERSECTIONS * INTERSECTION.size
+SIZE = SEQUENCE.size + STATE_SIZE + CHECKSUM.size
+
+
+def _text(value, size):  # UTF-8, cut at a whole character
+    data = value.encode('utf-8')[:size]
+    return data.decode('utf-8', 'ignore').encode('utf-8')
+
+
+class LightStateWriter:
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, SIZE)
+            self.map = mmap.mmap(fd, SIZE)
+        finally:
+            os.close(fd)
+        self.sequence = SEQUENCE.unpack_from(self.map, 0)[0] & ~1  # Continues after a daemon that was killed
+
+    def publish(self, traffic_on, traffic_flash, lights_on, lights_mode, pins_on, intersections=()):
+        # intersections: (name, phase name, phase index, time of the next change) of every intersection
+        state = bytearray(STATE_SIZE)
+        intersections = list(intersections)[:MAX_INTERSECTIONS]
+        mask = 0
+        for pin in pins_on:
+            mask |= 1 << pin
+        HEADER.pack_into(state, 0, MAGIC, VERSION, bool(traffic_on), bool(traffic_flash), bool(lights_on),
+                         _text(lights_mode, 12), os.getpid(), time.monotonic(), mask, len(intersections))
+        for index, (name, phase, phase_index, change) in enumerate(intersections):
+            INTERSECTION.pack_into(state, HEADER.size + index * INTERSECTION.size, _text(name, 16), _text(phase, 24),
+                                   phase_index, change)
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF  # Odd: the state is being written
+        SEQUENCE.pack_into(self.map, 0, self.sequence)
+        self.map[SEQUENCE.size:SEQUENCE.size + STATE_SIZE] = state
+        CHECKSUM.pack_into(self.map, SEQUENCE.size + STATE_SIZE, zlib.crc32(state))
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF  # Even: the state is complete
+        SEQUENCE.pack_into(self.map, 0, self.sequence)
+
+    def close(self, remove=False):  # remove: the daemon stops, a reader must not take the last state as live
+        self.map.close()
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class LightStateReader:
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        self.map = None
+        self.inode = None
+
+    def _open(self):  # The block is mapped when it appears, and again when a new daemon created a new file
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            self.close()
+            return False
+        if self.map is not None and info.st_ino == self.inode:
+            return True
+        self.close()
+        if info.st_size < SIZE:
+            return False
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self.map = mmap.mmap(fd, SIZE, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        self.inode = info.st_ino
+        return True
+
+    def read(self, attempts=100):
+        # Returns the state as a dict, with "alive" False when the daemon stopped writing, or None if there is no
+        # daemon (or the writer kept changing the state during all the attempts)
+        if not self._open():
+            return None
+        for attempt in range(attempts):
+            before = SEQUENCE.unpack_from(self.map, 0)[0]
+            if before & 1:
+                continue
+            state = self.map[SEQUENCE.size:SEQUENCE.size + STATE_SIZE]
+            checksum = CHECKSUM.unpack_from(self.map, SEQUENCE.size + STATE_SIZE)[0]
+            if SEQUENCE.unpack_from(self.map, 0)[0] != before or zlib.crc32(state) != checksum:
+                continue
+            return self._decode(state)
+        return None
+
+    @staticmethod
+    def _decode(state):
+        (magic, version, traffic_on, traffic_flash, lights_on, lights_mode, pid, heartbeat, mask,
+         count) = HEADER.unpack_from(state, 0)
+        if magic != MAGIC or version != VERSION:
+            return None
+        now = time.monotonic()
+        intersections = []
+        for index in range(min(count, MAX_INTERSECTIONS)):
+            name, phase, phase_index, change = INTERSECTION.unpack_from(state, HEADER.size + index * INTERSECTION.size)
+            intersections.append({'name': name.rstrip(b'\0').decode('utf-8'),
+                                  'phase': phase.rstrip(b'\0').decode('utf-8'), 'phase_index': phase_index,
+                                  'time_left': max(0.0, change - now)})
+        return {
+            'alive': now - heartbeat < HEARTBEAT_TIMEOUT,
+            'age': now - heartbeat,
+            'pid': pid,
+            'traffic_on': bool(traffic_on),
+            'traffic_flash': bool(traffic_flash),
+            'lights_on': bool(lights_on),
+            'lights_mode': lights_mode.rstrip(b'\0').decode('utf-8'),
+            'pins_on': [pin for pin in range(64) if mask >> pin & 1],
+            'intersections': intersections,
+        }
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = None
+        self.inode = None
@@ -1,24 +1,31 @@
-import RPi.GPIO as GPIO
+from gpio_pins import PinState
+from light_patterns import PATTERNS, PatternEngine
 import signal
 import sys
 
-GPIO.setwarnings(False)
-
 # Setup
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(25, GPIO.OUT)  # LIGHTS
+pins = PinState()
+pins.setup([25])  # LIGHTS
+engine = PatternEngine(pins)
 
 
 # Turn off all lights when user ends demo
 def allLightsOff(signal, frame):
-    GPIO.output(25, False)
-    GPIO.cleanup()
+    engine.close()
+    pins.output(25, False)
+    pins.cleanup()
     sys.exit(0)
 
 
 signal.signal(signal.SIGINT, allLightsOff)
+signal.signal(signal.SIGTERM, allLightsOff)
+
+# Lights on, with the pattern given as argument (e.g. "python3 lights.py breathe") or steady
+if len(sys.argv) > 1:
+    engine.play(25, PATTERNS[sys.argv[1]]())
+else:
+    pins.output(25, True)
 
-# Loop forever
+# Wait for a signal, without using the CPU
 while True:
-    # Lights on
-    GPIO.output(25, True)
+    signal.pause()
@@ -0,0 +1,116 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Platform lights client
+# -- File       : lights_client.py
+# -- Purpose    : Sends on/off/mode commands to the lights daemon ("lights_daemon.py") over a local socket.
+# --              The GUI uses it instead of starting and killing a python3 process for every checkbox change.
+# -- Notes      : Every command is a single text line and the daemon answers with a single text line
+# --              ("OK ..." or "ERR ..."). When the daemon is not running (for example in Windows) the
+# --              commands are silently ignored, exactly like the old light scripts that failed to start.
+# --              With a telemetry.Telemetry, every command is traced with its round-trip time ("lights"); the
+# --              queries that change nothing ("status", "traffic schedule") are traced apart ("lights_query").
+# --              The functions in "listeners" (e.g. the session journal) are called with every command that the
+# --              daemon answered, except the queries.
+# --              The client may be used from several threads (e.g. the workers of "web_server.py"): a lock lets
+# --              one command at a time use the socket, so an answer is never read by the wrong command.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Raspberry Pi OS (daemon side), any OS (client side)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import socket
+import threading
+import time
+from subprocess import Popen
+
+LIGHTS_HOST = '127.0.0.1'
+LIGHTS_PORT = 50505
+DAEMON_SCRIPT = './scripts/lights_daemon.py'
+QUERIES = ('status', 'traffic schedule')  # Commands that only read the state of the lights
+
+
+class LightsClient:
+    def __init__(self, host=LIGHTS_HOST, port=LIGHTS_PORT, timeout=1.0, telemetry=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.daemon_process = None  # Only set when this client started the daemon
+        self._sock = None
+        self._reader = None
+        self.telemetry = telemetry
+        self.listeners = []
+        self.lock = threading.RLock()  # Held while a command uses the socket
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = sock.makefile('r', encoding='ascii', newline='\n')
+
+    def close(self):
+        with self.lock:
+            if self._sock is not None:
+                try:
+                    self._reader.close()
+                    self._sock.close()
+                except OSError:
+                    pass
+            self._sock = None
+            self._reader = None
+
+    def send(self, command):  # Returns the answer of the daemon, or None if the daemon is not reachable
+        with self.lock:
+            start = time.perf_counter()
+            answer = self._send(command)
+        query = command in QUERIES
+        if self.telemetry is not None:
+            elapsed = time.perf_counter() - start
+            source = 'lights_query' if query else 'lights'
+            self.telemetry.event(source, command, answer or 'no daemon', elapsed)
+            if answer is not None:
+                self.telemetry.observe(source, elapsed)
+        if answer is not None and not query:
+            for listener in self.listeners:
+                listener(command)
+        return answer
+
+    def _send(self, command):
+        for attempt in range(2):  # The second attempt reconnects, in case the daemon was restarted
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall((command + '\n').encode('ascii'))
+                answer = self._reader.readline()
+                if answer:
+                    return answer.strip()
+            except OSError:
+                pass
+            self.close()
+        return None
+
+    def is_running(self):
+        return self.send('status') is not None
+
+    def ensure_daemon(self, wait=5.0):  # Starts the daemon once, if it is not already running
+        if self.is_running():
+            return True
+        self.daemon_process = Popen(['python3', DAEMON_SCRIPT])
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            if self.daemon_process.poll() is not None:  # The daemon failed (no RPi.GPIO, port in use, ...)
+                self.daemon_process = None
+                return False
+            if self.is_running():
+                return True
+            time.sleep(0.05)
+        return False
+
+    def shutdown(self):  # Turns off all lights and stops the daemon, but only if we are the ones that started it
+        self.send('all off')
+        if self.daemon_process is not None:
+            self.send('shutdown')
+            try:
+                self.daemon_process.wait(timeout=2)
+            except Exception:
+                self.daemon_process.kill()
+            self.daemon_process = None
+        self.close()
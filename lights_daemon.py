@@ -0,0 +1,200 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Platform lights daemon
+# -- File       : lights_daemon.py
+# -- Purpose    : One long-lived process that owns the GPIO pins of the platform lights (traffic and led) and
+# --              accepts commands over a local socket, so that switching a light does not start a new python3
+# --              interpreter every time.
+# -- Notes      : Commands (one per line, answer is one line "OK ..." or "ERR ..."):
+# --                traffic on | traffic off | traffic mode cycle | traffic mode flash
+# --                lights on  | lights off | lights mode steady|dim|blink|fade|breathe
+# --                all off    | status     | shutdown
+# --                traffic schedule   answers "OK elapsed=<seconds>", the seconds since the phases of
+# --                                   "./settings/intersections.json" started ("OK elapsed=none" when the
+# --                                   traffic lights do not cycle), for the green wave of "green_wave.py"
+# --              The daemon turns off all lights on SIGINT/SIGTERM and on "shutdown".
+# --              The pins, the phase of every intersection and the time to its next change are published in the
+# --              shared block of "light_state.py" after every change, and at least every HEARTBEAT seconds.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Raspberry Pi OS (GPIO backend selected in "gpio_pins.py")
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import signal
+import socketserver
+import sys
+import threading
+
+from gpio_pins import PinState
+from light_patterns import PATTERNS, PatternEngine
+from light_state import HEARTBEAT, LightStateWriter
+from lights_client import LIGHTS_HOST, LIGHTS_PORT
+from traffic_scheduler import TrafficScheduler, load_intersections
+
+time_flash = 0.5
+
+# The pins and the phases of every intersection come from "./settings/intersections.json"
+pins = PinState()
+
+
+def traffic_output(traffic_pins, values):  # Writes the pins of a new phase and publishes it
+    pins.output(traffic_pins, values)
+    publish()
+
+
+scheduler = TrafficScheduler(load_intersections(), traffic_output)
+TRAFFIC_PINS = scheduler.pins()
+LIGHTS_PIN = 25  # LIGHTS
+
+# Setup
+pins.setup(TRAFFIC_PINS + [LIGHTS_PIN])
+engine = PatternEngine(pins)
+
+state_lock = threading.Lock()
+traffic_mode = 'cycle'
+traffic_stop = None  # threading.Event of the running traffic light thread, None when the traffic lights are off
+lights_on = False
+lights_mode = 'steady'
+mirror = LightStateWriter()
+mirror_lock = threading.Lock()  # One writer at a time: the commands, the traffic thread and the heartbeat
+
+
+def publish():  # Writes the state of the lights to the shared block
+    intersections = []
+    if traffic_stop is not None and traffic_mode == 'cycle' and scheduler.start_time is not None:
+        with scheduler.lock:
+            intersections = [(intersection.name, intersection.phases[intersection.index].name, intersection.index,
+                              intersection.deadline) for intersection in scheduler.intersections]
+    with mirror_lock:
+        mirror.publish(traffic_stop is not None, traffic_mode == 'flash', lights_on, lights_mode,
+                       [pin for pin in TRAFFIC_PINS + [LIGHTS_PIN] if pins.get(pin)], intersections)
+
+
+def heartbeat(stop):  # Publishes the state even when nothing changes, so the GUI knows that the daemon runs
+    while not stop.wait(HEARTBEAT):
+        publish()
+
+
+def traffic_cycle(stop):  # The phases of all the intersections, same as in "traffic_lights.py"
+    scheduler.run(stop)
+
+
+def traffic_flash(stop):  # All yellow lights blinking, as in an out of service crossing
+    flash_pins = scheduler.flash_pins()
+    pins.output(TRAFFIC_PINS, False)
+    blink = True
+    while not stop.is_set():
+        pins.output(flash_pins, blink)
+        publish()
+        blink = not blink
+        stop.wait(time_flash)
+
+
+def start_traffic():
+    global traffic_stop
+    stop_traffic()
+    traffic_stop = threading.Event()
+    target = traffic_flash if traffic_mode == 'flash' else traffic_cycle
+    thread = threading.Thread(target=target, args=(traffic_stop,), daemon=True)
+    thread.start()
+    traffic_stop.thread = thread
+
+
+def stop_traffic():
+    global traffic_stop
+    if traffic_stop is not None:
+        traffic_stop.set()
+        traffic_stop.thread.join()
+        traffic_stop = None
+        scheduler.start_time = None  # No schedule until the phases start again
+    pins.output(TRAFFIC_PINS, False)
+
+
+def set_lights(value):
+    global lights_on
+    lights_on = value
+    if value:
+        engine.play(LIGHTS_PIN, PATTERNS[lights_mode]())
+    else:
+        engine.stop(LIGHTS_PIN)
+
+
+def status():
+    return ('traffic=' + str(int(traffic_stop is not None)) + ' mode=' + traffic_mode +
+            ' lights=' + str(int(lights_on)) + ' lights_mode=' + lights_mode)
+
+
+def execute(command):  # Runs one command and returns the answer line
+    global traffic_mode
+    global lights_mode
+    words = command.split()
+    with state_lock:
+        if words == ['traffic', 'on']:
+            start_traffic()
+        elif words == ['traffic', 'off']:
+            stop_traffic()
+        elif len(words) == 3 and words[:2] == ['traffic', 'mode'] and words[2] in ('cycle', 'flash'):
+            traffic_mode = words[2]
+            if traffic_stop is not None:  # Restart the running traffic lights in the new mode
+                start_traffic()
+        elif words == ['lights', 'on']:
+            set_lights(True)
+        elif words == ['lights', 'off']:
+            set_lights(False)
+        elif len(words) == 3 and words[:2] == ['lights', 'mode'] and words[2] in PATTERNS:
+            lights_mode = words[2]
+            if lights_on:  # Restart the lights with the new pattern
+                set_lights(True)
+        elif words == ['traffic', 'schedule']:
+            cycling = traffic_stop is not None and traffic_mode == 'cycle' and scheduler.start_time is not None
+            return 'OK elapsed=' + (str(round(scheduler.elapsed(), 3)) if cycling else 'none')
+        elif words == ['all', 'off'] or words == ['shutdown']:
+            stop_traffic()
+            set_lights(False)
+        elif words != ['status']:
+            return 'ERR unknown command: ' + command
+        publish()
+        return 'OK ' + status()
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self):  # A client may keep its connection open and send many commands
+        for line in self.rfile:
+            command = line.decode('ascii', 'replace').strip()
+            if not command:
+                continue
+            self.wfile.write((execute(command) + '\n').encode('ascii'))
+            self.wfile.flush()
+            if command == 'shutdown':
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class LightsServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+# Turn off all lights when the daemon is stopped
+def allLightsOff(signal, frame):
+    execute('all off')
+    heartbeat_stop.set()
+    mirror.close(remove=True)
+    engine.close()
+    pins.cleanup()
+    sys.exit(0)
+
+
+signal.signal(signal.SIGINT, allLightsOff)
+signal.signal(signal.SIGTERM, allLightsOff)
+
+server = LightsServer((LIGHTS_HOST, LIGHTS_PORT), CommandHandler)
+heartbeat_stop = threading.Event()
+threading.Thread(target=heartbeat, args=(heartbeat_stop,), daemon=True).start()
+publish()
+server.serve_forever()
+server.server_close()
+heartbeat_stop.set()
+mirror.close(remove=True)
+engine.close()
+pins.cleanup()
+sys.exit(0)
@@ -1,13 +1,11 @@
-import RPi.GPIO as GPIO
+from gpio_pins import PinState
 import sys
 
-GPIO.setwarnings(False)
-
 # Setup
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(25, GPIO.OUT)  # LIGHTS
+pins = PinState()
+pins.setup([25])  # LIGHTS
 
 # Turn off all lights
-GPIO.output(25, False)
-GPIO.cleanup()
+pins.output(25, False)
+pins.cleanup()
 sys.exit(0)
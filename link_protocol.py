@@ -0,0 +1,299 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Acknowledged command protocol
+# -- File       : link_protocol.py
+# -- Purpose    : Optional protocol layer on the host side of the serial link. Every command gets a sequence
+# --              number and the transmitter mBit answers with an acknowledgement, so lost radio packets are
+# --              retransmitted and the round-trip time and the loss of the link can be measured.
+# -- Notes      : Frame sent:   "#<seq> <command>\r\n", e.g. "#17 F300\r\n"   (seq is 0 - 255)
+# --              Answer:       "A<seq>\r\n"
+# --              Up to "window" commands are in flight at the same time. A command that is not acknowledged
+# --              within "timeout" seconds is sent again, at most "max_retries" times. The receiver must ignore
+# --              a sequence number that it has already executed (the acknowledgement may be the one lost).
+# --              The firmware "microbit-Robot_v12.4.hex" only understands the plain "F300\r\n" frames, so the
+# --              protocol is selected in "./settings/link_protocol.dat" ("plain", the default, or "acked").
+# --              AckedLink has the same methods as serial_transport.SerialTransport, so the GUI can use either.
+# --              The functions in "listeners" are called with every frame that the transmitter acknowledged.
+# --              With a telemetry.Telemetry, every frame queued, sent, retransmitted, acknowledged or lost is traced.
+# --              With a "reconnect" function, the port is opened again after an error; the queued frames wait and
+# --              the frames in flight are retransmitted on the new port.
+# --              "python3 link_protocol.py [loss]" starts a stand-in transmitter on a pseudo-terminal that
+# --              acknowledges the frames (dropping the given fraction of them), for testing without hardware.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any (the stand-in transmitter needs a pseudo-terminal, Linux / Raspberry Pi OS)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import collections
+import os
+import threading
+import time
+
+SEQ_MODULO = 256
+PROTOCOL_FILE = './settings/link_protocol.dat'
+RTT_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0]  # Upper limits in seconds
+
+
+def read_protocol_setting(path=PROTOCOL_FILE):  # Returns "plain" or "acked"
+    if not os.path.exists(path):
+        return 'plain'
+    file_r = open(path, "r")
+    value = file_r.read().strip()
+    file_r.close()
+    return 'acked' if value == 'acked' else 'plain'
+
+
+def encode_acked(seq, frame):  # frame is a plain command frame, e.g. b'F300\r\n'
+    return b'#' + str(seq).encode('ascii') + b' ' + frame.strip() + b'\r\n'
+
+
+def parse_acked(line):  # Returns (seq, command) of an acknowledged frame, or None for a plain frame
+    line = line.strip()
+    if not line.startswith(b'#') or b' ' not in line:
+        return None
+    seq, command = line[1:].split(b' ', 1)
+    if not seq.isdigit():
+        return None
+    return int(seq), command
+
+
+class Histogram:  # Counts of the values per bucket, the last bucket counts everything above the last limit
+    def __init__(self, limits=RTT_BUCKETS):
+        self.limits = limits
+        self.counts = [0] * (len(limits) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value):
+        index = 0
+        while index < len(self.limits) and value > self.limits[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def as_dict(self):
+        labels = ['<=' + str(limit) for limit in self.limits] + ['>' + str(self.limits[-1])]
+        return dict(zip(labels, self.counts))
+
+
+class AckedLink:
+    def __init__(self, port, window=4, timeout=0.5, max_retries=5, max_queue=32, clock=time.monotonic,
+                 telemetry=None, reconnect=None, retry_interval=0.5):
+        self.port = port  # An open serial.Serial
+        self.port.timeout = 0.01  # The worker thread reads the acknowledgements with short waits
+        self.window = window
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.clock = clock
+        self.frames = collections.deque()  # (frame bytes, time of send())
+        self.in_flight = collections.OrderedDict()  # seq: [frame, last sent, time of send(), tries]
+        self.next_seq = 0
+        self.condition = threading.Condition()
+        self.running = True
+        self.sent_frames = 0
+        self.acked_frames = 0
+        self.lost_frames = 0
+        self.dropped_frames = 0
+        self.retransmissions = 0
+        self.write_calls = 0
+        self.last_latency = 0.0
+        self.rtt = Histogram()
+        self.error = None
+        self.listeners = []  # Functions called with every acknowledged frame, from the worker thread
+        self.telemetry = telemetry
+        self.reconnect = reconnect  # Returns a new open port, or raises OSError
+        self.retry_interval = retry_interval
+        self.reconnects = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, frame):  # Queues a frame without blocking, returns False if it was dropped
+        with self.condition:
+            if not self.running or len(self.frames) >= self.max_queue:
+                self.dropped_frames += 1
+                if self.telemetry is not None:
+                    self.telemetry.event('link', 'drop', frame)
+                return False
+            self.frames.append((frame, self.clock()))
+        if self.telemetry is not None:
+            self.telemetry.event('link', 'enqueue', frame)
+        return True
+
+    def discard(self, match):  # Removes the queued frames (not yet sent) for which match(frame) is true
+        with self.condition:
+            kept = [(frame, queued) for frame, queued in self.frames if not match(frame)]
+            removed = len(self.frames) - len(kept)
+            self.frames.clear()
+            self.frames.extend(kept)
+            self.dropped_frames += removed
+        if removed and self.telemetry is not None:
+            self.telemetry.event('link', 'discard', '', removed)
+        return removed
+
+    def is_full(self):
+        return len(self.frames) >= self.max_queue
+
+    def queue_depth(self):
+        return len(self.frames) + len(self.in_flight)
+
+    def stats(self):
+        with self.condition:
+            sent = self.sent_frames + self.retransmissions
+            return {
+                'queue_depth': len(self.frames) + len(self.in_flight),
+                'in_flight': len(self.in_flight),
+                'sent_frames': self.sent_frames,
+                'acked_frames': self.acked_frames,
+                'lost_frames': self.lost_frames,
+                'dropped_frames': self.dropped_frames,
+                'retransmissions': self.retransmissions,
+                'write_calls': self.write_calls,
+                'loss_ratio': self.retransmissions / sent if sent else 0.0,
+                'last_latency': self.last_latency,
+                'mean_rtt': self.rtt.mean(),
+                'rtt_histogram': self.rtt.as_dict(),
+                'reconnects': self.reconnects,
+                'error': self.error,
+            }
+
+    def _prepare(self, now):  # Returns the bytes to write: new frames that fit in the window and retransmissions
+        out = []
+        with self.condition:
+            for seq, entry in list(self.in_flight.items()):
+                if now - entry[1] < self.timeout:
+                    continue
+                if entry[3] >= self.max_retries:
+                    del self.in_flight[seq]
+                    self.lost_frames += 1
+                    if self.telemetry is not None:
+                        self.telemetry.event('link', 'lost', entry[0], seq)
+                    continue
+                entry[1] = now
+                entry[3] += 1
+                self.retransmissions += 1
+                out.append(encode_acked(seq, entry[0]))
+                if self.telemetry is not None:
+                    self.telemetry.event('link', 'retry', entry[0], seq)
+            while self.frames and len(self.in_flight) < self.window:
+                frame, queued = self.frames.popleft()
+                seq = self.next_seq
+                self.next_seq = (self.next_seq + 1) % SEQ_MODULO
+                self.in_flight[seq] = [frame, now, queued, 1]
+                self.sent_frames += 1
+                out.append(encode_acked(seq, frame))
+                if self.telemetry is not None:
+                    self.telemetry.event('link', 'write', frame, now - queued)
+                    self.telemetry.observe('enqueue_to_write', now - queued)
+        return b''.join(out)
+
+    def _acknowledge(self, line, now):
+        line = line.strip()
+        if not line.startswith(b'A') or not line[1:].isdigit():
+            return
+        with self.condition:
+            entry = self.in_flight.pop(int(line[1:]), None)
+            if entry is None:  # Duplicate acknowledgement of a retransmitted frame
+                return
+            self.acked_frames += 1
+            self.last_latency = now - entry[2]
+            if entry[3] == 1:  # Only frames sent once give a clear round-trip time
+                self.rtt.add(now - entry[1])
+        if self.telemetry is not None:
+            self.telemetry.event('link', 'ack', entry[0], now - entry[1])
+            if entry[3] == 1:
+                self.telemetry.observe('ack_rtt', now - entry[1])
+        for listener in self.listeners:
+            listener(entry[0])
+
+    def _run(self):
+        received = bytearray()
+        while True:
+            with self.condition:
+                if not self.running and not self.frames and not self.in_flight:
+                    return
+            try:
+                out = self._prepare(self.clock())
+                if out:
+                    self.port.write(out)
+                    self.write_calls += 1
+                received += self.port.read(max(1, self.port.in_waiting))
+                self.error = None
+            except OSError as error:  # serial.SerialException is an OSError
+                self.error = str(error)
+                if self.reconnect is None:
+                    time.sleep(0.1)
+                elif not self._reopen():
+                    return
+                continue
+            now = self.clock()
+            while b'\n' in received:
+                line, _, rest = bytes(received).partition(b'\n')
+                received = bytearray(rest)
+                self._acknowledge(line, now)
+
+    def _reopen(self):  # Opens the port again, returns False if the link was closed meanwhile
+        try:
+            self.port.close()
+        except OSError:
+            pass
+        while True:
+            with self.condition:
+                if not self.running:
+                    return False
+            try:
+                port = self.reconnect()
+            except OSError as error:
+                self.error = str(error)
+                time.sleep(self.retry_interval)
+                continue
+            port.timeout = 0.01
+            with self.condition:
+                self.port = port
+                self.reconnects += 1
+            self.error = None
+            if self.telemetry is not None:
+                self.telemetry.event('link', 'reconnect', str(getattr(port, 'port', '')))
+            return True
+
+    def close(self, timeout=1.0):  # Waits (up to "timeout" seconds) for the frames in flight and closes the port
+        with self.condition:
+            self.running = False
+        self.thread.join(timeout)
+        with self.condition:
+            self.frames.clear()
+            self.in_flight.clear()
+        self.thread.join(0.1)
+        self.port.close()
+
+
+def stand_in_transmitter(loss=0.0):  # Acknowledges the frames written to the pseudo-terminal it prints
+    import pty
+    import random
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    print(os.ttyname(slave), flush=True)
+    executed = collections.deque(maxlen=SEQ_MODULO // 2)  # Sequence numbers already executed
+    received = b''
+    while True:
+        received += os.read(master, 1024)
+        while b'\n' in received:
+            line, _, received = received.partition(b'\n')
+            frame = parse_acked(line)
+            if frame is None or random.random() < loss:
+                continue
+            seq, command = frame
+            if seq not in executed:
+                executed.append(seq)
+                print('#' + str(seq), command.decode('ascii', 'replace'), flush=True)
+            if random.random() >= loss:
+                os.write(master, b'A' + str(seq).encode('ascii') + b'\r\n')
+
+
+if __name__ == '__main__':
+    import sys
+    stand_in_transmitter(float(sys.argv[1]) if len(sys.argv) > 1 else 0.0)
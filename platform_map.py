@@ -0,0 +1,235 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Platform map and route planner
+# -- File       : platform_map.py
+# -- Purpose    : Grid model of the platform (roads, crossings, buildings and signs), loaded from
+# --              "./settings/platform_map.txt", and a planner that finds the shortest legal route of the robot
+# --              between two cells and turns it into the F/L/R moves of the program tab.
+# -- Notes      : One cell is one step of the robot ('fb_factor') and one L/R step is a turn of 90 degrees
+# --              ('lr_factor'). The robot state is (row, column, heading), heading 0: north, 1: east,
+# --              2: south, 3: west. The robot may not enter buildings and no-entry cells, and it may move on a
+# --              one-way cell only in the direction of the cell.
+# --              The cost of a route is the estimated execution time (robot_commands.estimate_duration()).
+# --              Single routes (the 'Διαδρομή' button of the program tab) are found with A*. The route table
+# --              holds, for every destination cell, the next action from every robot state, for callers that
+# --              need many routes; it is built once with one backward Dijkstra search per destination and cached
+# --              in "./settings/route_cache.json". The cache is rebuilt only when the map or the factors change.
+# --              route_to_moves() ends the moves of a route on every stop cell and before every crossing with
+# --              traffic lights, so the route also keeps the rules of "rule_validator.py".
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import hashlib
+import heapq
+import json
+import os
+
+from robot_commands import estimate_duration
+
+MAP_FILE = './settings/platform_map.txt'
+ROUTE_CACHE_FILE = './settings/route_cache.json'
+
+BUILDING = '#'
+ROAD = '.'
+CROSSING = '+'
+PEDESTRIAN_CROSSING = '='
+STOP = 'S'
+NO_ENTRY = 'X'
+ONE_WAY = {'^': 0, '>': 1, 'v': 2, '<': 3}  # One-way cell: the only heading allowed on it
+CELL_TYPES = (BUILDING, ROAD, CROSSING, PEDESTRIAN_CROSSING, STOP, NO_ENTRY) + tuple(ONE_WAY)
+
+HEADINGS = 'NESW'
+MOVES = [(-1, 0), (0, 1), (1, 0), (0, -1)]  # Row and column change of one step forward, per heading
+ACTIONS = 'FLR'  # The planner moves forward one cell or turns 90 degrees in place
+
+
+class PlatformMap:
+    def __init__(self, rows):
+        self.rows = rows
+        self.height = len(rows)
+        self.width = max(len(row) for row in rows) if rows else 0
+        for row in rows:
+            for char in row:
+                if char not in CELL_TYPES:
+                    raise ValueError('Unknown cell type "' + char + '" in the platform map')
+        self.text = '\n'.join(rows)
+        self.digest = hashlib.sha1(self.text.encode('utf-8')).hexdigest()
+
+    def cell(self, row, column):
+        if 0 <= row < self.height and 0 <= column < len(self.rows[row]):
+            return self.rows[row][column]
+        return BUILDING
+
+    def passable(self, row, column):
+        return self.cell(row, column) not in (BUILDING, NO_ENTRY)
+
+    def road_cells(self):
+        return [(row, column) for row in range(self.height) for column in range(len(self.rows[row]))
+                if self.passable(row, column)]
+
+    def forward(self, row, column, heading):  # Returns the cell one step forward, or None if the move is illegal
+        here = self.cell(row, column)
+        if here in ONE_WAY and ONE_WAY[here] != heading:
+            return None
+        next_row = row + MOVES[heading][0]
+        next_column = column + MOVES[heading][1]
+        there = self.cell(next_row, next_column)
+        if there in (BUILDING, NO_ENTRY) or (there in ONE_WAY and ONE_WAY[there] != heading):
+            return None
+        return next_row, next_column
+
+
+def load_map(path=MAP_FILE):  # Lines starting with ';' are comments
+    file_r = open(path, "r", encoding='utf-8')
+    rows = [line.rstrip('\n') for line in file_r if line.strip() and not line.startswith(';')]
+    file_r.close()
+    return PlatformMap(rows)
+
+
+def parse_heading(text):  # 'N', 'E', 'S', 'W' or 0 - 3
+    text = str(text).strip().upper()
+    return HEADINGS.index(text) if text in HEADINGS else int(text) % 4
+
+
+def route_to_moves(actions, start=None, platform_map=None, signal_cells=()):
+    # Merges the actions into moves of the user, e.g. FFLF -> [('F', 2), ('L', 1), ('F', 1)]. With the start state
+    # and the map, a move forward also ends on every stop cell and before every crossing with traffic lights
+    # (signal_cells), so the robot stops there (not on a pedestrian crossing, where stopping is not allowed)
+    moves = []
+    state = tuple(start) if start is not None and platform_map is not None else None
+    split = False  # The next step forward starts a new move
+    for action in actions:
+        if state is not None:
+            row, column, heading = state
+            if action == 'F':
+                cell = (row + MOVES[heading][0], column + MOVES[heading][1])
+                if cell in signal_cells and platform_map.cell(row, column) != PEDESTRIAN_CROSSING:
+                    split = True
+                state = (cell[0], cell[1], heading)
+            else:
+                state = (row, column, (heading + (1 if action == 'R' else -1)) % 4)
+        if moves and moves[-1][0] == action and not split:
+            moves[-1] = (action, moves[-1][1] + 1)
+        else:
+            moves.append((action, 1))
+        split = state is not None and action == 'F' and platform_map.cell(state[0], state[1]) == STOP
+    return moves
+
+
+class RoutePlanner:
+    def __init__(self, platform_map, fb_factor, lr_factor, cache_path=ROUTE_CACHE_FILE):
+        self.map = platform_map
+        self.fb_factor = int(fb_factor)
+        self.lr_factor = int(lr_factor)
+        self.cache_path = cache_path
+        self.costs = {'F': estimate_duration('F', self.fb_factor),
+                      'L': estimate_duration('L', self.lr_factor),
+                      'R': estimate_duration('R', self.lr_factor)}
+        self.cells = platform_map.road_cells()
+        self.table = None  # Destination cell: {state: next action}
+
+    def successors(self, state):  # (action, next state, cost) of every legal action from the state
+        row, column, heading = state
+        result = [('L', (row, column, (heading - 1) % 4), self.costs['L']),
+                  ('R', (row, column, (heading + 1) % 4), self.costs['R'])]
+        cell = self.map.forward(row, column, heading)
+        if cell is not None:
+            result.append(('F', (cell[0], cell[1], heading), self.costs['F']))
+        return result
+
+    def astar(self, start, goal):  # start: (row, column, heading), goal: (row, column), returns the actions or None
+        def heuristic(state):
+            return (abs(state[0] - goal[0]) + abs(state[1] - goal[1])) * self.costs['F']
+
+        open_heap = [(heuristic(start), 0.0, start)]
+        came_from = {start: None}
+        best = {start: 0.0}
+        while open_heap:
+            estimate, cost, state = heapq.heappop(open_heap)
+            if cost > best[state]:
+                continue
+            if state[:2] == tuple(goal):
+                actions = []
+                while came_from[state] is not None:
+                    state, action = came_from[state]
+                    actions.append(action)
+                return ''.join(reversed(actions))
+            for action, next_state, step_cost in self.successors(state):
+                next_cost = cost + step_cost
+                if next_cost < best.get(next_state, float('inf')):
+                    best[next_state] = next_cost
+                    came_from[next_state] = (state, action)
+                    heapq.heappush(open_heap, (next_cost + heuristic(next_state), next_cost, next_state))
+        return None
+
+    def _cache_key(self):
+        return self.map.digest + ':' + str(self.fb_factor) + ':' + str(self.lr_factor)
+
+    def _build_table(self):  # One backward Dijkstra per destination cell, over all (cell, heading) states
+        predecessors = {}
+        for row, column in self.cells:
+            for heading in range(4):
+                state = (row, column, heading)
+                for action, next_state, cost in self.successors(state):
+                    predecessors.setdefault(next_state, []).append((state, action, cost))
+        table = {}
+        for goal in self.cells:
+            distance = {}
+            next_action = {}
+            heap = [(0.0, (goal[0], goal[1], heading)) for heading in range(4)]
+            for item in heap:
+                distance[item[1]] = 0.0
+            while heap:
+                cost, state = heapq.heappop(heap)
+                if cost > distance[state]:
+                    continue
+                for previous, action, step_cost in predecessors.get(state, []):
+                    previous_cost = cost + step_cost
+                    if previous_cost < distance.get(previous, float('inf')):
+                        distance[previous] = previous_cost
+                        next_action[previous] = action
+                        heapq.heappush(heap, (previous_cost, previous))
+            table[goal] = next_action
+        return table
+
+    def route_table(self):  # Loads the table from the cache, or builds and caches it
+        if self.table is not None:
+            return self.table
+        key = self._cache_key()
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r') as file_r:
+                    cache = json.load(file_r)
+                if cache.get('key') == key:
+                    self.table = {}
+                    for goal, actions in cache['table'].items():
+                        row, column = (int(value) for value in goal.split(','))
+                        self.table[(row, column)] = {tuple(int(value) for value in state.split(',')): action
+                                                     for state, action in actions.items()}
+                    return self.table
+            except (OSError, ValueError, KeyError):
+                pass  # A damaged cache is rebuilt
+        self.table = self._build_table()
+        cache = {'key': key, 'table': {
+            str(goal[0]) + ',' + str(goal[1]): {','.join(str(value) for value in state): action
+                                                for state, action in actions.items()}
+            for goal, actions in self.table.items()}}
+        with open(self.cache_path, 'w') as file_w:
+            json.dump(cache, file_w, separators=(',', ':'))
+        return self.table
+
+    def route(self, start, goal):  # Follows the route table, returns the actions or None if there is no route
+        goal = tuple(goal)
+        if goal not in self.route_table():
+            return None
+        next_action = self.table[goal]
+        state = tuple(start)
+        actions = []
+        while state[:2] != goal:
+            action = next_action.get(state)
+            if action is None:
+                return None
+            actions.append(action)
+            state = next(next_state for name, next_state, cost in self.successors(state) if name == action)
+        return ''.join(actions)
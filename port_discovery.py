@@ -0,0 +1,92 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Transmitter port discovery
+# -- File       : port_discovery.py
+# -- Purpose    : Finds the serial port of the transmitter mBit, so that it does not have to be typed in the
+# --              first window, and opens it again (or the port where it appeared again) after the USB cable was
+# --              unplugged, for the reconnection of "serial_transport.py" and "link_protocol.py".
+# -- Notes      : Only the ports with the USB VID:PID of the micro:bit (0D28:0204, the DAPLink interface) are
+# --              taken, nothing is ever written to another USB serial device. With "probe" the micro:bits are
+# --              probed, all at the same time, with a handshake: the frame "#0 F0" (a move of 0 ms, harmless for
+# --              any firmware) is written and the answer "A0" of the acknowledged protocol is awaited, so that a
+# --              transmitter with that firmware comes first. One with the plain firmware does not answer and
+# --              follows. The search takes up to "timeout", so the GUI runs it in a thread.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any (pyserial)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import concurrent.futures
+import time
+
+import serial
+from serial.tools import list_ports
+
+from link_protocol import encode_acked
+from robot_commands import encode_command
+
+MICROBIT_VID = 0x0D28
+MICROBIT_PID = 0x0204
+HANDSHAKE = encode_acked(0, encode_command('F', 0))
+HANDSHAKE_ANSWER = b'A0'
+
+
+def open_serial(port):  # The same settings as the first serial port of SystemController.py
+    return serial.Serial(port=port, baudrate=115200, bytesize=8, parity=serial.PARITY_NONE, timeout=2,
+                         stopbits=serial.STOPBITS_ONE)
+
+
+def candidate_ports():  # Returns the micro:bit ports, by device name
+    return [port.device for port in sorted(list_ports.comports(), key=lambda port: port.device)
+            if port.vid == MICROBIT_VID and port.pid == MICROBIT_PID]
+
+
+def handshake(port, timeout=1.0):  # True if a transmitter answers on the port
+    try:
+        connection = serial.Serial(port=port, baudrate=115200, timeout=0.05, write_timeout=timeout)
+    except (OSError, ValueError):  # serial.SerialException is an OSError
+        return False
+    try:
+        connection.reset_input_buffer()
+        connection.write(HANDSHAKE)
+        received = b''
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            received += connection.read(64)
+            if HANDSHAKE_ANSWER in received.split():
+                return True
+        return False
+    except OSError:
+        return False
+    finally:
+        connection.close()
+
+
+def discover(timeout=1.0, probe=True):
+    # Returns the micro:bit ports, with "probe" those that answered the handshake first
+    microbits = candidate_ports()
+    if not probe or len(microbits) < 2:  # With one micro:bit there is nothing to choose
+        return microbits
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(16, len(microbits))) as executor:
+        answers = list(executor.map(lambda port: handshake(port, timeout), microbits))
+    return ([port for port, answered in zip(microbits, answers) if answered] +
+            [port for port, answered in zip(microbits, answers) if not answered])
+
+
+def make_reconnect(port, timeout=0.5, exclude=()):
+    # For the "reconnect" of the transports: the same port, or a new one that is not in "exclude" (the ports of
+    # the other transmitters, see "transmitter_pool.py")
+    def reconnect():
+        try:
+            return open_serial(port)
+        except OSError:
+            # No handshake, the other micro:bits may be transmitters of the pool that are in use
+            found = [other for other in discover(timeout, probe=False) if other not in exclude]
+            if not found:
+                raise
+            return open_serial(found[0])
+    return reconnect
+
+
+if __name__ == '__main__':
+    import sys
+    print('\n'.join(discover(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)))
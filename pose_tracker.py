@@ -0,0 +1,68 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Dead-reckoning pose tracker
+# -- File       : pose_tracker.py
+# -- Purpose    : Estimates the position and heading of the robot from the movement commands that are sent to
+# --              it, using the step factors of "./settings/fb_factor.dat" and "./settings/lr_factor.dat".
+# -- Notes      : The position is in cells of the platform map (x: column, y: row) and the heading in degrees
+# --              (0: north, 90: east). 'fb_factor' steps move the robot one cell and 'lr_factor' steps turn it
+# --              90 degrees. update() is called by the writer thread of the serial transport for every frame
+# --              written, so the tracker keeps the new trail segments in a queue protected by a lock, and the GUI
+# --              takes them with take_segments() to draw only what changed.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import collections
+import math
+import threading
+
+from robot_commands import parse_command
+
+
+class PoseTracker:
+    def __init__(self, fb_factor, lr_factor, start=(1.0, 1.0, 90.0)):
+        self.fb_factor = int(fb_factor)
+        self.lr_factor = int(lr_factor)
+        self.lock = threading.Lock()
+        self.segments = collections.deque()  # (x0, y0, x1, y1) not drawn yet
+        self.moves = 0
+        self.reset(start)
+
+    def set_factors(self, fb_factor, lr_factor):
+        with self.lock:
+            self.fb_factor = int(fb_factor)
+            self.lr_factor = int(lr_factor)
+
+    def reset(self, start):  # start: (x, y, heading in degrees)
+        with self.lock:
+            self.x, self.y, self.heading = float(start[0]), float(start[1]), float(start[2]) % 360
+            self.segments.clear()
+            self.moves = 0
+
+    def pose(self):
+        with self.lock:
+            return self.x, self.y, self.heading
+
+    def update(self, frame):  # frame: bytes of a command, e.g. b'F300\r\n'
+        command = parse_command(frame)
+        if command is None:
+            return
+        direction, steps = command
+        with self.lock:
+            if direction in ('F', 'B') and self.fb_factor > 0:
+                distance = steps / self.fb_factor * (1 if direction == 'F' else -1)
+                x0, y0 = self.x, self.y
+                self.x += distance * math.sin(math.radians(self.heading))
+                self.y -= distance * math.cos(math.radians(self.heading))
+                self.segments.append((x0, y0, self.x, self.y))
+            elif direction in ('L', 'R') and self.lr_factor > 0:
+                angle = steps / self.lr_factor * 90.0
+                self.heading = (self.heading + (angle if direction == 'R' else -angle)) % 360
+            self.moves += 1
+
+    def take_segments(self):  # Returns and forgets the segments that were not drawn yet
+        with self.lock:
+            segments = list(self.segments)
+            self.segments.clear()
+            return segments
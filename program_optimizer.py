@@ -0,0 +1,76 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Movement program optimizer
+# -- File       : program_optimizer.py
+# -- Purpose    : Peephole pass over a list of movement commands before it is sent to the robot: merges
+# --              neighbouring moves (F3 F2 -> F5), cancels opposite ones (F2 B2 -> nothing), reduces the turns
+# --              modulo a full rotation (four R turns -> nothing, three R turns -> one L turn) and drops no-ops.
+# -- Notes      : The commands are (direction, factored steps). One turn of 'lr_factor' steps is 90 degrees, so a
+# --              full rotation is 4 * lr_factor steps. Without a factor (0 or empty) the turns are only summed,
+# --              not reduced modulo a rotation. Stop commands ('S') are kept and nothing is merged across
+# --              them, nor across the end of a command given in "keep" (e.g. a move that ends on a stop sign).
+# --              The pass uses a stack, so a cancellation lets the commands around it merge as well
+# --              (F2 L1 R1 F3 -> F5), in one linear pass.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+from robot_commands import estimate_duration
+
+SIGN = {'F': 1, 'B': -1, 'R': 1, 'L': -1}
+AXIS = {'F': 'move', 'B': 'move', 'R': 'turn', 'L': 'turn'}
+
+
+def _net_command(axis, amount, rotation):  # Returns the command for a signed amount, or None for a no-op
+    if axis == 'turn' and rotation <= 0:  # The size of a rotation is not known
+        if amount == 0:
+            return None
+        return ('R', amount) if amount > 0 else ('L', -amount)
+    if axis == 'move':
+        if amount == 0:
+            return None
+        return ('F', amount) if amount > 0 else ('B', -amount)
+    amount %= rotation
+    if amount == 0:
+        return None
+    return ('R', amount) if amount <= rotation // 2 else ('L', rotation - amount)
+
+
+def optimize(commands, lr_factor, turns_per_rotation=4, keep=()):
+    # Returns (optimized commands, report). keep: indices of the commands whose end must stay the end of a command
+    # (e.g. rule_validator.stop_ends(), where the robot must stop), nothing is merged across them.
+    # report['sources'] gives, for every optimized command, the index of the last command merged into it
+    rotation = int(lr_factor or 0) * turns_per_rotation
+    stack = []
+    sources = []  # Index of the command of every entry of the stack
+    fence = 0  # The commands below this height of the stack are never merged
+    for number, (direction, steps) in enumerate(commands):
+        steps = int(steps)
+        if direction not in AXIS:  # Stop, or anything unknown, is kept as it is
+            stack.append((direction, steps))
+            sources.append(number)
+            fence = len(stack)
+            continue
+        amount = SIGN[direction] * steps
+        if len(stack) > fence and AXIS[stack[-1][0]] == AXIS[direction]:
+            previous = stack.pop()
+            sources.pop()
+            amount += SIGN[previous[0]] * previous[1]
+        command = _net_command(AXIS[direction], amount, rotation)
+        if command is not None:
+            stack.append(command)
+            sources.append(number)
+        if number in keep:
+            fence = len(stack)
+    time_before = sum(estimate_duration(direction, steps) for direction, steps in commands)
+    time_after = sum(estimate_duration(direction, steps) for direction, steps in stack)
+    report = {
+        'frames_before': len(commands),
+        'frames_after': len(stack),
+        'frames_saved': len(commands) - len(stack),
+        'time_before': time_before,
+        'time_after': time_after,
+        'time_saved': time_before - time_after,
+        'sources': sources,
+    }
+    return stack, report
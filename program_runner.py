@@ -0,0 +1,104 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Program runner
+# -- File       : program_runner.py
+# -- Purpose    : Sends a whole program (an ordered list of movement commands) to the robot with one upload,
+# --              pacing the frames to the execution rate of the robot, with progress, pause and abort.
+# -- Notes      : The next command is sent "lead" seconds before the robot is estimated to finish the previous
+# --              one (see robot_commands.estimate_duration()), so the robot never waits for the radio and the
+# --              frames do not pile up in the robot. The timers use the after() of the Tk window given as
+# --              "scheduler", so everything runs in the Tk thread and never blocks it.
+# --              A ('W', milliseconds) command sends nothing and only delays the next command (used for the timed
+# --              routes of cooperative_planner.py).
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import time
+
+from robot_commands import encode_command, estimate_duration
+
+
+class ProgramRunner:
+    def __init__(self, transport, scheduler, on_progress=None, lead=0.1, clock=time.monotonic):
+        self.transport = transport  # serial_transport.SerialTransport or link_protocol.AckedLink
+        self.scheduler = scheduler  # Tk window (after and after_cancel)
+        self.on_progress = on_progress  # on_progress(commands sent, total commands, state)
+        self.lead = lead
+        self.clock = clock
+        self.commands = []
+        self.index = 0
+        self.state = 'idle'  # idle, running, paused
+        self.next_time = 0.0  # When the next command must be sent
+        self.timer_id = None
+
+    def _schedule(self, seconds):
+        self.timer_id = self.scheduler.after(max(1, int(seconds * 1000)), self._step)
+
+    def _cancel_timer(self):
+        if self.timer_id is not None:
+            self.scheduler.after_cancel(self.timer_id)
+            self.timer_id = None
+
+    def _report(self):
+        if self.on_progress is not None:
+            self.on_progress(self.index, len(self.commands), self.state)
+
+    def start(self, commands):  # commands: list of (direction, factored steps)
+        self.abort()
+        self.commands = list(commands)
+        self.index = 0
+        self.state = 'running'
+        self.next_time = self.clock()
+        self._report()
+        self._step()
+
+    def pause(self):  # The command that is already sent is executed, the next ones wait
+        if self.state == 'running':
+            self._cancel_timer()
+            self.state = 'paused'
+            self._report()
+
+    def resume(self):
+        if self.state == 'paused':
+            self.state = 'running'
+            self.next_time = max(self.next_time, self.clock())
+            self._report()
+            self._step()
+
+    def abort(self):
+        self._cancel_timer()
+        if self.state != 'idle':
+            self.state = 'idle'
+            self._report()
+
+    def _step(self):
+        self.timer_id = None
+        if self.state != 'running':
+            return
+        now = self.clock()
+        if self.index >= len(self.commands):  # Finished when the robot is estimated to finish the last command
+            if now < self.next_time:
+                self._schedule(self.next_time - now)
+                return
+            self.state = 'idle'
+            self._report()
+            return
+        if now < self.next_time - self.lead:
+            self._schedule(self.next_time - self.lead - now)
+            return
+        direction, steps = self.commands[self.index]
+        if direction == 'W':  # Wait, nothing to send
+            self.index += 1
+            self.next_time = max(self.next_time, now) + steps / 1000.0
+            self._report()
+            self._step()
+            return
+        if not self.transport.send(encode_command(direction, steps)):  # Serial queue full, try again shortly
+            self._schedule(0.05)
+            return
+        self.index += 1
+        # The deadlines are added up, so the pacing does not drift with the delays of the Tk timers
+        self.next_time = max(self.next_time, now) + estimate_duration(direction, steps)
+        self._report()
+        self._step()
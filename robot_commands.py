@@ -0,0 +1,34 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Robot movement commands
+# -- File       : robot_commands.py
+# -- Purpose    : Encodes and parses the movement commands that are sent to the mBit Robot through the mBit
+# --              transmitter. A command is a direction letter followed by the number of (factored) steps and
+# --              "\r\n", e.g. "F300\r\n".
+# -- Notes      : F: forward, B: backward, L: turn left, R: turn right, S: stop
+# --              The firmware runs the motors for <steps> milliseconds, so estimate_duration() gives the time the
+# --              robot needs to execute a command (used for pacing the commands to the robot).
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+DIRECTIONS = ('F', 'B', 'L', 'R', 'S')
+COMMAND_OVERHEAD = 0.1  # Seconds for the radio hop and for starting and stopping the motors
+
+
+def encode_command(direction, steps):  # Returns the bytes of the frame, ready to be written to the serial port
+    return (direction + str(steps) + '\r\n').encode('ascii')
+
+
+def parse_command(frame):  # Returns (direction, steps) of a frame, or None if it is not a movement command
+    text = frame.decode('ascii', 'replace') if isinstance(frame, (bytes, bytearray)) else frame
+    text = text.strip()
+    if len(text) < 2 or text[0] not in DIRECTIONS or not text[1:].isdigit():
+        return None
+    return text[0], int(text[1:])
+
+
+def estimate_duration(direction, steps):  # Seconds the robot needs for the command
+    if direction == 'S':
+        return COMMAND_OVERHEAD
+    return int(steps) / 1000.0 + COMMAND_OVERHEAD
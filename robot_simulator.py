@@ -0,0 +1,227 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Virtual mBit Robot simulator
+# -- File       : robot_simulator.py
+# -- Purpose    : Stands in for the mBit transmitter and the mBit Robot, so that SystemController.py can be
+# --              developed and load-tested on any Linux box. It creates a pseudo-terminal, parses the same "F300\r\n"
+# --              frames (and the "#<seq> F300" frames of link_protocol.py, which it acknowledges) and simulates:
+# --                the serial link     : 10 bits per byte at the given baud rate (115200)
+# --                the radio hop       : latency, jitter and loss of the frames (and of the acknowledgements)
+# --                the robot           : executes the commands one after the other, each one for the time of
+# --                                      robot_commands.estimate_duration(), and moves its pose. A stop ('S')
+# --                                      cuts the running command short (the pose moves by the part that ran)
+# --                                      and drops the commands waiting in the robot, like the firmware
+# -- Notes      : Usage: python3 robot_simulator.py [--link /tmp/ttyROBOT] [--loss 0.05] [--latency 0.02]
+# --                                                [--speed 1.0] [--quiet]
+# --              The path of the pseudo-terminal (or the --link symlink to it) is printed first; enter it in the
+# --              first window of SystemController.py ('Raspberry' field). Every executed command is printed as a
+# --              JSON line with its timing and the pose of the robot after it. The simulator can also be used
+# --              from python (RobotSimulator), e.g. by the benchmarks, with pose() and stats().
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Linux / Raspberry Pi OS (pseudo-terminals)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import collections
+import heapq
+import json
+import os
+import random
+import select
+import threading
+import time
+
+from link_protocol import SEQ_MODULO, parse_acked
+from pose_tracker import PoseTracker
+from robot_commands import encode_command, estimate_duration, parse_command
+
+
+class RobotSimulator:
+    def __init__(self, fb_factor=300, lr_factor=300, baud=115200, latency=0.02, jitter=0.01, loss=0.0,
+                 speed=1.0, start=(1.0, 1.0, 90.0), seed=None, on_event=None, clock=time.monotonic):
+        self.baud = baud
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.speed = speed  # >1 executes the commands faster than the real robot
+        self.random = random.Random(seed)
+        self.on_event = on_event  # Called with a dict for every executed command
+        self.clock = clock
+        self.tracker = PoseTracker(fb_factor, lr_factor, start)
+        self.master = None
+        self.slave = None
+        self.events = []  # Heap of (time, order, kind, data)
+        self.order = 0
+        self.robot_queue = collections.deque()  # Commands that reached the robot and wait for it
+        self.busy = False
+        self.current = None  # Running command: (order of its finish event, command, sent, arrived, started, end)
+        self.last_arrival = 0.0  # The radio keeps the order of the packets
+        self.link_free = 0.0  # When the serial link finishes the bytes received so far
+        self.executed_seqs = collections.deque(maxlen=SEQ_MODULO // 2)
+        self.lock = threading.Lock()
+        self.received_frames = 0
+        self.lost_frames = 0
+        self.executed_commands = 0
+        self.stopped_commands = 0  # Cut short or dropped from the queue by a stop
+        self.total_wait = 0.0  # Time the commands waited in the robot until it was free
+        self.running = False
+
+    def open_pty(self, link=None):  # Returns the path that the controller must open
+        import pty
+        import tty
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        path = os.ttyname(self.slave)
+        if link is not None:
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(path, link)
+            path = link
+        return path
+
+    def _schedule(self, when, kind, data):  # Returns the order of the event
+        self.order += 1
+        heapq.heappush(self.events, (when, self.order, kind, data))
+        return self.order
+
+    def _radio(self):  # Returns the delay of the radio hop, or None if the packet is lost
+        if self.random.random() < self.loss:
+            return None
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def receive(self, line, now):  # A line written by the controller, fully received at "now"
+        acked = parse_acked(line)
+        seq = None
+        if acked is not None:
+            seq, line = acked
+        command = parse_command(line)
+        if command is None:
+            return
+        with self.lock:
+            self.received_frames += 1
+        delay = self._radio()
+        if delay is None:
+            with self.lock:
+                self.lost_frames += 1
+            return
+        self.last_arrival = max(self.last_arrival, now + delay)
+        self._schedule(self.last_arrival, 'arrive', (command, seq, now))
+
+    def _arrive(self, command, seq, sent, now):
+        if seq is not None:
+            delay = self._radio()  # The acknowledgement goes back over the radio as well
+            if delay is not None:
+                self._schedule(now + delay, 'ack', seq)
+            if seq in self.executed_seqs:  # Retransmission of a command that was already executed
+                return
+            self.executed_seqs.append(seq)
+        if command[0] == 'S':
+            self._stop(now)
+        self.robot_queue.append((command, sent, now))
+        if not self.busy:
+            self._start_next(now)
+
+    def _start_next(self, now):
+        if not self.robot_queue:
+            self.busy = False
+            self.current = None
+            return
+        self.busy = True
+        command, sent, arrived = self.robot_queue.popleft()
+        duration = estimate_duration(command[0], command[1]) / self.speed
+        with self.lock:
+            self.total_wait += now - arrived
+        order = self._schedule(now + duration, 'finish', (command, sent, arrived, now))
+        self.current = (order, command, sent, arrived, now, now + duration)
+
+    def _stop(self, now):  # Cuts the running command short at "now" and drops the commands waiting in the robot
+        with self.lock:
+            self.stopped_commands += len(self.robot_queue) + (self.current is not None)
+        self.robot_queue.clear()
+        if self.current is None:
+            return
+        order, command, sent, arrived, started, end = self.current
+        part = (now - started) / (end - started) if end > started else 1.0
+        self._finish((command[0], int(command[1] * min(1.0, part))), sent, arrived, started, now, True)
+
+    def _finish(self, command, sent, arrived, started, now, stopped=False):
+        self.tracker.update(encode_command(command[0], command[1]))
+        with self.lock:
+            self.executed_commands += 1
+        if self.on_event is not None:
+            x, y, heading = self.tracker.pose()
+            self.on_event({'command': command[0] + str(command[1]), 'sent': sent, 'arrived': arrived,
+                           'started': started, 'finished': now, 'stopped': stopped, 'x': round(x, 3),
+                           'y': round(y, 3), 'heading': round(heading, 1)})
+        self._start_next(now)
+
+    def process_events(self, now):  # Handles every event that is due, returns the time of the next one or None
+        while self.events and self.events[0][0] <= now:
+            when, order, kind, data = heapq.heappop(self.events)
+            if kind == 'arrive':
+                self._arrive(data[0], data[1], data[2], when)
+            elif kind == 'finish' and self.current is not None and self.current[0] == order:  # Not cut by a stop
+                self._finish(data[0], data[1], data[2], data[3], when)
+            elif kind == 'ack':
+                os.write(self.master, b'A' + str(data).encode('ascii') + b'\r\n')
+        return self.events[0][0] if self.events else None
+
+    def run(self):  # Serves the pseudo-terminal until stop() is called
+        self.running = True
+        received = b''
+        byte_time = 10.0 / self.baud  # Start bit, 8 data bits, stop bit
+        while self.running:
+            next_event = self.process_events(self.clock())
+            timeout = 0.1 if next_event is None else max(0.0, min(0.1, next_event - self.clock()))
+            readable, _, _ = select.select([self.master], [], [], timeout)
+            if not readable:
+                continue
+            data = os.read(self.master, 4096)
+            now = self.clock()
+            self.link_free = max(self.link_free, now)
+            received += data
+            while b'\n' in received:
+                line, _, received = received.partition(b'\n')
+                self.link_free += (len(line) + 1) * byte_time
+                self.receive(line, self.link_free)
+
+    def stop(self):
+        self.running = False
+
+    def pose(self):
+        return self.tracker.pose()
+
+    def stats(self):
+        with self.lock:
+            x, y, heading = self.tracker.pose()
+            return {
+                'received_frames': self.received_frames,
+                'lost_frames': self.lost_frames,
+                'executed_commands': self.executed_commands,
+                'stopped_commands': self.stopped_commands,
+                'mean_wait': self.total_wait / self.executed_commands if self.executed_commands else 0.0,
+                'queued_commands': len(self.robot_queue),
+                'pose': {'x': x, 'y': y, 'heading': heading},
+            }
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Virtual mBit Robot on a pseudo-terminal')
+    parser.add_argument('--link', help='symlink to create to the pseudo-terminal, e.g. /tmp/ttyROBOT')
+    parser.add_argument('--baud', type=int, default=115200)
+    parser.add_argument('--latency', type=float, default=0.02, help='radio latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='radio jitter in seconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='fraction of the radio packets that are lost')
+    parser.add_argument('--speed', type=float, default=1.0, help='execution speed compared to the real robot')
+    parser.add_argument('--fb', type=int, default=300, help='steps for one cell (fb_factor)')
+    parser.add_argument('--lr', type=int, default=300, help='steps for 90 degrees (lr_factor)')
+    parser.add_argument('--quiet', action='store_true', help='do not print the executed commands')
+    args = parser.parse_args()
+    simulator = RobotSimulator(args.fb, args.lr, baud=args.baud, latency=args.latency, jitter=args.jitter,
+                               loss=args.loss, speed=args.speed,
+                               on_event=None if args.quiet else lambda event: print(json.dumps(event), flush=True))
+    print(simulator.open_pty(args.link), flush=True)
+    try:
+        simulator.run()
+    except KeyboardInterrupt:
+        print(json.dumps(simulator.stats()), flush=True)
@@ -0,0 +1,187 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Traffic rule validator
+# -- File       : rule_validator.py
+# -- Purpose    : Checks a movement program of the children against the signs and crossings of the platform map
+# --              before it is sent to the robot, and reports every violation with the step where it happens.
+# -- Notes      : The programs are in user steps, as in the program tab: (direction, steps) where one F/B step
+# --              is one cell and one L/R step is a turn of 90 degrees. The rules are:
+# --                building   : the robot leaves the road (the simulation of that program stops there)
+# --                no_entry   : the robot enters a no-entry cell
+# --                one_way    : the robot moves on a one-way cell against its direction
+# --                stop       : the robot drives through a stop sign without stopping on it
+# --                pedestrian : the robot stops on a pedestrian crossing
+# --              The map is indexed once: every (cell, heading) state gets the next state and the rule bits of
+# --              a move forward and backward, so the simulation only does table lookups. validate_batch() runs
+# --              many submissions in lockstep over the same tables (numpy is not a dependency of the project).
+# --              stop_ends() gives the commands that end on a stop sign, which the optimizer must not merge.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+from platform_map import BUILDING, MOVES, NO_ENTRY, ONE_WAY, PEDESTRIAN_CROSSING, STOP
+
+RULE_BUILDING = 1
+RULE_NO_ENTRY = 2
+RULE_ONE_WAY = 4
+RULE_STOP = 8  # Set on the move into a stop cell, a violation only if the command does not end there
+RULE_PEDESTRIAN = 16  # Set on the move into a pedestrian crossing, a violation only if the command ends there
+
+RULE_NAMES = {RULE_BUILDING: 'building', RULE_NO_ENTRY: 'no_entry', RULE_ONE_WAY: 'one_way',
+              RULE_STOP: 'stop', RULE_PEDESTRIAN: 'pedestrian'}
+RULE_MESSAGES = {
+    'building': 'Βγήκε από τον δρόμο',
+    'no_entry': 'Μπήκε σε απαγορευμένο δρόμο',
+    'one_way': 'Κινήθηκε ανάποδα σε μονόδρομο',
+    'stop': 'Δεν σταμάτησε στο στοπ',
+    'pedestrian': 'Σταμάτησε πάνω στη διάβαση πεζών',
+}
+
+
+class Violation:
+    def __init__(self, command, step, cell, rule):
+        self.command = command  # Index of the command in the program
+        self.step = step  # Index of the cell move (or turn) in the whole program
+        self.cell = cell  # (row, column)
+        self.rule = rule
+
+    def message(self):
+        return ('Εντολή ' + str(self.command + 1) + ', κελί ' + str(self.cell[0]) + ',' + str(self.cell[1]) + ': ' +
+                RULE_MESSAGES[self.rule])
+
+    def __repr__(self):
+        return 'Violation(' + str(self.command) + ', ' + str(self.step) + ', ' + str(self.cell) + ', ' + self.rule + ')'
+
+
+class RuleIndex:
+    def __init__(self, platform_map):
+        self.width = platform_map.width
+        self.height = platform_map.height
+        size = self.width * self.height * 4
+        # For state = (row * width + column) * 4 + heading: next state (-1 if off the road) and rule bits
+        self.forward_next = [-1] * size
+        self.forward_rules = [0] * size
+        self.backward_next = [-1] * size
+        self.backward_rules = [0] * size
+        for row in range(self.height):
+            for column in range(self.width):
+                for heading in range(4):
+                    state = (row * self.width + column) * 4 + heading
+                    for moving, next_table, rule_table in ((heading, self.forward_next, self.forward_rules),
+                                                           ((heading + 2) % 4, self.backward_next,
+                                                            self.backward_rules)):
+                        next_state, rules = self._move(platform_map, row, column, heading, moving)
+                        next_table[state] = next_state
+                        rule_table[state] = rules
+
+    def _move(self, platform_map, row, column, heading, moving):  # moving: the direction the robot moves to
+        rules = 0
+        here = platform_map.cell(row, column)
+        if here in ONE_WAY and ONE_WAY[here] != moving:
+            rules |= RULE_ONE_WAY
+        next_row = row + MOVES[moving][0]
+        next_column = column + MOVES[moving][1]
+        there = platform_map.cell(next_row, next_column)
+        if there == BUILDING or not (0 <= next_row < self.height and 0 <= next_column < self.width):
+            return -1, rules | RULE_BUILDING
+        if there == NO_ENTRY:
+            rules |= RULE_NO_ENTRY
+        elif there in ONE_WAY and ONE_WAY[there] != moving:
+            rules |= RULE_ONE_WAY
+        elif there == STOP:
+            rules |= RULE_STOP
+        elif there == PEDESTRIAN_CROSSING:
+            rules |= RULE_PEDESTRIAN
+        return (next_row * self.width + next_column) * 4 + heading, rules
+
+    def state(self, row, column, heading):
+        return (row * self.width + column) * 4 + heading
+
+    def cell(self, state):
+        return divmod(state // 4, self.width)
+
+
+def expand_program(program):  # One entry per cell move or turn: (kind, index of the command, last of the command)
+    expanded = []
+    for index, (direction, steps) in enumerate(program):
+        for step in range(int(steps)):
+            expanded.append((direction, index, step == int(steps) - 1))
+    return expanded
+
+
+def validate_batch(index, programs, start):  # Returns a list of violations for every program
+    start_state = index.state(*start)
+    expanded = [expand_program(program) for program in programs]
+    states = [start_state] * len(programs)
+    pending = [0] * len(programs)  # Rule bits of the move into the current cell, checked when the command ends
+    results = [[] for program in programs]
+    active = [number for number in range(len(programs)) if expanded[number]]
+    step = 0
+    forward_next = index.forward_next
+    forward_rules = index.forward_rules
+    backward_next = index.backward_next
+    backward_rules = index.backward_rules
+    while active:
+        still_active = []
+        for number in active:
+            direction, command, last = expanded[number][step]
+            state = states[number]
+            if direction == 'L':
+                state = state - state % 4 + (state - 1) % 4
+                rules = 0
+            elif direction == 'R':
+                state = state - state % 4 + (state + 1) % 4
+                rules = 0
+            elif direction in ('F', 'B'):
+                if direction == 'F':
+                    next_state = forward_next[state]
+                    rules = forward_rules[state]
+                else:
+                    next_state = backward_next[state]
+                    rules = backward_rules[state]
+                if next_state < 0:
+                    results[number].append(Violation(command, step, index.cell(state), 'building'))
+                    continue  # The robot cannot continue, this program is finished
+                state = next_state
+            else:
+                rules = 0
+            cell = index.cell(state)
+            for rule in (RULE_NO_ENTRY, RULE_ONE_WAY):
+                if rules & rule:
+                    results[number].append(Violation(command, step, cell, RULE_NAMES[rule]))
+            if pending[number] & RULE_STOP and direction in ('F', 'B'):  # It left the stop cell without stopping
+                results[number].append(Violation(command, step - 1, index.cell(states[number]), 'stop'))
+            pending[number] = rules if direction in ('F', 'B') else 0
+            if last and pending[number] & RULE_PEDESTRIAN:
+                results[number].append(Violation(command, step, cell, 'pedestrian'))
+            if last:
+                pending[number] = 0  # The command ends here, so the robot stopped
+            states[number] = state
+            if step + 1 < len(expanded[number]):
+                still_active.append(number)
+        active = still_active
+        step += 1
+    return results
+
+
+def validate(index, program, start):  # start: (row, column, heading)
+    return validate_batch(index, [program], start)[0]
+
+
+def stop_ends(index, program, start):  # Indices of the commands that end on a stop cell, where the robot must stop
+    state = index.state(*start)
+    ends = []
+    for direction, command, last in expand_program(program):
+        if direction == 'L':
+            state = state - state % 4 + (state - 1) % 4
+        elif direction == 'R':
+            state = state - state % 4 + (state + 1) % 4
+        elif direction in ('F', 'B'):
+            next_state = index.forward_next[state] if direction == 'F' else index.backward_next[state]
+            if next_state < 0:
+                break  # The robot left the road, the rest of the program is not followed
+            rules = index.forward_rules[state] if direction == 'F' else index.backward_rules[state]
+            state = next_state
+            if last and rules & RULE_STOP:
+                ends.append(command)
+    return ends
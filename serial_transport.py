@@ -0,0 +1,163 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Serial transport
+# -- File       : serial_transport.py
+# -- Purpose    : Writes the frames for the mBit transmitter from a background thread, so that no callback of
+# --              the GUI ever blocks on the serial port (e.g. when the transmitter stalls).
+# -- Notes      : The frames are encoded before they are queued (see robot_commands.py). The queue is bounded:
+# --              send() never blocks and returns False when the queue is full. The writer thread takes all the
+# --              frames that are waiting and writes them with a single write() call.
+# --              stats() returns the queue depth and the write latency (from send() until the frame is written),
+# --              the GUI reads it with window.after polling.
+# --              The functions in "listeners" are called with every frame written (e.g. the pose tracker).
+# --              With a telemetry.Telemetry, every frame queued, written or dropped is traced.
+# --              With a "reconnect" function (see port_discovery.make_reconnect()), a failed write does not drop
+# --              the frames: the port is opened again every "retry_interval" seconds until it works, and the
+# --              frames stay queued (send() keeps queueing them until the queue is full).
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import collections
+import threading
+import time
+
+import serial
+
+
+class SerialTransport:
+    def __init__(self, port, max_queue=32, telemetry=None, reconnect=None, retry_interval=0.5):
+        self.port = port  # An open serial.Serial (or any object with write() and close())
+        self.max_queue = max_queue
+        self.frames = collections.deque()  # (frame bytes, time of send())
+        self.condition = threading.Condition()
+        self.running = True
+        self.sent_frames = 0
+        self.dropped_frames = 0
+        self.write_calls = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+        self.error = None  # Text of the last serial error
+        self.listeners = []  # Functions called with every frame written, from the writer thread
+        self.telemetry = telemetry
+        self.reconnect = reconnect  # Returns a new open port, or raises OSError
+        self.retry_interval = retry_interval
+        self.reconnects = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, frame):  # Queues a frame without blocking, returns False if it was dropped
+        with self.condition:
+            if not self.running or len(self.frames) >= self.max_queue:
+                self.dropped_frames += 1
+                if self.telemetry is not None:
+                    self.telemetry.event('serial', 'drop', frame)
+                return False
+            self.frames.append((frame, time.perf_counter()))
+            self.condition.notify()
+        if self.telemetry is not None:
+            self.telemetry.event('serial', 'enqueue', frame)
+        return True
+
+    def discard(self, match):  # Removes the queued frames (not yet written) for which match(frame) is true
+        with self.condition:
+            kept = [(frame, queued) for frame, queued in self.frames if not match(frame)]
+            removed = len(self.frames) - len(kept)
+            self.frames.clear()
+            self.frames.extend(kept)
+            self.dropped_frames += removed
+        if removed and self.telemetry is not None:
+            self.telemetry.event('serial', 'discard', '', removed)
+        return removed
+
+    def is_full(self):
+        return len(self.frames) >= self.max_queue
+
+    def queue_depth(self):
+        return len(self.frames)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'queue_depth': len(self.frames),
+                'sent_frames': self.sent_frames,
+                'dropped_frames': self.dropped_frames,
+                'write_calls': self.write_calls,
+                'last_latency': self.last_latency,
+                'max_latency': self.max_latency,
+                'mean_latency': self.total_latency / self.sent_frames if self.sent_frames else 0.0,
+                'reconnects': self.reconnects,
+                'error': self.error,
+            }
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.frames:
+                    self.condition.wait()
+                if not self.frames:  # Closed and nothing left to write
+                    return
+                batch = list(self.frames)
+                self.frames.clear()
+            try:
+                self.port.write(b''.join(frame for frame, queued in batch))
+            except (serial.SerialException, OSError) as error:
+                with self.condition:
+                    self.error = str(error)
+                    if self.reconnect is None:
+                        self.dropped_frames += len(batch)
+                    else:  # The frames are written to the new port
+                        self.frames.extendleft(reversed(batch))
+                if self.telemetry is not None:
+                    self.telemetry.event('serial', 'error', str(error), len(batch))
+                if self.reconnect is not None and not self._reopen():
+                    return
+                continue
+            now = time.perf_counter()
+            with self.condition:
+                self.write_calls += 1
+                self.error = None
+                for frame, queued in batch:
+                    latency = now - queued
+                    self.sent_frames += 1
+                    self.last_latency = latency
+                    self.total_latency += latency
+                    self.max_latency = max(self.max_latency, latency)
+            for frame, queued in batch:
+                if self.telemetry is not None:
+                    self.telemetry.event('serial', 'write', frame, now - queued)
+                    self.telemetry.observe('enqueue_to_write', now - queued)
+                for listener in self.listeners:
+                    listener(frame)
+
+    def _reopen(self):  # Opens the port again, returns False if the transport was closed meanwhile
+        try:
+            self.port.close()
+        except (serial.SerialException, OSError):
+            pass
+        while True:
+            with self.condition:
+                if not self.running:
+                    return False
+            try:
+                port = self.reconnect()
+            except (serial.SerialException, OSError) as error:
+                with self.condition:
+                    self.error = str(error)
+                time.sleep(self.retry_interval)
+                continue
+            with self.condition:
+                self.port = port
+                self.reconnects += 1
+                self.error = None
+            if self.telemetry is not None:
+                self.telemetry.event('serial', 'reconnect', str(getattr(port, 'port', '')))
+            return True
+
+    def close(self, timeout=1.0):  # Writes what is still queued (for up to "timeout" seconds) and closes the port
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout)
+        self.port.close()
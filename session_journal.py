@@ -0,0 +1,231 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Session journal
+# -- File       : session_journal.py
+# -- Purpose    : Records every frame that goes out to the robot and every light command of SystemController.py
+# --              in a compact binary journal, and replays a recorded session, so that a problem of a lesson can
+# --              be reproduced exactly and real sessions can be used as workloads for the benchmarks.
+# -- Notes      : A journal file starts with a header: b'RJNL', version (1 byte), the time.monotonic_ns() and
+# --              the time.time() of its start (8 bytes each). Every record is:
+# --                delta  : microseconds since the previous record (or the header), 4 bytes
+# --                kind   : 1 byte (1: frame to the robot, 2: light command, 3: gap, 4: frame to a robot of a
+# --                         transmitter pool)
+# --                length : 1 byte, followed by the payload (e.g. b'F300' or b'traffic on', without "\r\n"; for
+# --                         kind 4 the name of the robot in UTF-8, b'\0' and the frame)
+# --              A "gap" record carries the delta (8 bytes) when it does not fit in 4 bytes (more than 71 min).
+# --              A frame takes 10 bytes. The files are only appended to; when a file is larger than "max_bytes"
+# --              a new one is started, and only the last "max_files" files are kept, in "./logs/journal/".
+# --              Usage: python3 session_journal.py info <files>
+# --                     python3 session_journal.py replay <files> (--port /dev/ttyACM0 | --simulator)
+# --                                                       [--fast | --speed 2] [--lights] [--max-gap 5]
+# --              The replay keeps the original timing (or multiplied by --speed), or sends as fast as the serial
+# --              transport takes the frames with --fast. Pauses longer than --max-gap seconds (e.g. between the
+# --              lessons of several files) are shortened to --max-gap. The light commands are sent to the lights
+# --              daemon only with --lights.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any (the --simulator replay needs a pseudo-terminal, Linux / Raspberry Pi OS)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import os
+import struct
+import threading
+import time
+
+JOURNAL_FOLDER = './logs/journal'
+MAGIC = b'RJNL'
+VERSION = 1
+HEADER = struct.Struct('<4sBqd')
+RECORD = struct.Struct('<IBB')
+GAP = struct.Struct('<Q')
+KIND_FRAME = 1
+KIND_LIGHTS = 2
+KIND_GAP = 3
+KIND_ROBOT_FRAME = 4
+MAX_DELTA = 0xFFFFFFFF
+
+
+class SessionJournal:
+    def __init__(self, folder=JOURNAL_FOLDER, max_bytes=1024 * 1024, max_files=20, clock=time.monotonic_ns):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.clock = clock
+        self.lock = threading.Lock()  # Frames come from the writer thread, light commands from the GUI
+        self.file = None
+        self.size = 0
+        self.last = 0  # monotonic_ns of the last record
+        self.records = 0
+
+    def _open(self):
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        name = 'journal-' + time.strftime('%Y%m%d-%H%M%S') + '-' + str(self.records).zfill(9) + '.rjl'
+        self.file = open(os.path.join(self.folder, name), 'ab')
+        self.last = self.clock()
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.last, time.time()))
+        self.size = HEADER.size
+        files = journal_files(self.folder)
+        for old in files[:max(0, len(files) - self.max_files)]:
+            os.remove(old)
+
+    def record(self, kind, payload):  # payload: bytes (a frame, "\r\n" is removed) or text
+        if isinstance(payload, str):
+            payload = payload.encode('ascii', 'replace')
+        payload = payload.strip()[:255]
+        with self.lock:
+            if self.file is None or self.size >= self.max_bytes:
+                if self.file is not None:
+                    self.file.close()
+                self._open()
+            now = self.clock()
+            delta = max(0, now - self.last) // 1000
+            self.last = now
+            if delta > MAX_DELTA:
+                self.file.write(RECORD.pack(0, KIND_GAP, GAP.size) + GAP.pack(delta))
+                self.size += RECORD.size + GAP.size
+                delta = 0
+            self.file.write(RECORD.pack(delta, kind, len(payload)) + payload)
+            self.size += RECORD.size + len(payload)
+            self.records += 1
+
+    def record_frame(self, frame):  # For the "listeners" of the serial transport
+        self.record(KIND_FRAME, frame)
+
+    def record_robot_frame(self, robot, frame):  # For the "frame_listeners" of transmitter_pool.TransmitterPool
+        self.record(KIND_ROBOT_FRAME, robot.encode('utf-8') + b'\0' + frame)
+
+    def record_lights(self, command):  # For the "listeners" of the lights client
+        self.record(KIND_LIGHTS, command)
+
+    def flush(self):  # The records stay in the buffer of the file until here (or until it is full)
+        with self.lock:
+            if self.file is not None:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def journal_files(folder=JOURNAL_FOLDER):  # The journal files of the folder, oldest first
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith('.rjl')]
+
+
+def read_journal(paths):  # Yields (monotonic seconds, kind, payload) of the files, in the given order
+    for path in paths:
+        file_r = open(path, 'rb')
+        data = file_r.read()
+        file_r.close()
+        if len(data) < HEADER.size:
+            continue
+        magic, version, start, wall = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(path + ' is not a session journal')
+        now = start
+        position = HEADER.size
+        while position + RECORD.size <= len(data):
+            delta, kind, length = RECORD.unpack_from(data, position)
+            position += RECORD.size
+            payload = data[position:position + length]
+            position += length
+            if len(payload) < length:  # The last record was cut (the program was killed while writing)
+                break
+            now += delta * 1000
+            if kind == KIND_GAP:
+                now += GAP.unpack(payload)[0] * 1000
+                continue
+            yield now / 1e9, kind, payload
+
+
+def journal_info(paths):
+    records = list(read_journal(paths))
+    info = {'files': len(paths), 'bytes': sum(os.path.getsize(path) for path in paths),
+            'frames': sum(1 for record in records if record[1] in (KIND_FRAME, KIND_ROBOT_FRAME)),
+            'light_commands': sum(1 for record in records if record[1] == KIND_LIGHTS),
+            'seconds': round(records[-1][0] - records[0][0], 3) if records else 0.0}
+    return info
+
+
+def replay(records, transport, lights=None, speed=1.0, fast=False, clock=time.monotonic, max_gap=5.0):
+    # Sends the recorded frames to the transport (and the light commands to the lights client), returns the
+    # number of frames sent and the seconds that the replay took. The frames of a pool go to the same robot of a
+    # TransmitterPool, or all to the one robot of any other transport. A pause longer than "max_gap" seconds
+    # (e.g. between two lessons, or a new file after a reboot, when the monotonic clock started again) is replayed
+    # as "max_gap"
+    sent = 0
+    start = clock()
+    previous = None
+    position = 0.0  # Seconds of the recording replayed so far, with the long pauses cut
+    for when, kind, payload in records:
+        if previous is not None:
+            position += min(max(0.0, when - previous), max_gap)
+        previous = when
+        if not fast:
+            wait = start + position / speed - clock()
+            if wait > 0:
+                time.sleep(wait)
+        if kind in (KIND_FRAME, KIND_ROBOT_FRAME):
+            robot = None
+            if kind == KIND_ROBOT_FRAME:
+                robot, _, payload = payload.partition(b'\0')
+                robot = robot.decode('utf-8', 'replace')
+                if robot not in getattr(transport, 'transports', ()):
+                    robot = None
+            while not (transport.send(payload + b'\r\n', robot) if robot is not None else
+                       transport.send(payload + b'\r\n')):  # The queue is full, wait for the writer
+                time.sleep(0.001)
+            sent += 1
+        elif kind == KIND_LIGHTS and lights is not None:
+            lights.send(payload.decode('ascii', 'replace'))
+    return sent, clock() - start
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description='Session journal of SystemController.py')
+    parser.add_argument('action', choices=['info', 'replay'])
+    parser.add_argument('files', nargs='*', help='journal files, default all of ' + JOURNAL_FOLDER)
+    parser.add_argument('--port', help='serial port of the transmitter mBit')
+    parser.add_argument('--simulator', action='store_true', help='replay to robot_simulator.py')
+    parser.add_argument('--fast', action='store_true', help='send as fast as possible')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed compared to the recording')
+    parser.add_argument('--lights', action='store_true', help='send the light commands to the lights daemon')
+    parser.add_argument('--max-gap', type=float, default=5.0, help='longest pause replayed, in seconds')
+    args = parser.parse_args()
+    files = args.files or journal_files()
+    if not files:
+        parser.error('no journal files')
+    if args.action == 'info':
+        print(json.dumps(journal_info(files)))
+    else:
+        if not args.port and not args.simulator:
+            parser.error('give --port or --simulator')
+        import serial
+        from serial_transport import SerialTransport
+        simulator = None
+        port = args.port
+        if args.simulator:
+            from robot_simulator import RobotSimulator
+            simulator = RobotSimulator(speed=1000.0 if args.fast else args.speed)
+            port = simulator.open_pty()
+            threading.Thread(target=simulator.run, daemon=True).start()
+        transport = SerialTransport(serial.Serial(port=port, baudrate=115200, timeout=2))
+        lights = None
+        if args.lights:
+            from lights_client import LightsClient
+            lights = LightsClient()
+        sent, seconds = replay(read_journal(files), transport, lights, args.speed, args.fast, max_gap=args.max_gap)
+        transport.close(timeout=10)
+        result = {'frames': sent, 'seconds': round(seconds, 3),
+                  'frames_per_second': round(sent / seconds, 1) if seconds else 0.0,
+                  'transport': transport.stats()}
+        if simulator is not None:
+            time.sleep(0.5)  # The last frames cross the simulated radio
+            simulator.stop()
+            result['simulator'] = simulator.stats()
+        print(json.dumps(result))
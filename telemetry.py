@@ -0,0 +1,137 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Telemetry of the commands and the lights
+# -- File       : telemetry.py
+# -- Purpose    : Keeps a trace of what happened to every command (key press, queued, written to the serial port,
+# --              acknowledged or dropped) and to every light action, plus latency histograms of every stage, so
+# --              that "the robot did not listen" can be checked afterwards in the tab 'Διαγνωστικά' or in a dump.
+# -- Notes      : The events go into a ring buffer of fixed size. An append takes its slot from an itertools.count
+# --              (next() on it is atomic in CPython), so the GUI thread and the writer threads never take a lock.
+# --              An event is (number, time, source, kind, detail, value); the time is time.perf_counter() seconds.
+# --              The histograms are log-linear as in HdrHistogram: 16 buckets for every power of two of
+# --              microseconds, so every value is kept with an error below 1/16, from 1 us to hours, in about 600
+# --              counters. A stage can be written by several threads (e.g. "enqueue_to_write" by the writer
+# --              thread of every transmitter of "transmitter_pool.py"), so the histograms are updated under a lock.
+# --              The stages are "press_to_enqueue" (key_coalescer.py), "enqueue_to_write" (serial_transport.py and
+# --              link_protocol.py), "ack_rtt" (link_protocol.py) and "lights" (lights_client.py).
+# --              dump() writes the events and the histograms as JSON in "./logs/".
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import itertools
+import json
+import os
+import threading
+import time
+
+DUMP_FOLDER = './logs'
+SUB_BUCKETS = 16  # Buckets for every power of two, the precision of the histograms
+SUB_BUCKET_BITS = 4
+MAX_BUCKETS = SUB_BUCKETS * 40  # Up to 2^40 us (12 days)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * MAX_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(microseconds):
+        if microseconds < SUB_BUCKETS:
+            return microseconds
+        shift = microseconds.bit_length() - SUB_BUCKET_BITS - 1  # So that microseconds >> shift is 16 - 31
+        return min(MAX_BUCKETS - 1, SUB_BUCKETS * (shift + 1) + (microseconds >> shift) - SUB_BUCKETS)
+
+    @staticmethod
+    def _value(index):  # The middle of the bucket, in seconds
+        if index < SUB_BUCKETS:
+            return index / 1e6
+        shift = index // SUB_BUCKETS - 1
+        low = (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+        return (low + (1 << shift) / 2) / 1e6
+
+    def add(self, seconds):
+        self.counts[self._index(max(0, int(seconds * 1e6)))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):  # In seconds
+        if self.count == 0:
+            return 0.0
+        wanted = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self):  # In milliseconds
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p90_ms': round(self.percentile(90) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class Telemetry:
+    def __init__(self, size=4096, clock=time.perf_counter):
+        self.size = size
+        self.clock = clock
+        self.slots = [None] * size
+        self.counter = itertools.count()
+        self.histograms = {}
+        self.lock = threading.Lock()  # Only for the histograms
+
+    def event(self, source, kind, detail='', value=None):  # detail: text or frame bytes, value: e.g. a latency
+        number = next(self.counter)
+        self.slots[number % self.size] = (number, self.clock(), source, kind, detail, value)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def events(self, limit=None):  # The events still in the buffer, oldest first
+        events = sorted(event for event in list(self.slots) if event is not None)
+        return events[-limit:] if limit else events
+
+    def summary(self):
+        with self.lock:
+            return {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+
+    def dump(self, folder=DUMP_FOLDER):  # Writes everything to a new JSON file and returns its path
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        path = os.path.join(folder, 'telemetry-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+        events = []
+        for number, when, source, kind, detail, value in self.events():
+            if isinstance(detail, bytes):
+                detail = detail.decode('ascii', 'replace').strip()
+            events.append({'number': number, 'time': round(when, 6), 'source': source, 'kind': kind,
+                           'detail': detail, 'value': value})
+        file_w = open(path, 'w')
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'histograms': self.summary(), 'events': events},
+                  file_w, indent=1, ensure_ascii=False)
+        file_w.close()
+        return path
+
+
+def format_event(event, start=0.0):  # One line of text for the diagnostics tab
+    number, when, source, kind, detail, value = event
+    if isinstance(detail, bytes):
+        detail = detail.decode('ascii', 'replace').strip()
+    text = '{:10.3f}  {:<8} {:<8} {}'.format(when - start, source, kind, detail)
+    if value is not None:
+        text += '  ({:.2f} ms)'.format(value * 1000) if isinstance(value, float) else '  (' + str(value) + ')'
+    return text
@@ -0,0 +1,18 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# The platform of the tests: a stop sign at (5,4), one-way streets, pedestrian crossings and the lights at (5,5)
+ROWS = [
+    '###########',
+    '#+...+...+#',
+    '#.###.###.#',
+    '#=###v###.#',
+    '#.###v###=#',
+    '#+..S+<<<+#',
+    '#.###.###.#',
+    '#+...+.X.+#',
+    '###########',
+]
+SIGNAL_CELLS = [(5, 5)]
@@ -0,0 +1,43 @@
+import pytest
+
+from firmware_flash import HexError, flash, read_firmware
+
+
+def record(record_type, address, data):
+    body = bytes((len(data), address >> 8, address & 0xFF, record_type)) + data
+    return ':' + (body + bytes(((-sum(body)) & 0xFF,))).hex().upper()
+
+
+def write_hex(path, lines, newline='\n'):
+    path.write_bytes((newline.join(lines) + newline).encode('ascii'))
+    return str(path)
+
+
+LINES = [record(0x04, 0, b'\x00\x01'), record(0x00, 0x0000, bytes(range(16))), record(0x00, 0x0010, b'\xAA' * 8),
+         record(0x01, 0, b'')]
+
+
+def test_same_hash_for_the_same_firmware(tmp_path):
+    firmware = read_firmware(write_hex(tmp_path / 'robot_v12.4.hex', LINES))
+    assert (firmware['version'], firmware['size'], firmware['records']) == ('12.4', 24, 4)
+    # Other line breaks and one more extended address record, for the same addresses
+    other = [LINES[0], LINES[1], record(0x04, 0, b'\x00\x01'), LINES[2], LINES[3]]
+    assert read_firmware(write_hex(tmp_path / 'other.hex', other, '\r\n'))['hash'] == firmware['hash']
+    broken = LINES[:1] + [LINES[1][:-2] + '00'] + LINES[2:]
+    with pytest.raises(HexError):
+        read_firmware(write_hex(tmp_path / 'broken.hex', broken))
+    with pytest.raises(HexError):
+        read_firmware(write_hex(tmp_path / 'short.hex', LINES[:-1]))
+
+
+def test_boards_with_the_firmware_are_not_written_again(tmp_path):
+    path = write_hex(tmp_path / 'robot_v12.4.hex', LINES)
+    boards = [tmp_path / 'first', tmp_path / 'second']
+    for board in boards:
+        board.mkdir()
+    flashed = str(tmp_path / 'flashed.json')
+    mounts = [str(board) for board in boards]
+    assert flash(path, mounts[:1], flashed_path=flashed) == {mounts[0]: 'flashed'}
+    assert flash(path, mounts, flashed_path=flashed) == {mounts[0]: 'up to date', mounts[1]: 'flashed'}
+    assert flash(path, mounts[:1], force=True, flashed_path=flashed) == {mounts[0]: 'flashed'}
+    assert (boards[1] / 'robot_v12.4.hex').read_bytes() == (tmp_path / 'robot_v12.4.hex').read_bytes()
@@ -0,0 +1,23 @@
+from gpio_pins import MockBackend, PinState
+
+
+def test_only_changed_pins_are_written_per_bank():
+    backend = MockBackend(clock=lambda: 0.0)
+    pins = PinState(backend)
+    pins.setup([17, 18, 27, 40])
+    pins.output([17, 18, 27, 40], [True, False, True, True])
+    assert [write[1:] for write in backend.writes] == [(0, (17, 18, 27), (True, False, True)), (1, (40,), (True,))]
+    pins.output([17, 18, 27, 40], [True, False, False, True])  # Only pin 27 changed
+    assert backend.writes[-1][1:] == (0, (27,), (False,))
+    pins.output(17, 1)
+    assert pins.write_calls == 3 and pins.pin_writes == 5
+
+
+def test_dimmed_pin_goes_back_to_plain_output():
+    backend = MockBackend(clock=lambda: 0.0)
+    pins = PinState(backend)
+    pins.set_duty(25, 1.0)  # Fully on without PWM
+    pins.set_duty(25, 0.3)
+    assert pins.get(25) and pins.duties == {25: 0.3}
+    pins.output(25, True)  # Written again, the PWM left the pin in an unknown state
+    assert pins.duties == {} and backend.writes[-1][1:] == (0, (25,), (True,))
@@ -0,0 +1,44 @@
+import pytest
+
+from green_wave import GreenWave, read_elapsed
+from program_optimizer import optimize
+from traffic_scheduler import DEFAULT_TABLE, parse_intersections
+
+
+def test_rows_of_the_timed_commands():
+    program = [('F', 2), ('L', 1), ('R', 1), ('F', 2), ('F', 4)]  # (5,9) west, through the lights at (5,5)
+    commands = [(direction, steps * (1000 if direction == 'F' else 500)) for direction, steps in program]
+    commands, report = optimize(commands, 500, keep=[0])
+    assert commands == [('F', 2000), ('F', 6000)]
+    assert report['sources'] == [0, 4]
+    green_wave = GreenWave(parse_intersections(DEFAULT_TABLE), 1000, 500)
+    timed, crossings, rows = green_wave.time_release(commands, (5, 9, 3), 9.0, report['sources'])
+    assert crossings and crossings[0][2] > 0  # Red for east/west at 9 s, the robot waits
+    assert timed[1][0] == 'W'
+    assert rows == [0, 4, 4]
+    assert green_wave.time_release(commands, (5, 9, 3), 9.0) == (timed, crossings)
+
+
+def test_wait_for_the_green_of_the_axis():
+    green_wave = GreenWave(parse_intersections(DEFAULT_TABLE), 1000, 500)
+    # Three and a half seconds from (5,9) west to the lights at (5,5), green for east/west in the first 8 s
+    assert green_wave.time_release([('F', 6000)], (5, 9, 3), 0.0) == ([('F', 6000)], [('main', 3.5, 0.0)])
+    # At 8.5 s it would be yellow: wait for the next green at 20 s, plus the margin
+    assert green_wave.time_release([('F', 6000)], (5, 9, 3), 5.0)[0] == [('W', 11700), ('F', 6000)]
+    # North/south is green from 10 s to 18 s
+    assert green_wave.time_release([('F', 6000)], (1, 5, 2), 0.0)[0] == [('W', 6700), ('F', 6000)]
+
+
+class Lights:
+    def __init__(self, answer):
+        self.answer = answer
+
+    def send(self, command):
+        return self.answer
+
+
+def test_elapsed_from_the_daemon():
+    times = iter([10.0, 10.2])
+    assert read_elapsed(Lights('OK elapsed=3.5'), clock=lambda: next(times)) == pytest.approx(3.6)  # Answered half way
+    assert read_elapsed(Lights('OK elapsed=none')) is None
+    assert read_elapsed(Lights(None)) is None
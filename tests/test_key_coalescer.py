@@ -0,0 +1,117 @@
+from key_coalescer import KeyCoalescer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Scheduler:  # Runs the after() timers when the clock is advanced
+    def __init__(self, clock):
+        self.clock = clock
+        self.timers = {}
+        self.ids = 0
+
+    def after(self, milliseconds, function):
+        self.ids += 1
+        self.timers[self.ids] = (self.clock.now + milliseconds / 1000.0, function)
+        return self.ids
+
+    def after_cancel(self, timer_id):
+        self.timers.pop(timer_id, None)
+
+    def advance(self, seconds):
+        end = self.clock.now + seconds
+        while True:
+            due = [(when, timer_id) for timer_id, (when, function) in self.timers.items() if when <= end]
+            if not due:
+                break
+            when, timer_id = min(due)
+            self.clock.now = max(self.clock.now, when)
+            self.timers.pop(timer_id)[1]()
+        self.clock.now = end
+
+
+class Transport:  # Nothing is written, every frame stays queued
+    def __init__(self):
+        self.frames = []
+
+    def send(self, frame):
+        self.frames.append(frame)
+        return True
+
+    def discard(self, match):
+        kept = [frame for frame in self.frames if not match(frame)]
+        removed = len(self.frames) - len(kept)
+        self.frames = kept
+        return removed
+
+    def is_full(self):
+        return False
+
+
+def test_release_stops_the_robot_and_keeps_it_busy():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    transport = Transport()
+    coalescer = KeyCoalescer(transport, scheduler, clock=clock)
+    coalescer.press('F', 500)
+    scheduler.advance(0.2)
+    assert transport.frames == [b'F500\r\n']
+    transport.frames = []  # Written, the robot runs it until 0.75 s
+    for repeat in range(10):  # Auto-repeat of the held key
+        coalescer.press('F', 100)
+        scheduler.advance(0.03)
+    assert transport.frames  # Queued, not written yet
+    coalescer.release('F')
+    scheduler.advance(0.1)
+    assert transport.frames == [b'S0\r\n']
+    assert coalescer.busy_until > clock.now  # The written command is still running
+
+
+def test_max_ahead_counts_the_running_command():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    transport = Transport()
+    coalescer = KeyCoalescer(transport, scheduler, clock=clock)
+    coalescer.press('F', 800)
+    scheduler.advance(0.2)
+    coalescer.press('F', 300)  # 0.7 s still running and 0.4 s more is beyond the 1 s
+    assert coalescer.dropped_presses == 1
+    assert coalescer.pending_direction is None
+
+
+def test_release_keeps_the_frames_of_others():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    transport = Transport()
+    coalescer = KeyCoalescer(transport, scheduler, clock=clock)
+    coalescer.press('F', 500)
+    scheduler.advance(0.2)
+    transport.frames = []  # Written, the robot runs it until 0.75 s
+    for repeat in range(10):
+        coalescer.press('F', 100)
+        scheduler.advance(0.03)
+    program_frame = b'F300\r\n'  # E.g. of the program runner, queued with the same letter
+    transport.send(program_frame)
+    busy_until = coalescer.busy_until
+    coalescer.release('F')
+    scheduler.advance(0.1)
+    assert transport.frames == [program_frame, b'S0\r\n']
+    assert coalescer.busy_until < busy_until  # Only the durations of its own discarded frames
+
+
+def test_button_presses_are_not_held():
+    clock = Clock()
+    scheduler = Scheduler(clock)
+    transport = Transport()
+    coalescer = KeyCoalescer(transport, scheduler, clock=clock)
+    coalescer.press('F', 500, held=False)
+    scheduler.advance(0.2)
+    assert transport.frames == [b'F500\r\n']
+    coalescer.release('F')  # E.g. the cursor of a field moved with the arrow
+    scheduler.advance(0.1)
+    assert transport.frames == [b'F500\r\n']
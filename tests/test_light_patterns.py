@@ -0,0 +1,20 @@
+import pytest
+
+from gpio_pins import MockBackend, PinState
+from light_patterns import PatternEngine, blink, steady
+
+
+def test_patterns_keep_their_deadlines():
+    pins = PinState(MockBackend(clock=lambda: 0.0))
+    engine = PatternEngine(pins, clock=lambda: 0.0)
+    engine.channels[25] = [0.0, blink(0.5, 0.5)]  # What play() does, without the thread
+    engine.channels[24] = [0.0, steady(0.3)]
+    assert engine._step(0.0) == 0.5
+    assert pins.get(25) and pins.duties == {24: 0.3}
+    assert list(engine.channels) == [25]  # The steady pin needs no wakeup
+    assert engine._step(0.6) == pytest.approx(0.4)  # The next deadline is 1.0, not 0.6 + 0.5
+    assert not pins.get(25)
+    assert engine._step(2.2) == pytest.approx(0.3)
+    assert pins.get(25)
+    engine.stop(25)
+    assert engine._step(3.0) is None and not pins.get(25)
@@ -0,0 +1,18 @@
+import time
+
+from light_state import SEQUENCE, LightStateReader, LightStateWriter
+
+
+def test_reader_sees_only_complete_states(tmp_path):
+    path = str(tmp_path / 'lights.state')
+    reader = LightStateReader(path)
+    assert reader.read() is None  # No daemon
+    writer = LightStateWriter(path)
+    writer.publish(True, False, True, 'breathe', [17, 25], [('main', 'κόκκινο', 2, time.monotonic() + 3.0)])
+    state = reader.read()
+    assert state['alive'] and state['lights_mode'] == 'breathe' and state['pins_on'] == [17, 25]
+    assert state['intersections'][0]['phase'] == 'κόκκινο' and 2.5 < state['intersections'][0]['time_left'] <= 3.0
+    SEQUENCE.pack_into(writer.map, 0, writer.sequence + 1)  # The writer stopped half way
+    assert reader.read(attempts=3) is None
+    writer.close(remove=True)
+    assert reader.read() is None
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from lights_client import LightsClient
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def test_commands_over_one_connection():
+    client = LightsClient()
+    if client.is_running():
+        pytest.skip('a lights daemon is already running on port ' + str(client.port))
+    process = subprocess.Popen([sys.executable, 'lights_daemon.py'], cwd=ROOT, stdout=subprocess.DEVNULL,
+                               env=dict(os.environ, GPIO_BACKEND='mock'))
+    try:
+        deadline = time.monotonic() + 10
+        while not client.is_running():
+            assert process.poll() is None and time.monotonic() < deadline, 'the lights daemon did not start'
+            time.sleep(0.05)
+        assert client.send('lights on') == 'OK traffic=0 mode=cycle lights=1 lights_mode=steady'
+        assert client.send('lights mode blink') == 'OK traffic=0 mode=cycle lights=1 lights_mode=blink'
+        assert client.send('traffic on') == 'OK traffic=1 mode=cycle lights=1 lights_mode=blink'
+        assert client.send('traffic schedule').startswith('OK elapsed=')
+        assert client.send('traffic flash').startswith('ERR')
+        assert client.send('all off') == 'OK traffic=0 mode=cycle lights=0 lights_mode=blink'
+        assert client.send('shutdown').startswith('OK')
+        assert process.wait(timeout=5) == 0
+        assert client.send('status') is None  # Ignored without the daemon, as in Windows
+    finally:
+        if process.poll() is None:
+            process.kill()
+        client.close()
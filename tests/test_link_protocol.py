@@ -0,0 +1,37 @@
+import threading
+import time
+
+import serial
+
+from link_protocol import SEQ_MODULO, AckedLink
+from robot_commands import encode_command
+from robot_simulator import RobotSimulator
+
+
+def test_lossy_link_executes_every_frame_once():
+    executed = []
+    simulator = RobotSimulator(latency=0.0, jitter=0.0, loss=0.3, speed=1000.0, seed=1,
+                               on_event=lambda event: executed.append(event['command']))
+    path = simulator.open_pty()
+    thread = threading.Thread(target=simulator.run, daemon=True)
+    thread.start()
+    link = AckedLink(serial.Serial(port=path, baudrate=115200, timeout=2), timeout=0.05, max_retries=30,
+                     max_queue=SEQ_MODULO * 2)
+    frames = SEQ_MODULO + 50  # The sequence numbers wrap around
+    for number in range(1, frames + 1):
+        assert link.send(encode_command('F', number))
+    deadline = time.monotonic() + 30
+    while link.stats()['acked_frames'] + link.stats()['lost_frames'] < frames and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)  # The last commands finish in the robot
+    stats = link.stats()
+    link.close()
+    simulator.stop()
+    thread.join(1)
+    assert stats['acked_frames'] == frames and stats['lost_frames'] == 0
+    assert stats['retransmissions'] > 0
+    assert link.next_seq == frames % SEQ_MODULO
+    # Every command once, although the frames whose acknowledgement was lost arrived again
+    assert sorted(executed, key=lambda command: int(command[1:])) == ['F' + str(number) for number in
+                                                                       range(1, frames + 1)]
+    assert simulator.stats()['received_frames'] > frames
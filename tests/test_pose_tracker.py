@@ -0,0 +1,15 @@
+import pytest
+
+from pose_tracker import PoseTracker
+
+
+def test_pose_and_trail_from_the_frames():
+    tracker = PoseTracker(300, 500, start=(1.0, 1.0, 90.0))  # East
+    for frame in (b'F600\r\n', b'R500\r\n', b'F300\r\n', b'L250\r\n', b'B0\r\n', b'#3 F300\r\n'):
+        tracker.update(frame)
+    assert tracker.pose() == pytest.approx((3.0, 2.0, 135.0))  # Two cells east, one south, turned 45 degrees
+    segments = tracker.take_segments()
+    assert [tuple(round(value, 6) for value in segment) for segment in segments] == [
+        (1.0, 1.0, 3.0, 1.0), (3.0, 1.0, 3.0, 2.0), (3.0, 2.0, 3.0, 2.0)]
+    assert tracker.take_segments() == []  # Only what was not drawn yet
+    assert tracker.moves == 5  # The frame that is not a command is ignored
@@ -0,0 +1,33 @@
+from platform_map import PlatformMap
+from program_optimizer import optimize
+from rule_validator import RuleIndex, stop_ends, validate
+from conftest import ROWS
+
+
+def test_merges_neighbouring_moves():
+    commands, report = optimize([('F', 3000), ('L', 300), ('R', 300), ('F', 2000), ('B', 1000)], 300)
+    assert commands == [('F', 4000)]
+    assert report['frames_saved'] == 4
+
+
+def test_no_merge_through_a_stop_sign():
+    index = RuleIndex(PlatformMap(ROWS))
+    program = [('F', 3), ('F', 1)]  # (5,1) east: the first move ends on the stop cell (5,4)
+    assert validate(index, program, (5, 1, 1)) == []
+    keep = stop_ends(index, program, (5, 1, 1))
+    assert keep == [0]
+    commands, report = optimize([('F', 900), ('F', 300)], 300, keep=keep)
+    assert commands == [('F', 900), ('F', 300)]
+    # A cancelled turn after the stop does not merge the moves around it either
+    commands, report = optimize([('F', 900), ('L', 300), ('R', 300), ('F', 300)], 300, keep=keep)
+    assert commands == [('F', 900), ('F', 300)]
+    assert validate(index, [(direction, steps // 300) for direction, steps in commands], (5, 1, 1)) == []
+
+
+def test_turns_without_lr_factor():
+    # No factor: the turns are summed but not reduced modulo a rotation, instead of a ZeroDivisionError
+    for lr_factor in (0, ''):
+        commands, report = optimize([('R', 300), ('R', 600), ('L', 200), ('F', 0)], lr_factor)
+        assert commands == [('R', 700)]
+        commands, report = optimize([('L', 0), ('R', 0), ('F', 300)], lr_factor)
+        assert commands == [('F', 300)]
@@ -0,0 +1,39 @@
+import pytest
+
+from robot_simulator import RobotSimulator
+
+
+def run_until_idle(simulator, now=0.0):
+    while now is not None:
+        last = now
+        now = simulator.process_events(now)
+    return last
+
+
+def test_commands_run_one_after_the_other():
+    events = []
+    simulator = RobotSimulator(latency=0.02, jitter=0.0, seed=1, on_event=events.append)
+    simulator.receive(b'F300', 0.0)
+    simulator.receive(b'R300', 0.001)
+    simulator.receive(b'X1', 0.002)  # Not a command
+    assert run_until_idle(simulator) == pytest.approx(0.02 + 0.4 + 0.4)
+    assert [event['command'] for event in events] == ['F300', 'R300']
+    assert events[1]['started'] == events[0]['finished']  # R300 waited in the robot
+    stats = simulator.stats()
+    assert stats['executed_commands'] == 2 and stats['received_frames'] == 2
+    assert stats['pose'] == pytest.approx({'x': 2.0, 'y': 1.0, 'heading': 180.0})
+
+
+def test_stop_cuts_the_running_command_short():
+    events = []
+    simulator = RobotSimulator(latency=0.0, jitter=0.0, seed=1, on_event=events.append)
+    simulator.receive(b'F1000', 0.0)  # 1.1 s
+    simulator.receive(b'R300', 0.0)
+    simulator.process_events(0.0)
+    simulator.receive(b'S0', 0.55)  # Released half way
+    run_until_idle(simulator, 0.55)
+    assert [(event['command'], event['stopped']) for event in events] == [('F500', True), ('S0', False)]
+    assert events[1]['finished'] == pytest.approx(0.65)  # Not after the end that F1000 would have had
+    stats = simulator.stats()
+    assert stats['stopped_commands'] == 2 and stats['queued_commands'] == 0
+    assert stats['pose'] == pytest.approx({'x': 1.0 + 500 / 300, 'y': 1.0, 'heading': 90.0})
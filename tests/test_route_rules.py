@@ -0,0 +1,38 @@
+from platform_map import PEDESTRIAN_CROSSING, PlatformMap, RoutePlanner, route_to_moves
+from rule_validator import RuleIndex, validate
+from conftest import ROWS, SIGNAL_CELLS
+
+
+def cost(planner, actions):
+    return round(sum(planner.costs[action] for action in actions), 6)
+
+
+def test_moves_end_on_stop_and_before_lights():
+    platform = PlatformMap(ROWS)
+    index = RuleIndex(platform)
+    assert [violation.rule for violation in validate(index, route_to_moves('FFFFFFFF'), (5, 9, 3))] == ['stop']
+    moves = route_to_moves('FFFFFFFF', (5, 9, 3), platform, SIGNAL_CELLS)
+    assert moves == [('F', 3), ('F', 2), ('F', 3)]
+    assert validate(index, moves, (5, 9, 3)) == []
+
+
+def test_planned_routes_keep_the_rules(tmp_path):
+    platform = PlatformMap(ROWS)
+    index = RuleIndex(platform)
+    planner = RoutePlanner(platform, 1000, 500, cache_path=str(tmp_path / 'route_cache.json'))
+    cells = platform.road_cells()
+    for start_cell in cells:
+        for heading in range(4):
+            start = (start_cell[0], start_cell[1], heading)
+            for goal in cells:
+                if goal == start_cell or platform.cell(*goal) == PEDESTRIAN_CROSSING:
+                    continue  # The robot may not stop on a pedestrian crossing, whatever the route
+                actions = planner.route(start, goal)
+                single = planner.astar(start, goal)  # The 'Διαδρομή' button
+                assert (actions is None) == (single is None)
+                if actions is None:
+                    continue
+                assert cost(planner, single) == cost(planner, actions)
+                for route in (actions, single):
+                    moves = route_to_moves(route, start, platform, SIGNAL_CELLS)
+                    assert validate(index, moves, start) == [], (start, goal, moves)
@@ -0,0 +1,32 @@
+import threading
+import time
+
+from serial_transport import SerialTransport
+
+
+class StalledPort:  # A transmitter that stops reading until "release" is set
+    def __init__(self):
+        self.release = threading.Event()
+        self.writes = []
+
+    def write(self, data):
+        self.release.wait(5)
+        self.writes.append(data)
+
+    def close(self):
+        pass
+
+
+def test_send_never_blocks_on_a_stalled_port():
+    port = StalledPort()
+    transport = SerialTransport(port, max_queue=3)
+    assert transport.send(b'F1\r\n')  # Taken by the writer thread, which now waits in write()
+    while transport.queue_depth():
+        time.sleep(0.001)
+    assert [transport.send(('F' + str(steps) + '\r\n').encode('ascii')) for steps in range(2, 6)] == [
+        True, True, True, False]
+    port.release.set()
+    transport.close(timeout=5)
+    assert port.writes == [b'F1\r\n', b'F2\r\nF3\r\nF4\r\n']  # The waiting frames in one write() call
+    stats = transport.stats()
+    assert (stats['sent_frames'], stats['dropped_frames'], stats['write_calls']) == (4, 1, 2)
@@ -0,0 +1,36 @@
+from session_journal import SessionJournal, journal_files, read_journal, replay
+
+
+class Clock:  # monotonic_ns of a journal
+    def __init__(self, seconds):
+        self.now = int(seconds * 1e9)
+
+    def __call__(self):
+        return self.now
+
+
+class Transport:
+    def __init__(self):
+        self.frames = []
+
+    def send(self, frame):
+        self.frames.append(frame)
+        return True
+
+
+def test_replay_cuts_the_pause_between_sessions(tmp_path):
+    paths = []
+    for lesson, base in enumerate((1000.0, 50.0)):  # The second lesson after a reboot: its monotonic clock is lower
+        folder = str(tmp_path / str(lesson))
+        clock = Clock(base)
+        journal = SessionJournal(folder=folder, clock=clock)
+        journal.record_frame(b'F300\r\n')
+        clock.now += int(0.05 * 1e9)
+        journal.record_frame(b'L300\r\n')
+        journal.close()
+        paths += journal_files(folder)
+    transport = Transport()
+    sent, seconds = replay(read_journal(paths), transport, max_gap=0.1)
+    assert sent == 4
+    assert transport.frames == [b'F300\r\n', b'L300\r\n'] * 2
+    assert seconds < 1.0
@@ -0,0 +1,31 @@
+import pytest
+
+from traffic_scheduler import DEFAULT_TABLE, TrafficScheduler, parse_intersections
+
+
+def two_crossings():
+    table = {'intersections': [dict(DEFAULT_TABLE['intersections'][0]),
+                               dict(DEFAULT_TABLE['intersections'][0], name='second', offset=10,
+                                    pins=[5, 6, 12, 13, 16, 19])]}
+    return parse_intersections(table)
+
+
+def test_deadlines_do_not_drift():
+    writes = []
+    scheduler = TrafficScheduler(two_crossings(), lambda pins, values: writes.append((pins, values)))
+    scheduler.start(100.0)
+    assert [(name, phase) for name, phase, left in scheduler.status(100.0)] == [('main', 'main green'),
+                                                                               ('second', 'main red')]
+    assert len(writes) == 1 and len(writes[0][0]) == 12  # Both crossings in one batched write
+    scheduler.advance(108.3)  # Late by 0.3 s
+    assert [left for name, phase, left in scheduler.status(108.3)] == pytest.approx([1.7, 1.7])
+    scheduler.advance(135.0)  # Suspended for more than one phase
+    assert [phase for name, phase, left in scheduler.status(135.0)] == ['main red', 'main green']
+    assert scheduler.next_deadline() == 138.0  # Still on the grid of the phase durations
+    assert len(writes) == 3
+
+
+def test_phase_must_match_its_pins():
+    table = {'intersections': [dict(DEFAULT_TABLE['intersections'][0], pins=[17, 18])]}
+    with pytest.raises(ValueError):
+        parse_intersections(table)
@@ -0,0 +1,41 @@
+from transmitter_pool import TransmitterPool, read_transmitters
+
+
+class Transport:  # Writes every frame at once
+    def __init__(self):
+        self.listeners = []
+        self.frames = []
+
+    def send(self, frame):
+        self.frames.append(frame)
+        for listener in self.listeners:
+            listener(frame)
+        return True
+
+    def queue_depth(self):
+        return len(self.frames)
+
+
+def test_frames_go_to_their_robot():
+    pool = TransmitterPool([('Άκης', Transport()), ('Ρένα', Transport())])
+    selected = []
+    every = []
+    pool.listeners.append(selected.append)
+    pool.frame_listeners.append(lambda robot, frame: every.append((robot, frame)))
+    pool.send(b'F300\r\n')
+    pool.send(b'L300\r\n', 'Ρένα')
+    assert pool.broadcast(b'S0\r\n') == 2
+    assert pool.transport('Ρένα').frames == [b'L300\r\n', b'S0\r\n']
+    assert selected == [b'F300\r\n', b'S0\r\n']  # Only the frames of the selected robot
+    assert every == [('Άκης', b'F300\r\n'), ('Ρένα', b'L300\r\n'), ('Άκης', b'S0\r\n'), ('Ρένα', b'S0\r\n')]
+
+
+def test_drivers_spread_over_the_robots(tmp_path):
+    path = tmp_path / 'transmitters.dat'
+    path.write_text('# port robot\n/dev/ttyACM0 Άκης\n\n/dev/ttyACM1\n', encoding='utf-8')
+    assert read_transmitters(str(path)) == [('/dev/ttyACM0', 'Άκης'), ('/dev/ttyACM1', '2')]
+    pool = TransmitterPool([('Άκης', Transport()), ('2', Transport())])
+    pool.send(b'F300\r\n')  # 'Άκης' is busier
+    assert [pool.assign(driver) for driver in (1, 2, 3)] == ['2', 'Άκης', '2']
+    pool.release(2)
+    assert pool.assign(4) == 'Άκης' and pool.assign(1) == '2'
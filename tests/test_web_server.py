@@ -0,0 +1,44 @@
+import asyncio
+import struct
+
+from web_server import OPCODE_TEXT, Client, ControlServer, read_frame
+
+
+class Transport:
+    def send(self, frame):
+        return True
+
+    def stats(self):
+        return {'queue_depth': 0, 'error': None}
+
+
+def test_phones_take_turns():
+    server = ControlServer(Transport(), None, 300, 300)
+    for number, moves in ((1, [('F', 300)] * 3), (2, [('L', 300)]), (3, [('B', 300)] * 2)):
+        server.clients[number] = Client(number, None, 2.0, 5, lambda: 0.0)
+        server.clients[number].moves.extend(moves)
+    order = []
+    move = server.next_move()
+    while move is not None:
+        order.append(move[0])
+        move = server.next_move()
+    assert order == ['F', 'L', 'B', 'F', 'B', 'F']
+
+
+def test_token_bucket():
+    client = Client(1, None, 2.0, 3, lambda: 0.0)
+    assert [client.allow(0.0) for count in range(4)] == [True, True, True, False]
+    assert client.allow(0.5) and not client.allow(0.5)  # One more token every half second
+
+
+def test_masked_frame_from_the_phone():
+    payload = b'{"move": "F", "steps": 1}'
+    mask = b'\x01\x02\x03\x04'
+    masked = bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+
+    async def read():
+        stream = asyncio.StreamReader()
+        stream.feed_data(struct.pack('!BB', 0x80 | OPCODE_TEXT, 0x80 | len(payload)) + mask + masked)
+        return await read_frame(stream)
+
+    assert asyncio.run(read()) == (OPCODE_TEXT, payload)
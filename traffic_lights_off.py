@@ -1,23 +1,13 @@
-import RPi.GPIO as GPIO
+from gpio_pins import PinState
+from traffic_scheduler import load_intersections
 import sys
 
-GPIO.setwarnings(False)
-
-# Setup
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(17, GPIO.OUT)  # MAIN RED
-GPIO.setup(18, GPIO.OUT)  # MAIN YELLOW
-GPIO.setup(27, GPIO.OUT)  # MAIN GREEN
-GPIO.setup(22, GPIO.OUT)  # RED
-GPIO.setup(23, GPIO.OUT)  # YELLOW
-GPIO.setup(24, GPIO.OUT)  # GREEN
+# Setup, the pins of every intersection come from "./settings/intersections.json"
+traffic_pins = [pin for intersection in load_intersections() for pin in intersection.pins]
+pins = PinState()
+pins.setup(traffic_pins)
 
 # Turn off all lights
-GPIO.output(17, False)
-GPIO.output(18, False)
-GPIO.output(27, False)
-GPIO.output(22, False)
-GPIO.output(23, False)
-GPIO.output(24, False)
-GPIO.cleanup()
+pins.output(traffic_pins, False)
+pins.cleanup()
 sys.exit(0)
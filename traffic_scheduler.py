@@ -0,0 +1,179 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Traffic lights scheduler
+# -- File       : traffic_scheduler.py
+# -- Purpose    : Runs the traffic lights of any number of intersections in one loop. Every intersection is
+# --              described by a phase table (pins, phases with their pin values and durations, offset), which
+# --              is read from "./settings/intersections.json".
+# -- Notes      : The deadlines of the phases are computed from a monotonic clock by adding the duration of
+# --              each phase to the previous deadline, so the time spent writing the pins is never added to
+# --              the cycle (no timing drift). All pins that change at the same deadline, for all the
+# --              intersections, are written with one batched call.
+# --              An intersection may give its "cell" on the platform map ([row, column]) and, in "green", the
+# --              index of its pin that is the green light for the robots moving on each axis ("NS" or "EW"), so
+# --              that "green_wave.py" can time the robot moves to reach the crossing on green.
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any (the pins are written through the "output" function given to the scheduler)
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import json
+import os
+import threading
+import time
+
+INTERSECTIONS_FILE = './settings/intersections.json'
+
+# Same phases as the original "traffic_lights.py", used when there is no intersections file
+DEFAULT_TABLE = {
+    'intersections': [
+        {
+            'name': 'main',
+            'offset': 0,
+            'cell': [5, 5],
+            'green': {'EW': 2, 'NS': 5},  # MAIN GREEN for the robots moving east/west, GREEN for north/south
+            'pins': [17, 18, 27, 22, 23, 24],  # MAIN RED, MAIN YELLOW, MAIN GREEN, RED, YELLOW, GREEN
+            'flash': [0, 1, 0, 0, 1, 0],  # Pins that blink when the crossing is out of service
+            'phases': [
+                {'name': 'main green', 'duration': 8, 'values': [0, 0, 1, 1, 0, 0]},
+                {'name': 'main yellow', 'duration': 2, 'values': [0, 1, 0, 1, 0, 0]},
+                {'name': 'main red', 'duration': 8, 'values': [1, 0, 0, 0, 0, 1]},
+                {'name': 'main red, yellow', 'duration': 2, 'values': [1, 0, 0, 0, 1, 0]},
+            ],
+        },
+    ],
+}
+
+
+class Phase:
+    def __init__(self, name, duration, values):
+        self.name = name
+        self.duration = float(duration)
+        self.values = [bool(value) for value in values]
+
+
+class Intersection:
+    def __init__(self, name, pins, phases, offset=0.0, flash=None, cell=None, green=None):
+        self.name = name
+        self.pins = list(pins)
+        self.phases = phases
+        self.offset = float(offset)
+        self.flash_pins = [pin for pin, value in zip(self.pins, flash or []) if value]
+        self.cell = tuple(cell) if cell is not None else None
+        self.green = dict(green or {})  # Axis ('NS' or 'EW'): index of the green light in "pins"
+        self.cycle = sum(phase.duration for phase in phases)
+        for phase in phases:
+            if len(phase.values) != len(self.pins):
+                raise ValueError('Phase "' + phase.name + '" of "' + name + '" does not match its pins')
+            if phase.duration <= 0:
+                raise ValueError('Phase "' + phase.name + '" of "' + name + '" must have a positive duration')
+        # Filled by the scheduler
+        self.index = 0
+        self.deadline = 0.0
+
+    def phase_at(self, elapsed):  # Returns (index of the phase, time left in it) "elapsed" seconds after the start
+        position = (elapsed - self.offset) % self.cycle
+        for index, phase in enumerate(self.phases):
+            if position < phase.duration:
+                return index, phase.duration - position
+            position -= phase.duration
+        return 0, self.phases[0].duration
+
+    def green_wait(self, elapsed, axis, hold=0.0):
+        # Seconds from "elapsed" until a robot moving on the axis may enter, with the green lasting at least "hold"
+        # seconds more; 0.0 if the intersection has no green light for the axis
+        if axis not in self.green:
+            return 0.0
+        index, left = self.phase_at(elapsed)
+        start = left - self.phases[index].duration  # Start of the current phase, relative to "elapsed"
+        windows = []  # (from, to) of the green lights in the next two cycles, neighbouring phases merged
+        for count in range(2 * len(self.phases)):
+            phase = self.phases[(index + count) % len(self.phases)]
+            if phase.values[self.green[axis]]:
+                if windows and windows[-1][1] == start:
+                    windows[-1] = (windows[-1][0], start + phase.duration)
+                else:
+                    windows.append((start, start + phase.duration))
+            start += phase.duration
+        for minimum in (hold, 0.0):  # A green shorter than "hold" is still better than none
+            for begin, end in windows:
+                if end - max(begin, 0.0) > minimum:
+                    return max(begin, 0.0)
+        return 0.0
+
+
+def parse_intersections(table):
+    intersections = []
+    for item in table['intersections']:
+        phases = [Phase(phase['name'], phase['duration'], phase['values']) for phase in item['phases']]
+        intersections.append(Intersection(item['name'], item['pins'], phases, item.get('offset', 0),
+                                          item.get('flash'), item.get('cell'), item.get('green')))
+    return intersections
+
+
+def load_intersections(path=INTERSECTIONS_FILE):
+    if not os.path.exists(path):
+        return parse_intersections(DEFAULT_TABLE)
+    with open(path, 'r') as file_r:
+        return parse_intersections(json.load(file_r))
+
+
+class TrafficScheduler:
+    def __init__(self, intersections, output, clock=time.monotonic):
+        self.intersections = intersections
+        self.output = output  # output(pins, values), e.g. GPIO.output for a batched write
+        self.clock = clock
+        self.start_time = None
+        self.lock = threading.Lock()
+
+    def pins(self):
+        return [pin for intersection in self.intersections for pin in intersection.pins]
+
+    def flash_pins(self):
+        return [pin for intersection in self.intersections for pin in intersection.flash_pins]
+
+    def start(self, now=None):  # Puts every intersection in the phase given by its offset
+        self.start_time = self.clock() if now is None else now
+        pins = []
+        values = []
+        with self.lock:
+            for intersection in self.intersections:
+                index, left = intersection.phase_at(0.0)
+                intersection.index = index
+                intersection.deadline = self.start_time + left
+                pins += intersection.pins
+                values += intersection.phases[index].values
+        self.output(pins, values)
+
+    def advance(self, now):  # Moves every intersection whose deadline passed to its next phase
+        pins = []
+        values = []
+        with self.lock:
+            for intersection in self.intersections:
+                if intersection.deadline > now:
+                    continue
+                while intersection.deadline <= now:  # More than one phase if we were late (e.g. suspended)
+                    intersection.index = (intersection.index + 1) % len(intersection.phases)
+                    intersection.deadline += intersection.phases[intersection.index].duration
+                pins += intersection.pins
+                values += intersection.phases[intersection.index].values
+        if pins:
+            self.output(pins, values)
+
+    def elapsed(self, now=None):  # Seconds since start(), the position of every intersection in its cycle
+        return (self.clock() if now is None else now) - self.start_time
+
+    def next_deadline(self):
+        return min(intersection.deadline for intersection in self.intersections)
+
+    def status(self, now=None):  # Returns (name, phase name, time to the next change) for every intersection
+        now = self.clock() if now is None else now
+        with self.lock:
+            return [(intersection.name, intersection.phases[intersection.index].name, intersection.deadline - now)
+                    for intersection in self.intersections]
+
+    def run(self, stop):  # Runs until the threading.Event "stop" is set
+        self.start()
+        while not stop.is_set():
+            if stop.wait(max(0.0, self.next_deadline() - self.clock())):
+                break
+            self.advance(self.clock())
@@ -0,0 +1,136 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Pool of transmitter mBits
+# -- File       : transmitter_pool.py
+# -- Purpose    : Drives several robots at the same time, each one through its own transmitter mBit (its own serial
+# --              port and radio group), so that every robot added to the platform brings its own link instead of
+# --              sharing the bandwidth of one.
+# -- Notes      : The transmitters are listed in "./settings/transmitters.dat", one per line: the serial port and
+# --              the name of the robot (or radio group) of the transmitter, e.g.
+# --                /dev/ttyACM0 Άκης
+# --                /dev/ttyACM1 Ρένα
+# --              Every port has its own transport ("serial_transport.py" or "link_protocol.py") with its own writer
+# --              thread, queue and reconnection, so a stalled or unplugged transmitter never delays the others.
+# --              TransmitterPool has the same methods as SerialTransport; they apply to the selected robot, so the
+# --              tabs of the GUI, the key coalescer and the program runner drive the robot chosen by the user.
+# --              The functions in "listeners" are called with the frames written for the selected robot, those
+# --              in "frame_listeners" with (robot, frame) of the frames written for every robot (e.g. the journal).
+# --              send(frame, robot) sends to any robot, broadcast() to all of them (e.g. a stop).
+# --              assign() spreads the drivers (e.g. the phones of "web_server.py") over the robots: a new driver
+# --              gets the robot with the fewest drivers, then the shortest queue, and keeps it until release().
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Any
+# -- Standard   : Python 3
+# --------------------------------------------------------------------------------------------------------------
+
+import collections
+import os
+import threading
+
+TRANSMITTERS_FILE = './settings/transmitters.dat'
+
+
+def read_transmitters(path=TRANSMITTERS_FILE):  # Returns [(port, robot name)], empty if there is no file
+    if not os.path.exists(path):
+        return []
+    file_r = open(path, 'r', encoding='utf-8')
+    lines = file_r.read().splitlines()
+    file_r.close()
+    transmitters = []
+    for line in lines:
+        words = line.split(None, 1)
+        if not words or words[0].startswith('#'):
+            continue
+        transmitters.append((words[0], words[1].strip() if len(words) > 1 else str(len(transmitters) + 1)))
+    return transmitters
+
+
+class TransmitterPool:
+    def __init__(self, transports):  # transports: [(robot name, transport)], the first robot is selected
+        self.transports = collections.OrderedDict(transports)
+        self.selected = next(iter(self.transports))
+        self.listeners = []  # Functions called with every frame written for the selected robot
+        self.frame_listeners = []  # Functions called with (robot, frame) of every frame written for any robot
+        self.drivers = {}  # driver: robot name, see assign()
+        self.lock = threading.Lock()
+        for robot, transport in self.transports.items():
+            transport.listeners.append(lambda frame, robot=robot: self._written(robot, frame))
+
+    def _written(self, robot, frame):  # Called from the writer thread of the robot's transport
+        for listener in self.frame_listeners:
+            listener(robot, frame)
+        if robot == self.selected:
+            for listener in self.listeners:
+                listener(frame)
+
+    def robots(self):
+        return list(self.transports)
+
+    def select(self, robot):
+        if robot not in self.transports:
+            raise KeyError(robot)
+        self.selected = robot
+
+    def transport(self, robot=None):  # The transport of the robot (of the selected one if None)
+        return self.transports[self.selected if robot is None else robot]
+
+    def send(self, frame, robot=None):
+        return self.transport(robot).send(frame)
+
+    def broadcast(self, frame):  # Returns the number of robots that got the frame queued
+        return sum(1 for transport in self.transports.values() if transport.send(frame))
+
+    def discard(self, match):
+        return self.transport().discard(match)
+
+    def is_full(self):
+        return self.transport().is_full()
+
+    def queue_depth(self):
+        return self.transport().queue_depth()
+
+    def assign(self, driver):  # Returns the robot of the driver, giving it the least busy robot the first time
+        with self.lock:
+            if driver not in self.drivers:
+                counts = collections.Counter(self.drivers.values())
+                self.drivers[driver] = min(self.transports, key=lambda robot: (
+                    counts[robot], self.transports[robot].queue_depth()))
+            return self.drivers[driver]
+
+    def release(self, driver):
+        with self.lock:
+            self.drivers.pop(driver, None)
+
+    def stats(self):  # The stats of the selected robot, with the queue and the error of every robot in "robots"
+        stats = dict(self.transport().stats())
+        stats['robot'] = self.selected
+        stats['robots'] = collections.OrderedDict()
+        for robot, transport in self.transports.items():
+            robot_stats = stats if robot == self.selected else transport.stats()
+            stats['robots'][robot] = {'queue_depth': robot_stats['queue_depth'],
+                                      'sent_frames': robot_stats['sent_frames'], 'error': robot_stats['error']}
+        return stats
+
+    def close(self, timeout=1.0):  # Closes all the transports at the same time, each one waits up to "timeout"
+        threads = [threading.Thread(target=transport.close, args=(timeout,)) for transport in self.transports.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def open_pool(transmitters, acked=False, telemetry=None):  # transmitters: [(port, robot name)]
+    from link_protocol import AckedLink
+    from port_discovery import make_reconnect, open_serial
+    from serial_transport import SerialTransport
+    ports = [port for port, robot in transmitters]
+    link = AckedLink if acked else SerialTransport
+    transports = []
+    try:
+        for port, robot in transmitters:
+            reconnect = make_reconnect(port, exclude=[other for other in ports if other != port])
+            transports.append((robot, link(open_serial(port), telemetry=telemetry, reconnect=reconnect)))
+    except OSError:  # serial.SerialException is an OSError, the ports already opened are closed again
+        for robot, transport in transports:
+            transport.close(timeout=0)
+        raise
+    return TransmitterPool(transports)
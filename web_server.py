@@ -0,0 +1,341 @@
+# --------------------------------------------------------------------------------------------------------------
+# -- Title      : Web control server
+# -- File       : web_server.py
+# -- Purpose    : Lets the children drive the mBit Robot and switch the platform lights from their phones (or any
+# --              browser of the class) at the same time, through one transmitter mBit.
+# -- Notes      : Usage: python3 web_server.py [--http-port 8080] [--port /dev/ttyACM0] [--rate 2] [--burst 5]
+# --              Open http://<address of the Raspberry>:8080/ on the phone. The page ("web_control.html") talks
+# --              to the server over a WebSocket (/ws), with JSON messages:
+# --                {"move": "F", "steps": 1}           a move, in steps of the tab 'Συντελεστές κίνησης'
+# --                {"lights": "traffic on"}             a command of "lights_daemon.py" (on/off/mode only)
+# --              Every phone has its own queue of moves (at most "max_pending") and a token bucket of "rate"
+# --              moves per second with bursts of "burst". The moves are sent to the robot one at a time, when the
+# --              robot is estimated to finish the previous one, taking the phones in turn (round robin), so one
+# --              child cannot keep the robot for itself. The serial transport never waits, so the event loop
+# --              is never blocked by the serial port; the lights daemon is asked from worker threads (the
+# --              LightsClient lets one command at a time use its socket).
+# --              A connection that does not send its whole request within REQUEST_TIMEOUT seconds is closed. A
+# --              WebSocket that sends nothing for PING_INTERVAL seconds gets a ping (the browser answers it by
+# --              itself) and it is closed if nothing comes back for another PING_INTERVAL (e.g. the phone left).
+# --              The status (own queue, robot position, lights, serial queue) is pushed to every phone when it
+# --              changes, so the phones never poll. GET /status returns the same status as JSON.
+# --              With several transmitters in './settings/transmitters.dat' (see "transmitter_pool.py") every
+# --              phone is given the robot with the fewest phones, and every robot has its own turn of moves, so
+# --              each robot added lets more children drive at the same time.
+# --              Only the standard library is used (asyncio, the WebSocket protocol is RFC 6455 text frames).
+# --------------------------------------------------------------------------------------------------------------
+# -- Platform   : Raspberry Pi OS (any OS for the robot alone)
+# -- Standard   : Python 3.7
+# --------------------------------------------------------------------------------------------------------------
+
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import os
+import struct
+import time
+
+from robot_commands import encode_command, estimate_duration
+
+PAGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web_control.html')
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_MESSAGE = 4096
+MAX_BUFFERED = 65536
+REQUEST_TIMEOUT = 10.0  # Seconds to send the request line and the headers
+PING_INTERVAL = 30.0  # Seconds of silence of a WebSocket before it is pinged, and again before it is closed
+LIGHT_COMMANDS = ('traffic on', 'traffic off', 'traffic mode ', 'lights on', 'lights off', 'lights mode ')
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def encode_frame(opcode, payload):  # A frame from the server (not masked)
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_request(reader):  # Returns (request line, {header name: value}) of an HTTP request
+    request = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return request, headers
+
+
+async def read_frame(reader):  # Returns (opcode, payload) of a frame from the client (masked)
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE:
+        raise ValueError('message too long')
+    mask = await reader.readexactly(4) if second & 0x80 else b'\0\0\0\0'
+    payload = bytearray(await reader.readexactly(length))
+    for index in range(length):
+        payload[index] ^= mask[index % 4]
+    return first & 0x0F, bytes(payload)
+
+
+class Client:
+    def __init__(self, number, writer, rate, burst, clock):
+        self.number = number
+        self.writer = writer
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = clock()
+        self.moves = collections.deque()  # (direction, factored steps)
+        self.robot = None  # Name of the robot of the client, with a transmitter_pool.TransmitterPool
+        self.sent = 0
+        self.last_status = None
+
+    def allow(self, now):  # Token bucket: True if the client may queue one more move now
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def send(self, message):
+        self.writer.write(encode_frame(OPCODE_TEXT, json.dumps(message, ensure_ascii=False).encode('utf-8')))
+
+
+class ControlServer:
+    def __init__(self, transport, lights, fb_factor, lr_factor, pose_tracker=None, rate=2.0, burst=5,
+                 max_pending=5, lead=0.1, status_interval=0.25, clock=time.monotonic):
+        self.transport = transport
+        self.lights = lights
+        self.fb_factor = int(fb_factor)
+        self.lr_factor = int(lr_factor)
+        self.pose_tracker = pose_tracker
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        self.lead = lead  # The next move is sent this much before the robot is estimated to finish
+        self.status_interval = status_interval
+        self.clock = clock
+        self.clients = collections.OrderedDict()  # number: Client, the next client to serve is the first
+        self.numbers = 0
+        self.pool = hasattr(transport, 'assign')  # Several transmitters, one robot each
+        self.robots = transport.robots() if self.pool else [None]
+        self.busy_until = dict.fromkeys(self.robots, 0.0)
+        self.lights_status = ''
+        self.page = b''
+        self.moves_waiting = {}  # robot: asyncio.Event, created in the loop
+
+    # ---------------------------------------------------------------- HTTP
+    async def handle(self, reader, writer):
+        try:
+            request, headers = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT)
+            parts = request.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else '/'
+            if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                await self.websocket(reader, writer, headers)
+            elif path == '/':
+                self.respond(writer, '200 OK', 'text/html; charset=utf-8', self.page)
+            elif path == '/status':
+                self.respond(writer, '200 OK', 'application/json', json.dumps(self.status()).encode('utf-8'))
+            else:
+                self.respond(writer, '404 Not Found', 'text/plain', b'Not found')
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def respond(writer, status, content_type, body):
+        writer.write(('HTTP/1.1 ' + status + '\r\nContent-Type: ' + content_type + '\r\nContent-Length: ' +
+                      str(len(body)) + '\r\nConnection: close\r\n\r\n').encode('latin-1') + body)
+
+    # ---------------------------------------------------------------- WebSocket
+    async def websocket(self, reader, writer, headers):
+        accept = base64.b64encode(hashlib.sha1(headers.get('sec-websocket-key', '').encode('latin-1') +
+                                               WEBSOCKET_GUID).digest()).decode('ascii')
+        writer.write(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      'Sec-WebSocket-Accept: ' + accept + '\r\n\r\n').encode('latin-1'))
+        self.numbers += 1
+        client = Client(self.numbers, writer, self.rate, self.burst, self.clock)
+        if self.pool:
+            client.robot = self.transport.assign(client.number)
+        self.clients[client.number] = client
+        self.push(client)
+        try:
+            pinged = False  # A ping was sent and nothing came back yet
+            while True:
+                try:
+                    opcode, payload = await asyncio.wait_for(read_frame(reader), PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    if pinged:
+                        break
+                    pinged = True
+                    writer.write(encode_frame(OPCODE_PING, b''))
+                    await writer.drain()
+                    continue
+                pinged = False
+                if opcode == OPCODE_CLOSE:
+                    writer.write(encode_frame(OPCODE_CLOSE, b''))
+                    break
+                if opcode == OPCODE_PING:
+                    writer.write(encode_frame(OPCODE_PONG, payload))
+                elif opcode == OPCODE_TEXT:
+                    await self.message(client, payload)
+                await writer.drain()
+        finally:
+            del self.clients[client.number]
+            if self.pool:
+                self.transport.release(client.number)
+
+    async def message(self, client, payload):
+        try:
+            message = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            client.send({'error': 'Μη έγκυρο μήνυμα'})
+            return
+        if message.get('move') in ('F', 'B', 'L', 'R'):
+            direction = message['move']
+            steps = message.get('steps', 1)
+            if not isinstance(steps, int) or not 1 <= steps <= 9:
+                client.send({'error': 'Μη έγκυρα βήματα'})
+            elif len(client.moves) >= self.max_pending:
+                client.send({'error': 'Περίμενε, έχεις ήδη ' + str(self.max_pending) + ' κινήσεις στη σειρά'})
+            elif not client.allow(self.clock()):
+                client.send({'error': 'Πιο αργά!'})
+            else:
+                factor = self.fb_factor if direction in ('F', 'B') else self.lr_factor
+                client.moves.append((direction, steps * factor))
+                self.moves_waiting[client.robot].set()
+        elif isinstance(message.get('lights'), str) and message['lights'].startswith(LIGHT_COMMANDS):
+            loop = asyncio.get_event_loop()
+            answer = await loop.run_in_executor(None, self.lights.send, message['lights'])
+            self.lights_status = await loop.run_in_executor(None, self.lights.send, 'status') or ''
+            client.send({'lights_answer': answer or 'Δεν λειτουργούν τα φώτα'})
+        else:
+            client.send({'error': 'Άγνωστη εντολή'})
+        self.push(client)
+
+    # ---------------------------------------------------------------- moves
+    def next_move(self, robot=None):  # Takes the move of the next client of the robot in turn, or returns None
+        for number, client in list(self.clients.items()):
+            if client.robot != robot:
+                continue
+            self.clients.move_to_end(number)  # Served or empty, it goes to the end of the turn
+            if client.moves:
+                client.sent += 1
+                return client.moves.popleft()
+        return None
+
+    async def dispatch(self, robot=None):  # Sends the moves one at a time, paced to the execution of the robot
+        moves_waiting = self.moves_waiting[robot]
+        while True:
+            wait = self.busy_until[robot] - self.lead - self.clock()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            move = self.next_move(robot)
+            if move is None:
+                moves_waiting.clear()
+                await moves_waiting.wait()
+                continue
+            frame = encode_command(move[0], move[1])
+            if not (self.transport.send(frame, robot) if self.pool else self.transport.send(frame)):
+                await asyncio.sleep(0.05)  # The serial queue is full (e.g. reconnecting), try again
+                continue
+            self.busy_until[robot] = max(self.clock(), self.busy_until[robot]) + estimate_duration(move[0], move[1])
+
+    # ---------------------------------------------------------------- status
+    def status(self, client=None):
+        robot = client.robot if client is not None else None
+        stats = self.transport.transport(robot).stats() if self.pool else self.transport.stats()
+        status = {'clients': len(self.clients), 'waiting_moves': sum(len(c.moves) for c in self.clients.values()),
+                  'serial_queue': stats['queue_depth'], 'serial_error': stats['error'], 'lights': self.lights_status}
+        if robot is not None:
+            status['robot'] = robot
+        if self.pose_tracker is not None and robot in (None, getattr(self.transport, 'selected', None)):
+            x, y, heading = self.pose_tracker.pose()
+            status['pose'] = [round(x, 2), round(y, 2), round(heading)]
+        if client is not None:
+            status['my_moves'] = len(client.moves)
+            status['my_sent'] = client.sent
+        return status
+
+    def push(self, client):  # Sends the status to the client if it changed since the last push
+        if client.writer.transport.get_write_buffer_size() > MAX_BUFFERED:  # A slow phone gets fewer updates
+            return
+        status = self.status(client)
+        if status != client.last_status:
+            client.last_status = status
+            client.send({'status': status})
+
+    async def push_status(self):
+        loop = asyncio.get_event_loop()
+        polls = 0
+        while True:
+            await asyncio.sleep(self.status_interval)
+            polls += 1
+            if polls % 8 == 0 and self.clients:  # The lights can also be changed from the GUI or other tools
+                self.lights_status = await loop.run_in_executor(None, self.lights.send, 'status') or ''
+            for client in list(self.clients.values()):
+                self.push(client)
+
+    async def serve(self, host='0.0.0.0', port=8080):
+        page_file = open(PAGE_FILE, 'rb')
+        self.page = page_file.read()
+        page_file.close()
+        server = await asyncio.start_server(self.handle, host, port)
+        for robot in self.robots:
+            self.moves_waiting[robot] = asyncio.Event()
+            asyncio.ensure_future(self.dispatch(robot))
+        asyncio.ensure_future(self.push_status())
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+    from headless_controller import open_transport, read_factor
+    from lights_client import LightsClient
+    from link_protocol import read_protocol_setting
+    from pose_tracker import PoseTracker
+    from transmitter_pool import open_pool, read_transmitters
+    parser = argparse.ArgumentParser(description='Web control of the mBit Robot and the platform lights')
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--port', default=os.environ.get('SC_PORT'),
+                        help='serial port of the transmitter mBit, found automatically if not given')
+    parser.add_argument('--rate', type=float, default=2.0, help='moves per second of every phone')
+    parser.add_argument('--burst', type=int, default=5, help='moves that a phone can send at once')
+    parser.add_argument('--no-daemon', action='store_true', help='do not start the lights daemon')
+    args = parser.parse_args()
+    transmitters = read_transmitters()
+    if len(transmitters) > 1:
+        transport = open_pool(transmitters, read_protocol_setting() == 'acked')
+    else:
+        transport = open_transport(args.port)
+    lights = LightsClient()
+    if not args.no_daemon:
+        lights.ensure_daemon()
+    tracker = PoseTracker(read_factor('fb'), read_factor('lr'))
+    transport.listeners.append(tracker.update)
+    control = ControlServer(transport, lights, read_factor('fb'), read_factor('lr'), tracker, args.rate, args.burst)
+    try:
+        asyncio.get_event_loop().run_until_complete(control.serve(port=args.http_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transport.close(timeout=5)
+        lights.shutdown()